@@ -6,7 +6,8 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 import config
 from config import BOT_TOKEN
 import database
-from database import add_canal, get_canais, remove_canal, add_keyword, get_keywords, remove_keyword, get_config, set_config, is_admin, add_admin, get_admins, remove_admin, get_active_sorteios, create_sorteio, finalize_sorteio, get_negative_keywords, add_negative_keyword, remove_negative_keyword
+from database import get_config
+import database_async as adb
 import os
 import sys
 import asyncio
@@ -27,15 +28,15 @@ async def cmd_start(message: Message):
     user_id = message.from_user.id
     
     # Restrição de Admin
-    if not is_admin(user_id):
+    if not await adb.is_admin(user_id):
         # Primeiro usuário vira admin automaticamente
-        if not get_admins():
-            add_admin(user_id, message.from_user.username)
+        if not await adb.get_admins():
+            await adb.add_admin(user_id, message.from_user.username)
         else:
             return
 
     # Salva o ID do admin no banco de dados para o monitor saber para quem mandar alertas
-    set_config("admin_id", str(user_id))
+    await adb.set_config("admin_id", str(user_id))
     
     msg = await message.answer(
         "🛠️ **Painel Admin**\n\nUse o botão no canto inferior esquerdo para abrir o painel interativo.",
@@ -57,7 +58,7 @@ from aiogram.types import FSInputFile
 
 @dp.message(Command("log"))
 async def cmd_log(message: Message):
-    if not is_admin(message.from_user.id):
+    if not await adb.is_admin(message.from_user.id):
         return
         
     log_path = "bot.log"
@@ -73,12 +74,12 @@ async def cmd_log(message: Message):
 
 @dp.message(Command("enviar"))
 async def cmd_enviar_shortcut(message: Message):
-    if not is_admin(message.from_user.id): return
+    if not await adb.is_admin(message.from_user.id): return
     await start_criar_oferta_msg(message)
 
 @dp.message(Command("seturl"))
 async def set_webapp_url_cmd(message: Message):
-    if not is_admin(message.from_user.id): return
+    if not await adb.is_admin(message.from_user.id): return
     
     parts = message.text.split(" ", 1)
     if len(parts) < 2:
@@ -86,14 +87,13 @@ async def set_webapp_url_cmd(message: Message):
         return
         
     nova_url = parts[1].strip()
-    from database import set_config
-    set_config("webapp_url", nova_url)
+    await adb.set_config("webapp_url", nova_url)
     
     await message.answer(f"✅ URL do WebApp configurada com sucesso para:\n{nova_url}\n\nO botão de menu será atualizado na próxima vez que o bot reiniciar (use `/reiniciar` no Telegram ou reinicie pela SquareCloud).")
 
 @dp.message(Command("reiniciar"))
 async def cmd_reiniciar(message: Message):
-    if not is_admin(message.from_user.id):
+    if not await adb.is_admin(message.from_user.id):
         return
     await message.answer("🔄 **Reiniciando o bot...**\nAguarde alguns instantes para que o sistema o inicie novamente.")
     await asyncio.sleep(1)
@@ -107,6 +107,9 @@ async def cmd_reiniciar(message: Message):
         from monitor import client as userbot
         await userbot.disconnect()
     except: pass
+    from storage import close_storage
+    await close_storage()
+    database.close_pool()
     
     os.execv(sys.executable, ['python'] + sys.argv)
 
@@ -136,7 +139,9 @@ async def start_copiar_post_telegram(message: Message):
             return
             
         tg_msg = telethon_msgs[0]
-        from monitor import base_downloads_path, post_queue, ofertas_pendentes_admin
+        from monitor import base_downloads_path
+        import pending_offers
+        from publish_queue import OfertaPublicacao
         from watermark import apply_watermark
         from links import process_and_replace_links
         from rewriter import reescrever_promocao
@@ -194,8 +199,7 @@ async def start_copiar_post_telegram(message: Message):
             
         await msg_status.delete()
         
-        ofertas_pendentes_admin.append({"texto": texto_final, "media": media_path, "source_url": link})
-        item_id = len(ofertas_pendentes_admin) - 1
+        item_id = await pending_offers.adicionar(OfertaPublicacao(texto_final, media_path, link, origem="aprovacao"))
         
         markup = InlineKeyboardMarkup(inline_keyboard=[
             [
@@ -264,7 +268,7 @@ async def handle_retry_scraping(callback: CallbackQuery):
 # --- CANAIS ---
 @dp.callback_query(F.data == "menu_canais")
 async def menu_canais(callback: CallbackQuery):
-    canais = get_canais()
+    canais = await adb.get_canais()
     texto = "📺 **Canais Monitorados:**\n" + "\n".join([f"- {c}" for c in canais])
     texto += "\n\nPara remover, clique no canal abaixo. Para adicionar, digite o @ ou link do canal no chat agora."
     
@@ -280,14 +284,14 @@ async def menu_canais(callback: CallbackQuery):
 @dp.callback_query(F.data.startswith("delcanal_"))
 async def del_canal(callback: CallbackQuery):
     canal = callback.data.split("_", 1)[1]
-    remove_canal(canal)
+    await adb.remove_canal(canal)
     await callback.answer(f"Canal {canal} removido!")
     await menu_canais(callback) # Atualiza a tela
 
 # --- KEYWORDS ---
 @dp.callback_query(F.data == "menu_keywords")
 async def menu_keywords(callback: CallbackQuery):
-    kws = get_keywords()
+    kws = await adb.get_keywords()
     
     # Se tiver muitas, limita o texto para o Telegram não recusa
     texto_kws = "\n".join([f"- {k}" for k in kws[:100]])
@@ -328,14 +332,14 @@ async def btn_add_kw(callback: CallbackQuery):
 @dp.callback_query(F.data.startswith("delkw_"))
 async def del_kw(callback: CallbackQuery):
     kw = callback.data.split("_", 1)[1]
-    remove_keyword(kw)
+    await adb.remove_keyword(kw)
     await callback.answer(f"Keyword '{kw}' removida!")
     await menu_keywords(callback) 
 
 # --- NEGATIVE KEYWORDS ---
 @dp.callback_query(F.data == "menu_neg_keywords")
 async def menu_neg_keywords(callback: CallbackQuery):
-    kws = get_negative_keywords()
+    kws = await adb.get_negative_keywords()
     
     texto_kws = "\n".join([f"- {k}" for k in kws[:100]])
     if len(kws) > 100:
@@ -374,7 +378,7 @@ async def btn_add_nkw(callback: CallbackQuery):
 @dp.callback_query(F.data.startswith("delnkw_"))
 async def del_nkw(callback: CallbackQuery):
     kw = callback.data.split("_", 1)[1]
-    remove_negative_keyword(kw)
+    await adb.remove_negative_keyword(kw)
     await callback.answer(f"Keyword '{kw}' removida!")
     await menu_neg_keywords(callback) 
 
@@ -385,12 +389,12 @@ async def handle_text(message: Message):
         user_id = message.from_user.id
         
         # Restrição de Admin
-        if not is_admin(user_id):
+        if not await adb.is_admin(user_id):
             return
         
         # Salva o primeiro admin se a lista for vazia
-        if not get_admins():
-            add_admin(user_id, message.from_user.username)
+        if not await adb.get_admins():
+            await adb.add_admin(user_id, message.from_user.username)
 
         estado = user_states.get(user_id)
         
@@ -411,7 +415,7 @@ async def handle_text(message: Message):
 
     if estado == "esperando_canal":
         canal = message.text.strip().replace("@", "")
-        if add_canal(canal):
+        if await adb.add_canal(canal):
             await message.answer(f"✅ Canal `{canal}` adicionado à lista de monitoramento!")
         else:
             await message.answer("⚠️ Este canal já está sendo monitorado.")
@@ -419,14 +423,13 @@ async def handle_text(message: Message):
             
     elif estado == "esperando_edicao_texto":
         item_id = user_temp_data.get(message.from_user.id, {}).get("edit_item_id")
-        from monitor import ofertas_pendentes_admin
+        import pending_offers
         
-        if item_id is not None and 0 <= item_id < len(ofertas_pendentes_admin):
-            ofertas_pendentes_admin[item_id]["texto"] = message.text
+        oferta = await pending_offers.editar_texto(item_id, message.text) if item_id is not None else None
+        if oferta:
             user_states[message.from_user.id] = None
             await message.answer("✅ Texto atualizado! Gerando nova prévia...")
             
-            oferta = ofertas_pendentes_admin[item_id]
             markup = InlineKeyboardMarkup(inline_keyboard=[
                 [
                     InlineKeyboardButton(text="✅ Postar", callback_data=f"aprovar_{item_id}"),
@@ -437,8 +440,8 @@ async def handle_text(message: Message):
             msg_amostra = f"**PRÉVIA ATUALIZADA:**\n\n{message.text}"
             
             from aiogram.types import FSInputFile
-            if oferta["media"]:
-                photo = FSInputFile(oferta["media"])
+            if oferta.media_path:
+                photo = FSInputFile(oferta.media_path)
                 await message.answer_photo(photo=photo, caption=msg_amostra, reply_markup=markup, parse_mode="HTML")
             else:
                 await message.answer(text=msg_amostra, reply_markup=markup, parse_mode="HTML", disable_web_page_preview=True)
@@ -451,7 +454,7 @@ async def handle_text(message: Message):
         adicionadas = []
         ja_existem = []
         for kw in kws:
-            if add_keyword(kw):
+            if await adb.add_keyword(kw):
                 adicionadas.append(kw)
             else:
                 ja_existem.append(kw)
@@ -490,7 +493,7 @@ async def handle_text(message: Message):
 
     elif estado == "esperando_busca_kw":
         busca = message.text.strip().lower()
-        kws = get_keywords()
+        kws = await adb.get_keywords()
         resultados = [k for k in kws if busca in k.lower()]
         
         if resultados:
@@ -516,7 +519,7 @@ async def handle_text(message: Message):
         adicionadas = []
         ja_existem = []
         for kw in kws:
-            if add_negative_keyword(kw):
+            if await adb.add_negative_keyword(kw):
                 adicionadas.append(kw)
             else:
                 ja_existem.append(kw)
@@ -548,7 +551,7 @@ async def handle_text(message: Message):
 
     elif estado == "esperando_busca_nkw":
         busca = message.text.strip().lower()
-        kws = get_negative_keywords()
+        kws = await adb.get_negative_keywords()
         resultados = [k for k in kws if busca in k.lower()]
         
         if resultados:
@@ -572,7 +575,7 @@ async def handle_text(message: Message):
     elif estado == "esperando_preco":
         try:
             val = float(message.text.replace(',','.'))
-            set_config("preco_minimo", str(val))
+            await adb.set_config("preco_minimo", str(val))
             await message.answer(f"✅ Preço mínimo configurado para R$ {val:.2f}")
         except:
             await message.answer("❌ Valor inválido.")
@@ -580,10 +583,10 @@ async def handle_text(message: Message):
 
     elif estado == "esperando_assinatura":
         if message.text.strip().upper() == "LIMPAR":
-            set_config("assinatura", "")
+            await adb.set_config("assinatura", "")
             await message.answer("✅ Assinatura removida.")
         else:
-            set_config("assinatura", message.text)
+            await adb.set_config("assinatura", message.text)
             await message.answer("✅ Nova assinatura configurada!")
         user_states[message.from_user.id] = None
 
@@ -659,7 +662,7 @@ async def handle_text(message: Message):
     elif estado == "esperando_admin_id":
         try:
             new_uid = int(message.text.strip())
-            if add_admin(new_uid):
+            if await adb.add_admin(new_uid):
                 await message.answer(f"✅ Usuário `{new_uid}` adicionado!")
             else:
                 await message.answer("⚠️ Este usuário já é Admin.")
@@ -669,7 +672,7 @@ async def handle_text(message: Message):
         
     elif estado == "esperando_premio_sorteio":
         premio = message.text.strip()
-        create_sorteio(premio)
+        await adb.create_sorteio(premio)
         await message.answer(f"✅ Sorteio de '{premio}' criado!")
         user_states[message.from_user.id] = None
         
@@ -682,7 +685,7 @@ async def finalizar_criacao_manual(event_message: Message, user_id: int, modo_ai
     msg = await event_message.answer("✨ Processando oferta...")
     from rewriter import gerar_promocao_por_link
     from links import process_and_replace_links
-    from monitor import post_queue
+    from publish_queue import enqueue, OfertaPublicacao
     from watermark import apply_watermark
     
     try:
@@ -716,7 +719,7 @@ async def finalizar_criacao_manual(event_message: Message, user_id: int, modo_ai
         img_path = data.get("local_image_path")
         if img_path: img_path = apply_watermark(img_path)
             
-        await post_queue.put((clean_text, img_path, None))
+        await enqueue(OfertaPublicacao(clean_text, img_path, origem="manual"))
         await msg.delete()
         await event_message.answer("✅ **Oferta Criada com Sucesso!**")
     except Exception as e:
@@ -761,18 +764,15 @@ async def handle_text_mode(callback: CallbackQuery):
 
 @dp.callback_query(F.data.startswith("aprovar_") | F.data.startswith("recusar_") | F.data.startswith("editar_"))
 async def tratar_aprovacao_manual(callback: CallbackQuery):
-    from monitor import post_queue, ofertas_pendentes_admin
+    import pending_offers
+    from publish_queue import enqueue
     parts = callback.data.split("_")
     acao = parts[0]
     item_id = int(parts[1])
     
-    if item_id < 0 or item_id >= len(ofertas_pendentes_admin):
-        await callback.answer("⚠️ Oferta não encontrada.")
-        return
-        
-    oferta = ofertas_pendentes_admin[item_id]
+    oferta = await pending_offers.obter(item_id)
     if not oferta:
-        await callback.answer("⚠️ Já processada.")
+        await callback.answer("⚠️ Oferta não encontrada, expirada ou já processada.")
         return
 
     if acao == "editar":
@@ -782,17 +782,18 @@ async def tratar_aprovacao_manual(callback: CallbackQuery):
         await callback.message.answer("✍️ Envie o novo texto completo:")
         await callback.answer()
     elif acao == "aprovar":
+        # retirar() é atômico: um segundo clique em "Postar" não publica de novo
+        oferta = await pending_offers.retirar(item_id)
+        if not oferta:
+            await callback.answer("⚠️ Já processada.")
+            return
         await callback.answer("✅ Aprovada!")
-        await post_queue.put((oferta["texto"], oferta["media"], None, oferta.get("source_url")))
+        await enqueue(oferta)
         await callback.message.edit_caption(caption="✅ **APROVADA**", reply_markup=None)
-        ofertas_pendentes_admin[item_id] = None
     else:
+        await pending_offers.descartar(item_id)
         await callback.answer("❌ Recusada!")
         await callback.message.edit_caption(caption="❌ **RECUSADA**", reply_markup=None)
-        if oferta["media"] and os.path.exists(oferta["media"]):
-            try: os.remove(oferta["media"])
-            except: pass
-        ofertas_pendentes_admin[item_id] = None
 
 from aiogram.types.error_event import ErrorEvent
 import traceback
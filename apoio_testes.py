@@ -0,0 +1,39 @@
+"""
+Apoio dos test_*.py: banco (e diretório) temporário criado dentro de cada teste.
+
+Nada aqui roda na importação: o teste abre o banco_temporario quando começa e, ao sair,
+a pasta é apagada e o database.DB_PATH e o diretório atual voltam ao que eram (o pytest roda
+tudo num processo só).
+O estado em memória do database.py que não é separado por banco (cliques ainda não gravados,
+cache de links curtos e bloco de códigos reservado) é zerado na entrada e na saída.
+"""
+import contextlib
+import os
+import tempfile
+
+import database
+
+def _zerar_memoria():
+    database.take_pending_clicks()
+    with database._short_url_cache_lock:
+        database._short_url_cache.clear()
+    database._short_code_block.update(proximo=0, fim=0, path=None)
+
+@contextlib.contextmanager
+def banco_temporario(mudar_diretorio: bool = False):
+    """Aponta o database.py para um banco novo numa pasta temporária e devolve a pasta (apagada no fim)."""
+    db_anterior, dir_anterior = database.DB_PATH, os.getcwd()
+    with tempfile.TemporaryDirectory() as pasta:
+        _zerar_memoria()
+        database.DB_PATH = os.path.join(pasta, "teste.db")
+        database.init_db()
+        if mudar_diretorio:
+            os.chdir(pasta)  # Para os módulos que gravam em caminhos relativos (static/uploads, downloads)
+        try:
+            yield pasta
+        finally:
+            _zerar_memoria()
+            os.chdir(dir_anterior)
+            # Fecha as conexões do pool antes de a pasta (banco e arquivos do WAL) ser apagada
+            database.close_pool()
+            database.DB_PATH = db_anterior
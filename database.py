@@ -1,15 +1,144 @@
 import sqlite3
+import os
 import time
-import random
+import calendar
+import hashlib
+import base64
+import json
 import string
+import queue
+import atexit
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from typing import Optional
 
 DB_PATH = "bot_data.db"
 
+# --- CAMADA DE CONEXÃO (POOL + WAL) ---
+# As conexões são reaproveitadas entre chamadas em vez de abrir/fechar o arquivo a cada
+# helper. Como cada conexão vive bastante, o cache interno de statements do sqlite3
+# (cached_statements) passa a valer: as queries fixas abaixo são preparadas uma vez só.
+# O modo WAL permite que o bot e o dashboard leiam enquanto outro escreve.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = 5000
+
+class _PooledConnection(sqlite3.Connection):
+    """Conexão que lembra de qual arquivo veio (para descartar se o DB_PATH mudar)."""
+    db_path = None
+
+_pool = queue.LifoQueue()
+_pool_lock = threading.Lock()
+
+def _new_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=256,
+        factory=_PooledConnection,
+    )
+    conn.db_path = DB_PATH
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")      # Seguro com WAL e bem mais rápido que FULL
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA cache_size=-8000")        # ~8 MB de cache de páginas por conexão
+    conn.execute("PRAGMA mmap_size=67108864")      # 64 MB de leitura via mmap
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def _acquire() -> sqlite3.Connection:
+    while True:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            return _new_connection()
+        if conn.db_path == DB_PATH:
+            return conn
+        conn.close()
+
+def _release(conn: sqlite3.Connection):
+    with _pool_lock:
+        if conn.db_path == DB_PATH and _pool.qsize() < DB_POOL_SIZE:
+            _pool.put_nowait(conn)
+            return
+    conn.close()
+
+@contextmanager
+def get_connection():
+    """
+    Empresta uma conexão do pool (thread-safe).
+    Faz commit ao sair do bloco, ou rollback se ocorrer alguma exceção.
+    """
+    conn = _acquire()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _release(conn)
+
+def close_pool():
+    """Fecha as conexões ociosas (chamar antes de reiniciar/encerrar o processo)."""
+    while True:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            break
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+atexit.register(close_pool)
+
+# --- MIGRAÇÕES DE SCHEMA ---
+# A versão do schema fica no próprio arquivo (PRAGMA user_version). Cada migração roda uma
+# única vez, em ordem e numa transação própria; no startup só as pendentes são aplicadas.
+# Para mudar o schema: acrescente uma função no fim de MIGRATIONS (nunca edite as antigas).
+# As migrações usam IF NOT EXISTS / _add_column_if_missing para aceitar bancos criados
+# antes do versionamento (user_version 0 com as tabelas antigas já existentes).
+_schema_pronto_path = None
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
+    global _schema_pronto_path, _posts_fts_disponivel
+    if _schema_pronto_path == DB_PATH:
+        return  # Já inicializado neste processo (o main.py chama de novo depois do import)
+    with get_connection() as conn:
+        aplicadas = _migrate(conn)
+        _seed_defaults(conn)
+        _posts_fts_disponivel = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'posts_fts'").fetchone() is not None
+    if aplicadas:
+        print(f"🗄️ Banco migrado para a versão {len(MIGRATIONS)} ({aplicadas} migração(ões) aplicada(s)).")
+    _schema_pronto_path = DB_PATH
+    invalidate_config_cache()
+    # Já deixa o cache de config carregado para as leituras não tocarem o disco depois
+    _get_config_cache()
+
+def _migrate(conn: sqlite3.Connection) -> int:
+    """Aplica as migrações com número maior que o user_version do banco. Retorna quantas rodaram."""
+    versao = conn.execute("PRAGMA user_version").fetchone()[0]
+    aplicadas = 0
+    for numero, migracao in enumerate(MIGRATIONS[versao:], start=versao + 1):
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= numero:
+                conn.commit()  # Outro processo aplicou enquanto esperávamos o lock
+                continue
+            migracao(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {numero}")
+            conn.commit()
+            aplicadas += 1
+        except Exception:
+            conn.rollback()
+            print(f"❌ Falha na migração {numero} ({migracao.__name__})")
+            raise
+    return aplicadas
+
+def _migration_001_base(c):
     # Tabela para canais que o Userbot vai monitorar
     c.execute('''
         CREATE TABLE IF NOT EXISTS canais (
@@ -41,10 +170,8 @@ def init_db():
             valor TEXT NOT NULL
         )
     ''')
-    
-    # --- NOVAS TABELAS ---
 
-    # Tabela de Histórico para Deduplicação (Cooldown 60 min)
+    # Tabela de Histórico para Deduplicação (janela = cooldown_minutos)
     c.execute('''
         CREATE TABLE IF NOT EXISTS history (
             hash_id TEXT PRIMARY KEY,
@@ -94,7 +221,192 @@ def init_db():
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    
+
+def _migration_002_history_index(c):
+    # Índice para a expiração em faixa (DELETE ... WHERE posted_at < ?)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_history_posted_at ON history(posted_at)")
+
+def _migration_003_short_links(c):
+    # Hash da URL longa para reaproveitar o código quando o mesmo link é encurtado de novo
+    _add_column_if_missing(c, "short_links", "long_url_hash", "TEXT")
+    pendentes = c.execute("SELECT id, long_url FROM short_links WHERE long_url_hash IS NULL").fetchall()
+    if pendentes:
+        c.executemany("UPDATE short_links SET long_url_hash = ? WHERE id = ?",
+                      [(_long_url_hash(url), row_id) for row_id, url in pendentes])
+    c.execute("CREATE INDEX IF NOT EXISTS idx_short_links_long_url_hash ON short_links(long_url_hash)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_short_links_created_at ON short_links(created_at)")
+
+    # Contadores persistentes (ex: sequência dos códigos do encurtador)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS counters (
+            nome TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL
+        )
+    ''')
+
+def _migration_004_click_rollups(c):
+    # Log de cliques (só cresce) + agregados por hora/dia, que são o que o dashboard lê
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS click_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            short_code TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            ua_class TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS clicks_hourly (
+            hora INTEGER NOT NULL,
+            short_code TEXT NOT NULL,
+            loja TEXT NOT NULL,
+            clicks INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hora, short_code)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS clicks_daily (
+            dia TEXT NOT NULL,
+            short_code TEXT NOT NULL,
+            loja TEXT NOT NULL,
+            clicks INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, short_code)
+        )
+    ''')
+    # Cliques antigos (só existia o contador) entram uma única vez no agregado diário do dia de criação
+    if not c.execute("SELECT 1 FROM counters WHERE nome = 'click_rollup_seed'").fetchone():
+        legado = c.execute("SELECT short_code, long_url, date(created_at), clicks FROM short_links WHERE clicks > 0").fetchall()
+        c.executemany(
+            "INSERT INTO clicks_daily (dia, short_code, loja, clicks) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(dia, short_code) DO UPDATE SET clicks = clicks + excluded.clicks",
+            [(dia or _utc_day(time.time()), code, _loja_da_url(url), clicks) for code, url, dia, clicks in legado]
+        )
+        c.execute("INSERT INTO counters (nome, valor) VALUES ('click_rollup_seed', 1)")
+
+def _migration_005_posts_fts(c):
+    # Busca de posts: índice FTS5 sobre posts.title (sem acento e sem caixa), mantido por triggers.
+    # Se o SQLite não tiver FTS5 a migração passa sem ele e get_posts usa o LIKE antigo.
+    try:
+        c.execute("SAVEPOINT posts_fts")
+        existia = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'posts_fts'").fetchone()
+        c.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+                title, content='posts', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON posts BEGIN
+                INSERT INTO posts_fts(rowid, title) VALUES (new.id, new.title);
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON posts BEGIN
+                INSERT INTO posts_fts(posts_fts, rowid, title) VALUES ('delete', old.id, old.title);
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF title ON posts BEGIN
+                INSERT INTO posts_fts(posts_fts, rowid, title) VALUES ('delete', old.id, old.title);
+                INSERT INTO posts_fts(rowid, title) VALUES (new.id, new.title);
+            END
+        ''')
+        if not existia:
+            # Indexa os posts que já existiam antes do FTS
+            c.execute("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
+        c.execute("RELEASE posts_fts")
+    except sqlite3.OperationalError as e:
+        c.execute("ROLLBACK TO posts_fts")
+        c.execute("RELEASE posts_fts")
+        print(f"⚠️ FTS5 indisponível, busca de posts usará LIKE: {e}")
+
+def _migration_006_posts_indexes(c):
+    # Cliques denormalizados no post (atualizados pelo flush_clicks) para ordenar/paginar por índice
+    if "clicks" not in [row[1] for row in c.execute("PRAGMA table_info(posts)").fetchall()]:
+        c.execute("ALTER TABLE posts ADD COLUMN clicks INTEGER NOT NULL DEFAULT 0")
+        c.execute("UPDATE posts SET clicks = COALESCE((SELECT sl.clicks FROM short_links sl WHERE sl.short_code = posts.short_code), 0)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_posts_short_code ON posts(short_code)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_posts_recent ON posts(created_at DESC, id DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_posts_clicked ON posts(clicks DESC, id DESC)")
+
+def _migration_007_publish_jobs(c):
+    # Fila persistente de publicação (sobrevive a reinícios/redeploys)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS publish_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pendente', -- 'pendente', 'processando', 'concluido', 'falhou'
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            disponivel_em INTEGER NOT NULL,
+            target_url TEXT,
+            erro TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_publish_jobs_fila ON publish_jobs(status, disponivel_em, id)")
+
+def _migration_008_pending_offers(c):
+    # Ofertas aguardando aprovação manual (os botões usam o id, que sobrevive a reinícios)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS pending_offers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payload TEXT NOT NULL,
+            expira_em INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_pending_offers_expira_em ON pending_offers(expira_em)")
+
+def _migration_009_channel_watermarks(c):
+    # Último ID de mensagem processado em cada canal monitorado (recuperação depois de quedas/reinícios)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS channel_watermarks (
+            chat_id INTEGER PRIMARY KEY,
+            ultimo_msg_id INTEGER NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _migration_010_telegram_entities(c):
+    # Canais/grupos já resolvidos pelo userbot (ID, access_hash, participação): o startup não resolve tudo de novo
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS telegram_entities (
+            peer_id INTEGER PRIMARY KEY,
+            access_hash INTEGER,
+            nome TEXT,              -- Como está na tabela canais (normalizado, minúsculo); NULL se veio só dos diálogos
+            titulo TEXT,
+            username TEXT,
+            tipo TEXT,              -- 'canal' ou 'grupo'
+            membro INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_telegram_entities_nome ON telegram_entities(nome)")
+
+def _migration_011_posts_clicks_resync(c):
+    # Posts criados com um link curto reaproveitado começavam em 0 cliques (ver add_post)
+    c.execute("""
+        UPDATE posts SET clicks = (SELECT sl.clicks FROM short_links sl WHERE sl.short_code = posts.short_code)
+        WHERE short_code IN (SELECT short_code FROM short_links)
+    """)
+
+MIGRATIONS = [
+    _migration_001_base,
+    _migration_002_history_index,
+    _migration_003_short_links,
+    _migration_004_click_rollups,
+    _migration_005_posts_fts,
+    _migration_006_posts_indexes,
+    _migration_007_publish_jobs,
+    _migration_008_pending_offers,
+    _migration_009_channel_watermarks,
+    _migration_010_telegram_entities,
+    _migration_011_posts_clicks_resync,
+]
+
+def _seed_defaults(conn: sqlite3.Connection):
+    """Dados padrão (INSERT OR IGNORE): roda em todo startup para novas chaves de config aparecerem."""
+    c = conn.cursor()
     # Inserir dados padrão baseados no seu .env só pra começar
     try:
         from config import SOURCE_CHANNELS
@@ -110,17 +422,25 @@ def init_db():
         c.execute("INSERT OR IGNORE INTO config (chave, valor) VALUES ('cooldown_minutos', '60')")
     except:
         pass
-        
-    conn.commit()
-    conn.close()
+
+# Se o SQLite não tiver FTS5, get_posts volta para o LIKE antigo (definido no init_db)
+_posts_fts_disponivel = False
+
+def _fts_query(search: str) -> str:
+    """Transforma o texto digitado numa consulta FTS5 segura: cada palavra vira um prefixo entre aspas (AND)."""
+    termos = [t.replace('"', '') for t in search.split()]
+    return ' '.join(f'"{t}"*' for t in termos if t)
+
+def _add_column_if_missing(c, tabela: str, coluna: str, definicao: str):
+    colunas = [row[1] for row in c.execute(f"PRAGMA table_info({tabela})").fetchall()]
+    if coluna not in colunas:
+        c.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
 
 def get_canais():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT nome_ou_link FROM canais")
-    canais = [row[0] for row in c.fetchall()]
-    conn.close()
-    return canais
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT nome_ou_link FROM canais")
+        return [row[0] for row in c.fetchall()]
 
 def normalize_channel(nome: str) -> str:
     """Extrai apenas o username de links ou remove o @."""
@@ -136,224 +456,355 @@ def normalize_channel(nome: str) -> str:
     return nome
 
 def add_canal(nome: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    nome_limpo = normalize_channel(nome)
+    if not nome_limpo:
+        return False
     try:
-        nome_limpo = normalize_channel(nome)
-        if not nome_limpo:
-            return False
-        c.execute("INSERT INTO canais (nome_ou_link) VALUES (?)", (nome_limpo,))
-        conn.commit()
+        with get_connection() as conn:
+            conn.execute("INSERT INTO canais (nome_ou_link) VALUES (?)", (nome_limpo,))
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
 def remove_canal(nome: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM canais WHERE nome_ou_link = ?", (nome.strip(),))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        conn.execute("DELETE FROM canais WHERE nome_ou_link = ?", (nome.strip(),))
 
 def get_keywords():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT palavra FROM keywords ORDER BY palavra ASC")
-    kws = [row[0] for row in c.fetchall()]
-    conn.close()
-    return kws
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT palavra FROM keywords ORDER BY palavra ASC")
+        return [row[0] for row in c.fetchall()]
 
 def add_keyword(kw: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
     try:
-        c.execute("INSERT INTO keywords (palavra) VALUES (?)", (kw.strip().lower(),))
-        conn.commit()
+        with get_connection() as conn:
+            conn.execute("INSERT INTO keywords (palavra) VALUES (?)", (kw.strip().lower(),))
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
 def remove_keyword(kw: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM keywords WHERE palavra = ?", (kw.strip().lower(),))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        conn.execute("DELETE FROM keywords WHERE palavra = ?", (kw.strip().lower(),))
 
 # --- NEGATIVE KEYWORDS ---
 def get_negative_keywords():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT palavra FROM negative_keywords ORDER BY palavra ASC")
-    kws = [row[0] for row in c.fetchall()]
-    conn.close()
-    return kws
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT palavra FROM negative_keywords ORDER BY palavra ASC")
+        return [row[0] for row in c.fetchall()]
 
 def add_negative_keyword(kw: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
     try:
-        c.execute("INSERT INTO negative_keywords (palavra) VALUES (?)", (kw.strip().lower(),))
-        conn.commit()
+        with get_connection() as conn:
+            conn.execute("INSERT INTO negative_keywords (palavra) VALUES (?)", (kw.strip().lower(),))
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
 def remove_negative_keyword(kw: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM negative_keywords WHERE palavra = ?", (kw.strip().lower(),))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        conn.execute("DELETE FROM negative_keywords WHERE palavra = ?", (kw.strip().lower(),))
 
 # --- CONFIGURAÇÕES GERAIS ---
+# A tabela config é carregada inteira uma única vez e as leituras saem da memória.
+# Toda escrita passa pelo set_config, que atualiza o banco e o cache (write-through)
+# e avisa quem se registrou via add_config_listener.
+_config_cache: Optional[dict] = None
+_config_cache_path = None
+_config_lock = threading.Lock()
+_config_listeners = []
+
+def _get_config_cache() -> dict:
+    global _config_cache, _config_cache_path
+    cache = _config_cache
+    if cache is not None and _config_cache_path == DB_PATH:
+        return cache
+    with _config_lock:
+        if _config_cache is None or _config_cache_path != DB_PATH:
+            with get_connection() as conn:
+                rows = conn.execute("SELECT chave, valor FROM config").fetchall()
+            _config_cache = dict(rows)
+            _config_cache_path = DB_PATH
+        return _config_cache
+
+def invalidate_config_cache():
+    """Descarta o cache; a próxima leitura recarrega a tabela config do banco."""
+    global _config_cache
+    with _config_lock:
+        _config_cache = None
+
+def add_config_listener(callback, chaves=None):
+    """
+    Registra callback(chave, valor) chamado sempre que set_config mudar um valor.
+    Se 'chaves' for informado, só avisa para essas chaves.
+    O callback roda na thread que fez a escrita (pode ser a thread do database_async).
+    """
+    _config_listeners.append((callback, set(chaves) if chaves else None))
+
 def get_config(chave: str) -> str:
     """Busca o valor string de uma configuração. Retorna string vazia se não achar."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT valor FROM config WHERE chave = ?", (chave,))
-    row = c.fetchone()
-    conn.close()
-    return row[0] if row else ""
+    return _get_config_cache().get(chave, "")
 
 def set_config(chave: str, valor: str):
     """Atualiza ou insere uma configuração."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO config (chave, valor) 
-        VALUES (?, ?) 
-        ON CONFLICT(chave) 
-        DO UPDATE SET valor=excluded.valor
-    ''', (chave, str(valor)))
-    conn.commit()
-    conn.close()
+    valor = str(valor)
+    with get_connection() as conn:
+        conn.execute('''
+            INSERT INTO config (chave, valor) 
+            VALUES (?, ?) 
+            ON CONFLICT(chave) 
+            DO UPDATE SET valor=excluded.valor
+        ''', (chave, valor))
+    apply_config_value(chave, valor)
+
+def apply_config_value(chave: str, valor: str):
+    """Atualiza uma chave no cache (depois de gravada no backend) e avisa os listeners se mudou."""
+    cache = _get_config_cache()
+    with _config_lock:
+        anterior = cache.get(chave)
+        cache[chave] = valor
+    if anterior != valor:
+        _notify_config_change(chave, valor)
+
+def apply_config_snapshot(valores: dict):
+    """Troca o cache inteiro pelos valores lidos do backend, avisando os listeners das chaves alteradas."""
+    global _config_cache, _config_cache_path
+    with _config_lock:
+        anterior = _config_cache or {}
+        _config_cache = dict(valores)
+        _config_cache_path = DB_PATH
+    for chave in set(anterior) | set(valores):
+        if anterior.get(chave) != valores.get(chave):
+            _notify_config_change(chave, valores.get(chave, ""))
+
+def reload_config():
+    """Relê a tabela config do banco (pega edições feitas fora do processo)."""
+    with get_connection() as conn:
+        rows = conn.execute("SELECT chave, valor FROM config").fetchall()
+    apply_config_snapshot(dict(rows))
+
+def _notify_config_change(chave: str, valor: str):
+    for callback, chaves in list(_config_listeners):
+        if chaves is not None and chave not in chaves:
+            continue
+        try:
+            callback(chave, valor)
+        except Exception as e:
+            print(f"⚠️ Erro no listener de config ({chave}): {e}")
 
 async def get_system_config(chave: str) -> str:
     """Versão assíncrona do get_config para cumprir a regra global."""
-    # Como o SQLite aqui é simples e síncrono, apenas chamamos o get_config.
-    # Em um ambiente PostgreSQL real, isso seria um await numa pool de conexões.
+    # As leituras de config saem do cache em memória, então não bloqueiam o loop.
+    # Para as demais funções do banco use o módulo database_async.
     return get_config(chave)
 
 # --- FUNÇÕES DE HISTÓRICO (DEDUPLICAÇÃO) ---
+# As consultas saem de um índice em memória (hash -> instante da postagem, em epoch UTC).
+# O SQLite só guarda a cópia para sobreviver a reinícios; a expiração roda em background
+# (purge_expired_history, agendada pelo maintenance.py) e não a cada consulta.
+_history_index: Optional[dict] = None
+_history_path = None
+_history_lock = threading.Lock()
+
+def _history_window_seconds() -> float:
+    """Janela de deduplicação, vinda da config 'cooldown_minutos' (padrão 60)."""
+    try:
+        minutos = float(get_config("cooldown_minutos") or "60")
+    except ValueError:
+        minutos = 60
+    return max(minutos, 0) * 60
+
+def _utc_str(epoch: float) -> str:
+    # Mesmo formato do CURRENT_TIMESTAMP do SQLite (UTC), para comparar como texto
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))
+
+def _get_history_index() -> dict:
+    global _history_index, _history_path
+    index = _history_index
+    if index is not None and _history_path == DB_PATH:
+        return index
+    with _history_lock:
+        if _history_index is None or _history_path != DB_PATH:
+            limite = _utc_str(time.time() - _history_window_seconds())
+            with get_connection() as conn:
+                rows = conn.execute("SELECT hash_id, posted_at FROM history WHERE posted_at >= ?", (limite,)).fetchall()
+            novo = {}
+            for hash_id, posted_at in rows:
+                try:
+                    novo[hash_id] = calendar.timegm(time.strptime(posted_at, '%Y-%m-%d %H:%M:%S'))
+                except (TypeError, ValueError):
+                    novo[hash_id] = time.time()
+            _history_index = novo
+            _history_path = DB_PATH
+        return _history_index
+
 def check_duplicate(hash_id: str) -> bool:
-    """Verifica se uma oferta com esse hash foi postada nos últimos 60 minutos."""
-    import datetime
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # Limpa registros antigos antes de checar (mais de 60 min)
-    limite = (datetime.datetime.now() - datetime.timedelta(minutes=60)).strftime('%Y-%m-%d %H:%M:%S')
-    c.execute("DELETE FROM history WHERE posted_at < ?", (limite,))
-    
-    c.execute("SELECT 1 FROM history WHERE hash_id = ?", (hash_id,))
-    res = c.fetchone()
-    conn.commit()
-    conn.close()
-    return res is not None
+    """Verifica se uma oferta com esse hash foi postada dentro da janela de cooldown."""
+    posted_at = _get_history_index().get(hash_id)
+    return posted_at is not None and posted_at >= time.time() - _history_window_seconds()
 
 def add_to_history(hash_id: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT OR IGNORE INTO history (hash_id) VALUES (?)", (hash_id,))
-    conn.commit()
-    conn.close()
+    agora = time.time()
+    index = _get_history_index()
+    with _history_lock:
+        index[hash_id] = agora
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO history (hash_id, posted_at) VALUES (?, ?) "
+            "ON CONFLICT(hash_id) DO UPDATE SET posted_at = excluded.posted_at",
+            (hash_id, _utc_str(agora))
+        )
+
+def purge_expired_history() -> int:
+    """Remove do banco e da memória os hashes fora da janela. Retorna quantos saíram do banco."""
+    corte = time.time() - _history_window_seconds()
+    index = _get_history_index()
+    with _history_lock:
+        for hash_id in [h for h, ts in index.items() if ts < corte]:
+            del index[hash_id]
+    with get_connection() as conn:
+        cur = conn.execute("DELETE FROM history WHERE posted_at < ?", (_utc_str(corte),))
+        return cur.rowcount
 
 # --- FUNÇÕES DE ADMINS ---
 def get_admins():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT user_id, username FROM admins")
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT user_id, username FROM admins")
+        return c.fetchall()
 
 def add_admin(user_id: int, username: str = ""):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
     try:
-        c.execute("INSERT INTO admins (user_id, username) VALUES (?, ?)", (user_id, username))
-        conn.commit()
+        with get_connection() as conn:
+            conn.execute("INSERT INTO admins (user_id, username) VALUES (?, ?)", (user_id, username))
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
 def remove_admin(user_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM admins WHERE user_id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        conn.execute("DELETE FROM admins WHERE user_id = ?", (user_id,))
 
 def is_admin(user_id: int) -> bool:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,))
-    res = c.fetchone()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,))
+        res = c.fetchone()
     return res is not None
 
 # --- FUNÇÕES DE SORTEIOS ---
 def create_giveaway(premio: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO sorteios (premio) VALUES (?)", (premio,))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        conn.execute("INSERT INTO sorteios (premio) VALUES (?)", (premio,))
 
 def get_active_giveaways():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id, premio FROM sorteios WHERE status = 'aberto'")
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, premio FROM sorteios WHERE status = 'aberto'")
+        return c.fetchall()
 
 def close_giveaway(giveaway_id: int, winner_id: int, winner_name: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE sorteios SET status = 'encerrado', ganhador_id = ?, ganhador_nome = ? WHERE id = ?", 
-              (winner_id, winner_name, giveaway_id))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        conn.execute("UPDATE sorteios SET status = 'encerrado', ganhador_id = ?, ganhador_nome = ? WHERE id = ?", 
+                     (winner_id, winner_name, giveaway_id))
 
 # --- ENCURTADOR DE LINKS ---
-def create_short_link(long_url: str) -> str:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Tenta gerar um código único (6 caracteres alfanuméricos)
-    chars = string.ascii_letters + string.digits
-    while True:
-        code = ''.join(random.choices(chars, k=6))
-        c.execute("SELECT 1 FROM short_links WHERE short_code = ?", (code,))
-        if not c.fetchone():
-            break
-            
-    c.execute("INSERT INTO short_links (short_code, long_url) VALUES (?, ?)", (code, long_url))
+# Os códigos saem de uma sequência persistente (tabela counters) reservada em blocos,
+# embaralhada por uma bijeção em [0, 62^6) e escrita em base62 com 6 caracteres.
+# Como a bijeção nunca repete valor, não existe mais o loop de "sorteia e confere".
+SHORT_CODE_CHARS = string.ascii_letters + string.digits
+SHORT_CODE_LENGTH = 6
+SHORT_CODE_SPACE = len(SHORT_CODE_CHARS) ** SHORT_CODE_LENGTH
+SHORT_CODE_MULTIPLIER = 2654435761  # Coprimo com 62^6 (não é múltiplo de 2 nem de 31)
+SHORT_CODE_OFFSET = 918273645
+SHORT_CODE_BLOCK = 100
+
+_short_code_lock = threading.Lock()
+_short_code_block = {"proximo": 0, "fim": 0, "path": None}
+
+def _long_url_hash(long_url: str) -> str:
+    return hashlib.sha256(long_url.encode("utf-8")).hexdigest()[:16]
+
+def _encode_short_code(seq: int) -> str:
+    n = (seq * SHORT_CODE_MULTIPLIER + SHORT_CODE_OFFSET) % SHORT_CODE_SPACE
+    chars = []
+    for _ in range(SHORT_CODE_LENGTH):
+        n, resto = divmod(n, len(SHORT_CODE_CHARS))
+        chars.append(SHORT_CODE_CHARS[resto])
+    return ''.join(reversed(chars))
+
+def _reserve_short_code_block(conn) -> int:
+    """Reserva SHORT_CODE_BLOCK números da sequência numa única transação e retorna o primeiro."""
+    conn.execute("INSERT OR IGNORE INTO counters (nome, valor) VALUES ('short_code', 0)")
+    conn.execute("UPDATE counters SET valor = valor + ? WHERE nome = 'short_code'", (SHORT_CODE_BLOCK,))
+    fim = conn.execute("SELECT valor FROM counters WHERE nome = 'short_code'").fetchone()[0]
     conn.commit()
-    conn.close()
-    return code
+    return fim - SHORT_CODE_BLOCK
+
+def _next_short_code(conn) -> str:
+    bloco = _short_code_block
+    if bloco["path"] != DB_PATH or bloco["proximo"] >= bloco["fim"]:
+        inicio = _reserve_short_code_block(conn)
+        bloco.update(proximo=inicio, fim=inicio + SHORT_CODE_BLOCK, path=DB_PATH)
+    seq = bloco["proximo"]
+    bloco["proximo"] += 1
+    return _encode_short_code(seq)
+
+def create_short_link(long_url: str) -> str:
+    """Retorna o código curto da URL, reaproveitando o existente se ela já foi encurtada."""
+    url_hash = _long_url_hash(long_url)
+    with _short_code_lock, get_connection() as conn:
+        row = conn.execute(
+            "SELECT short_code FROM short_links WHERE long_url_hash = ? AND long_url = ? LIMIT 1",
+            (url_hash, long_url)
+        ).fetchone()
+        if row:
+            cache_short_url(row[0], long_url)
+            return row[0]
+        while True:
+            code = _next_short_code(conn)
+            try:
+                conn.execute("INSERT INTO short_links (short_code, long_url, long_url_hash) VALUES (?, ?, ?)",
+                             (code, long_url, url_hash))
+                cache_short_url(code, long_url)
+                return code
+            except sqlite3.IntegrityError:
+                # Só acontece se o código bater com um dos antigos códigos aleatórios: pula para o próximo
+                continue
+
+# Código -> URL longa. Um código nunca muda de destino, então a entrada não precisa expirar.
+# Escrito das threads do executor: inserção e descarte da mais antiga ficam sob a trava.
+SHORT_URL_CACHE_MAX = 5000
+_short_url_cache = OrderedDict()
+_short_url_cache_lock = threading.Lock()
+
+def cache_short_url(code: str, long_url: str):
+    with _short_url_cache_lock:
+        _short_url_cache[code] = long_url
+        _short_url_cache.move_to_end(code)
+        while len(_short_url_cache) > SHORT_URL_CACHE_MAX:
+            _short_url_cache.popitem(last=False)
+
+def uncache_short_url(code: str):
+    with _short_url_cache_lock:
+        _short_url_cache.pop(code, None)
+
+def get_cached_long_url(code: str) -> Optional[str]:
+    """Consulta só a memória (não bloqueia, pode ser chamada direto do loop)."""
+    return _short_url_cache.get(code)
 
 def get_long_url_by_code(code: str) -> Optional[str]:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT long_url FROM short_links WHERE short_code = ?", (code,))
-    row = c.fetchone()
+    """Resolve o código curto. Só leitura: o clique é contado à parte por record_click."""
+    long_url = _short_url_cache.get(code)
+    if long_url:
+        return long_url
+    with get_connection() as conn:
+        row = conn.execute("SELECT long_url FROM short_links WHERE short_code = ?", (code,)).fetchone()
     if row:
-        # Incrementa o número de cliques no background
-        c.execute("UPDATE short_links SET clicks = clicks + 1 WHERE short_code = ?", (code,))
-        conn.commit()
-        conn.close()
+        cache_short_url(code, row[0])
         return row[0]
-    conn.close()
     return None
 
 # Aliases para compatibilidade com o literalmente_bot
@@ -361,68 +812,544 @@ get_active_sorteios = get_active_giveaways
 create_sorteio = create_giveaway
 finalize_sorteio = close_giveaway
 
-# Inicializa o banco ao importar
-init_db()
-def increment_click(code: str):
-    """Incrementa o contador de cliques para um código de link encurtador"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE short_links SET clicks = clicks + 1 WHERE short_code = ?", (code,))
-    conn.commit()
-    conn.close()
+# --- CLIQUES (AGREGADOS EM MEMÓRIA) ---
+# O redirect só anota o clique em memória; flush_clicks grava em lote a cada poucos
+# segundos (maintenance.py) e antes de encerrar/reiniciar o processo: soma o delta em
+# short_links.clicks e acrescenta as linhas em click_events. rollup_clicks depois
+# consolida click_events em clicks_hourly/clicks_daily, que é o que as estatísticas leem.
+CLICK_ROLLUP_BATCH = 5000
+
+_pending_clicks = {}
+_pending_events = []
+_clicks_lock = threading.Lock()
+
+def record_click(code: str, ua_class: str = None):
+    """Conta um clique no código (só memória, não espera escrita no banco)."""
+    with _clicks_lock:
+        _pending_clicks[code] = _pending_clicks.get(code, 0) + 1
+        _pending_events.append((code, int(time.time()), ua_class))
+
+# Compatibilidade: o clique agora é contado uma única vez, pelo agregador
+increment_click = record_click
+
+def take_pending_clicks():
+    """Esvazia o buffer de cliques e retorna (deltas por código, eventos) para o backend gravar."""
+    with _clicks_lock:
+        lote = dict(_pending_clicks)
+        eventos = list(_pending_events)
+        _pending_clicks.clear()
+        _pending_events.clear()
+    return lote, eventos
+
+def restore_pending_clicks(lote: dict, eventos: list):
+    """Devolve ao buffer um lote que não pôde ser gravado, para a próxima tentativa."""
+    with _clicks_lock:
+        for code, delta in lote.items():
+            _pending_clicks[code] = _pending_clicks.get(code, 0) + delta
+        _pending_events[:0] = eventos
+
+def flush_clicks() -> int:
+    """Grava os cliques acumulados em uma única transação. Retorna quantos cliques foram gravados."""
+    lote, eventos = take_pending_clicks()
+    if not eventos:
+        return 0
+    try:
+        with get_connection() as conn:
+            deltas = [(delta, code) for code, delta in lote.items()]
+            conn.executemany("UPDATE short_links SET clicks = clicks + ? WHERE short_code = ?", deltas)
+            conn.executemany("UPDATE posts SET clicks = clicks + ? WHERE short_code = ?", deltas)
+            conn.executemany("INSERT INTO click_events (short_code, ts, ua_class) VALUES (?, ?, ?)", eventos)
+    except Exception:
+        # Devolve os cliques para a próxima tentativa em vez de perdê-los
+        restore_pending_clicks(lote, eventos)
+        raise
+    return len(eventos)
+
+def pending_clicks_by_code(codes) -> dict:
+    """Cliques ainda só em memória, por código (para somar nas estatísticas)."""
+    with _clicks_lock:
+        return {code: _pending_clicks.get(code, 0) for code in codes}
+
+def pending_clicks_total() -> int:
+    with _clicks_lock:
+        return len(_pending_events)
+
+def _utc_day(epoch: float) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(epoch))
+
+def _loja_da_url(url: str) -> str:
+    url = (url or "").lower()
+    if "amazon." in url or "amzn." in url:
+        return "amazon"
+    if "mercadolivre" in url or "mercadolibre" in url or "meli.la" in url:
+        return "mercadolivre"
+    if "shopee" in url:
+        return "shopee"
+    if "aliexpress" in url or "s.click.ali" in url:
+        return "aliexpress"
+    return "outros"
+
+def _get_rollup_watermark(conn) -> int:
+    row = conn.execute("SELECT valor FROM counters WHERE nome = 'click_rollup'").fetchone()
+    return row[0] if row else 0
+
+def rollup_clicks() -> int:
+    """Consolida os click_events ainda não agregados (a partir da marca d'água) nas tabelas por hora/dia."""
+    with get_connection() as conn:
+        desde = _get_rollup_watermark(conn)
+        eventos = conn.execute(
+            "SELECT e.id, e.short_code, e.ts, l.long_url FROM click_events e "
+            "LEFT JOIN short_links l ON l.short_code = e.short_code "
+            "WHERE e.id > ? ORDER BY e.id LIMIT ?", (desde, CLICK_ROLLUP_BATCH)
+        ).fetchall()
+        if not eventos:
+            return 0
+        por_hora, por_dia = {}, {}
+        for _, code, ts, url in eventos:
+            loja = _loja_da_url(url)
+            chave_hora = (ts - ts % 3600, code, loja)
+            chave_dia = (_utc_day(ts), code, loja)
+            por_hora[chave_hora] = por_hora.get(chave_hora, 0) + 1
+            por_dia[chave_dia] = por_dia.get(chave_dia, 0) + 1
+        conn.executemany(
+            "INSERT INTO clicks_hourly (hora, short_code, loja, clicks) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(hora, short_code) DO UPDATE SET clicks = clicks + excluded.clicks",
+            [(*chave, n) for chave, n in por_hora.items()]
+        )
+        conn.executemany(
+            "INSERT INTO clicks_daily (dia, short_code, loja, clicks) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(dia, short_code) DO UPDATE SET clicks = clicks + excluded.clicks",
+            [(*chave, n) for chave, n in por_dia.items()]
+        )
+        conn.execute("INSERT INTO counters (nome, valor) VALUES ('click_rollup', ?) "
+                     "ON CONFLICT(nome) DO UPDATE SET valor = excluded.valor", (eventos[-1][0],))
+    return len(eventos)
 
 def get_short_links_stats(limit=10):
     """Retorna estatísticas dos links encurtados mais recentes"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT short_code, long_url, clicks, created_at FROM short_links ORDER BY created_at DESC LIMIT ?", (limit,))
-    rows = [dict(r) for r in c.fetchall()]
-    conn.close()
-    return rows
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.row_factory = sqlite3.Row
+        c.execute("SELECT short_code, long_url, clicks, created_at FROM short_links ORDER BY created_at DESC LIMIT ?", (limit,))
+        stats = [dict(r) for r in c.fetchall()]
+    pendentes = pending_clicks_by_code([item["short_code"] for item in stats])
+    for item in stats:
+        item["clicks"] += pendentes[item["short_code"]]
+    return stats
 
 def get_total_clicks():
-    """Retorna o total de cliques de todos os links"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT SUM(clicks) FROM short_links")
-    res = c.fetchone()[0] or 0
-    conn.close()
+    """Total de cliques: agregado diário + eventos ainda não consolidados + os que estão só em memória."""
+    with get_connection() as conn:
+        total = conn.execute("SELECT SUM(clicks) FROM clicks_daily").fetchone()[0] or 0
+        total += conn.execute("SELECT COUNT(*) FROM click_events WHERE id > ?",
+                              (_get_rollup_watermark(conn),)).fetchone()[0]
+    return total + pending_clicks_total()
+
+def get_click_analytics(dias: int = 7, horas: int = 24, limit: int = 10) -> dict:
+    """Estatísticas para o dashboard, lidas só das tabelas agregadas."""
+    desde_dia = _utc_day(time.time() - dias * 86400)
+    agora = int(time.time())
+    desde_hora = agora - agora % 3600 - (horas - 1) * 3600
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.row_factory = sqlite3.Row
+        por_loja = c.execute(
+            "SELECT loja, SUM(clicks) AS clicks FROM clicks_daily WHERE dia >= ? GROUP BY loja ORDER BY clicks DESC",
+            (desde_dia,)
+        ).fetchall()
+        por_dia = c.execute(
+            "SELECT dia, SUM(clicks) AS clicks FROM clicks_daily WHERE dia >= ? GROUP BY dia ORDER BY dia",
+            (desde_dia,)
+        ).fetchall()
+        por_hora = c.execute(
+            "SELECT hora, SUM(clicks) AS clicks FROM clicks_hourly WHERE hora >= ? GROUP BY hora ORDER BY hora",
+            (desde_hora,)
+        ).fetchall()
+        top_links = c.execute(
+            "SELECT d.short_code, l.long_url, SUM(d.clicks) AS clicks FROM clicks_daily d "
+            "LEFT JOIN short_links l ON l.short_code = d.short_code "
+            "WHERE d.dia >= ? GROUP BY d.short_code ORDER BY clicks DESC LIMIT ?",
+            (desde_dia, limit)
+        ).fetchall()
+    return {
+        "por_loja": [dict(r) for r in por_loja],
+        "por_dia": [dict(r) for r in por_dia],
+        "por_hora": [dict(r) for r in por_hora],
+        "top_links": [dict(r) for r in top_links],
+    }
+
 def add_post(title: str, image_path: str, post_url: str, short_code: str):
     """Registra um novo post publicado para exibição no dashboard"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO posts (title, image_path, post_url, short_code) VALUES (?, ?, ?, ?)",
-              (title, image_path, post_url, short_code))
-    conn.commit()
-    conn.close()
+    # O link curto pode ser reaproveitado (mesma URL, create_short_link): o post já nasce com os
+    # cliques dele, como o short_links.clicks que o dashboard mostrava antes da coluna posts.clicks
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO posts (title, image_path, post_url, short_code, clicks) "
+            "VALUES (?, ?, ?, ?, COALESCE((SELECT clicks FROM short_links WHERE short_code = ?), 0))",
+            (title, image_path, post_url, short_code, short_code)
+        )
 
-def get_posts(search=None, sort="recent", offset=0, limit=20):
-    """Retorna posts com busca, ordenação e paginação"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    query = """
-        SELECT p.*, COALESCE(sl.clicks, 0) as clicks 
-        FROM posts p
-        LEFT JOIN short_links sl ON p.short_code = sl.short_code
+def _encode_cursor(valores: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Optional[list]:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        return None
+
+def get_posts_page(search=None, sort="recent", cursor=None, limit=20) -> dict:
     """
+    Página de posts com cursor (keyset): a página N custa o mesmo que a primeira.
+    Retorna {"posts": [...], "next_cursor": str ou None}. O cursor é opaco para o cliente:
+    guarda (created_at, id) no "recent" e (clicks, id) no "clicked", também com busca (o FTS
+    só filtra). A ordem por relevância (bm25) só vale com sort="relevance" e uma busca; nela o
+    conjunto já vem filtrado pelo FTS e o cursor guarda só o deslocamento.
+    """
+    query = "SELECT p.* FROM posts p"
+    where, params = [], []
+    fts = _fts_query(search) if search and _posts_fts_disponivel else ""
+    
+    if fts:
+        query += " JOIN posts_fts f ON f.rowid = p.id"
+        where.append("posts_fts MATCH ?")
+        params.append(fts)
+    elif search:
+        where.append("p.title LIKE ?")
+        params.append(f"%{search}%")
+    
+    anterior = _decode_cursor(cursor) if cursor else None
+    por_relevancia = bool(fts) and sort == "relevance"
+    if por_relevancia:
+        ordem = " ORDER BY bm25(posts_fts), p.id DESC"
+        deslocamento = anterior[0] if anterior and len(anterior) == 1 else 0
+    else:
+        coluna = "p.clicks" if sort == "clicked" else "p.created_at"
+        ordem = f" ORDER BY {coluna} DESC, p.id DESC"
+        deslocamento = 0
+        if anterior and len(anterior) == 2:
+            where.append(f"({coluna}, p.id) < (?, ?)")
+            params.extend(anterior)
+    
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += ordem + " LIMIT ? OFFSET ?"
+    params.extend([limit, deslocamento])
+    
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.row_factory = sqlite3.Row
+        c.execute(query, params)
+        posts = [dict(r) for r in c.fetchall()]
+    
+    next_cursor = None
+    if len(posts) == limit:
+        ultimo = posts[-1]
+        if por_relevancia:
+            next_cursor = _encode_cursor([deslocamento + limit])
+        elif sort == "clicked":
+            next_cursor = _encode_cursor([ultimo["clicks"], ultimo["id"]])
+        else:
+            next_cursor = _encode_cursor([ultimo["created_at"], ultimo["id"]])
+    return {"posts": posts, "next_cursor": next_cursor}
+
+def get_posts(search=None, sort="recent", offset=0, limit=20):
+    """Retorna posts com busca, ordenação e paginação por deslocamento (compatibilidade; prefira get_posts_page)"""
+    query = "SELECT p.* FROM posts p"
     params = []
+    fts = _fts_query(search) if search and _posts_fts_disponivel else ""
     
-    if search:
+    if fts:
+        query += " JOIN posts_fts f ON f.rowid = p.id WHERE posts_fts MATCH ?"
+        params.append(fts)
+    elif search:
         query += " WHERE p.title LIKE ?"
         params.append(f"%{search}%")
     
     if sort == "clicked":
-        query += " ORDER BY clicks DESC, p.created_at DESC"
+        query += " ORDER BY p.clicks DESC, p.id DESC"
+    elif fts and sort == "relevance":
+        query += " ORDER BY bm25(posts_fts), p.id DESC"
     else:
-        query += " ORDER BY p.created_at DESC"
+        query += " ORDER BY p.created_at DESC, p.id DESC"
         
     query += " LIMIT ? OFFSET ?"
     params.extend([limit, offset])
     
-    c.execute(query, params)
-    rows = [dict(r) for r in c.fetchall()]
-    conn.close()
-    return rows
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.row_factory = sqlite3.Row
+        c.execute(query, params)
+        return [dict(r) for r in c.fetchall()]
+
+# --- FILA DE PUBLICAÇÃO ---
+# Cada job guarda a oferta serializada (payload JSON, ver publish_queue.py). Ao ser pego pelo
+# worker ele fica 'processando' com prazo de visibilidade: se o processo morrer no meio, o job
+# volta a ficar disponível quando o prazo vence. target_url marca que a publicação no canal já
+# foi feita, para a retomada não postar de novo. Depois de esgotar as tentativas vira 'falhou'.
+def enqueue_publish_job(payload: str, atraso: float = 0) -> int:
+    with get_connection() as conn:
+        cur = conn.execute("INSERT INTO publish_jobs (payload, disponivel_em) VALUES (?, ?)",
+                           (payload, int(time.time() + atraso)))
+        return cur.lastrowid
+
+def next_publish_job_due() -> Optional[int]:
+    """Instante (epoch) em que o próximo job da fila fica disponível, ou None se a fila está vazia."""
+    with get_connection() as conn:
+        return conn.execute(
+            "SELECT MIN(disponivel_em) FROM publish_jobs WHERE status IN ('pendente', 'processando')"
+        ).fetchone()[0]
+
+def claim_publish_job(visibilidade: float, max_tentativas: int) -> Optional[dict]:
+    """
+    Pega o próximo job disponível (pendente ou com prazo de visibilidade vencido).
+    Se ele já esgotou as tentativas (derrubou o processo em todas), é marcado 'falhou'
+    e volta com job["morto"] = True para quem chamou limpar a mídia.
+    """
+    agora = int(time.time())
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.row_factory = sqlite3.Row
+        row = c.execute('''
+            UPDATE publish_jobs
+            SET status = 'processando', tentativas = tentativas + 1,
+                disponivel_em = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM publish_jobs
+                WHERE status IN ('pendente', 'processando') AND disponivel_em <= ?
+                ORDER BY disponivel_em, id LIMIT 1
+            )
+            RETURNING id, payload, tentativas, target_url
+        ''', (int(agora + visibilidade), agora)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["morto"] = job["tentativas"] > max_tentativas
+        if job["morto"]:
+            conn.execute("UPDATE publish_jobs SET status = 'falhou', erro = COALESCE(erro, 'tentativas esgotadas'), "
+                         "updated_at = CURRENT_TIMESTAMP WHERE id = ?", (job["id"],))
+        return job
+
+# Reserva do job: só quem fez o claim (mesma tentativa, ainda 'processando') mexe nele. Se o prazo
+# venceu e outro worker pegou o job, as atualizações de quem ficou para trás não afetam nada.
+_JOB_DA_TENTATIVA = "id = ? AND status = 'processando' AND tentativas = ?"
+
+def renew_publish_job(job_id: int, tentativa: int, visibilidade: float) -> bool:
+    """Estende o prazo de visibilidade do job. Retorna False se a reserva já não é deste worker."""
+    with get_connection() as conn:
+        cur = conn.execute(f"UPDATE publish_jobs SET disponivel_em = ?, updated_at = CURRENT_TIMESTAMP WHERE {_JOB_DA_TENTATIVA}",
+                           (int(time.time() + visibilidade), job_id, tentativa))
+        return cur.rowcount > 0
+
+def checkpoint_publish_job(job_id: int, tentativa: int, target_url: str, visibilidade: float) -> bool:
+    """Grava o link já publicado e renova a reserva. Retorna False se a reserva já não é deste worker."""
+    with get_connection() as conn:
+        cur = conn.execute(
+            f"UPDATE publish_jobs SET target_url = ?, disponivel_em = ?, updated_at = CURRENT_TIMESTAMP WHERE {_JOB_DA_TENTATIVA}",
+            (target_url, int(time.time() + visibilidade), job_id, tentativa)
+        )
+        return cur.rowcount > 0
+
+def complete_publish_job(job_id: int, tentativa: int) -> bool:
+    with get_connection() as conn:
+        cur = conn.execute(f"UPDATE publish_jobs SET status = 'concluido', erro = NULL, updated_at = CURRENT_TIMESTAMP WHERE {_JOB_DA_TENTATIVA}",
+                           (job_id, tentativa))
+        return cur.rowcount > 0
+
+def fail_publish_job(job_id: int, tentativa: int, erro: str, max_tentativas: int, espera: float) -> Optional[bool]:
+    """
+    Registra a falha: volta para a fila após 'espera' segundos ou vira 'falhou'.
+    Retorna True se morreu, False se volta para a fila e None se a reserva já não é deste worker.
+    """
+    morto = tentativa >= max_tentativas
+    with get_connection() as conn:
+        cur = conn.execute(
+            f"UPDATE publish_jobs SET status = ?, erro = ?, disponivel_em = ?, updated_at = CURRENT_TIMESTAMP WHERE {_JOB_DA_TENTATIVA}",
+            ('falhou' if morto else 'pendente', erro[:500], int(time.time() + espera), job_id, tentativa)
+        )
+        if cur.rowcount == 0:
+            return None
+    return morto
+
+def get_publish_queue_stats() -> dict:
+    with get_connection() as conn:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM publish_jobs GROUP BY status").fetchall())
+
+# --- OFERTAS AGUARDANDO APROVAÇÃO ---
+# Payload no mesmo formato da fila de publicação (JSON da OfertaPublicacao, ver pending_offers.py).
+# As funções que removem ofertas devolvem os payloads para quem chamou apagar as mídias.
+def add_pending_offer(payload: str, ttl: float, limite: int):
+    """Guarda a oferta e retorna (id, payloads removidos para respeitar o limite de pendentes)."""
+    with get_connection() as conn:
+        cur = conn.execute("INSERT INTO pending_offers (payload, expira_em) VALUES (?, ?)",
+                           (payload, int(time.time() + ttl)))
+        offer_id = cur.lastrowid
+        removidas = conn.execute(
+            "DELETE FROM pending_offers WHERE id NOT IN (SELECT id FROM pending_offers ORDER BY id DESC LIMIT ?) "
+            "RETURNING payload", (max(limite, 1),)
+        ).fetchall()
+    return offer_id, [r[0] for r in removidas]
+
+def get_pending_offer(offer_id: int) -> Optional[str]:
+    with get_connection() as conn:
+        row = conn.execute("SELECT payload FROM pending_offers WHERE id = ? AND expira_em > ?",
+                           (offer_id, int(time.time()))).fetchone()
+    return row[0] if row else None
+
+def update_pending_offer(offer_id: int, payload: str) -> bool:
+    with get_connection() as conn:
+        cur = conn.execute("UPDATE pending_offers SET payload = ? WHERE id = ? AND expira_em > ?",
+                           (payload, offer_id, int(time.time())))
+        return cur.rowcount > 0
+
+def take_pending_offer(offer_id: int) -> Optional[str]:
+    """Remove e retorna a oferta numa única operação (dois cliques em 'Postar' não publicam duas vezes)."""
+    with get_connection() as conn:
+        row = conn.execute("DELETE FROM pending_offers WHERE id = ? AND expira_em > ? RETURNING payload",
+                           (offer_id, int(time.time()))).fetchone()
+    return row[0] if row else None
+
+def purge_expired_pending_offers() -> list:
+    with get_connection() as conn:
+        rows = conn.execute("DELETE FROM pending_offers WHERE expira_em <= ? RETURNING payload",
+                            (int(time.time()),)).fetchall()
+    return [r[0] for r in rows]
+
+# --- MARCAS DOS CANAIS MONITORADOS (ver monitor.recuperar_perdidas) ---
+
+def get_channel_watermarks() -> dict:
+    """{chat_id: último ID de mensagem processado}."""
+    with get_connection() as conn:
+        return dict(conn.execute("SELECT chat_id, ultimo_msg_id FROM channel_watermarks").fetchall())
+
+def set_channel_watermark(chat_id: int, msg_id: int):
+    """Avança a marca do canal (nunca volta: mensagens podem terminar fora de ordem)."""
+    with get_connection() as conn:
+        conn.execute('''
+            INSERT INTO channel_watermarks (chat_id, ultimo_msg_id) VALUES (?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET
+                ultimo_msg_id = MAX(ultimo_msg_id, excluded.ultimo_msg_id),
+                updated_at = CURRENT_TIMESTAMP
+        ''', (chat_id, msg_id))
+
+# --- CACHE DE ENTIDADES DO TELEGRAM (ver entity_cache.py) ---
+
+def get_telegram_entities() -> list:
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.row_factory = sqlite3.Row
+        rows = c.execute("SELECT * FROM telegram_entities ORDER BY titulo COLLATE NOCASE").fetchall()
+        return [dict(r) for r in rows]
+
+def save_telegram_entities(entidades: list, substituir_membros: bool = False):
+    """
+    Grava (upsert por peer_id) as entidades resolvidas. Com substituir_membros, quem não está
+    na lista deixa de ser membro (lista completa de diálogos do userbot).
+    """
+    agora = int(time.time())
+    with get_connection() as conn:
+        if substituir_membros:
+            conn.execute("UPDATE telegram_entities SET membro = 0")
+        conn.executemany('''
+            INSERT INTO telegram_entities (peer_id, access_hash, nome, titulo, username, tipo, membro, updated_at)
+            VALUES (:peer_id, :access_hash, :nome, :titulo, :username, :tipo, :membro, :updated_at)
+            ON CONFLICT(peer_id) DO UPDATE SET
+                access_hash = excluded.access_hash,
+                nome = COALESCE(excluded.nome, telegram_entities.nome),
+                titulo = excluded.titulo,
+                username = excluded.username,
+                tipo = excluded.tipo,
+                membro = excluded.membro,
+                updated_at = excluded.updated_at
+        ''', [{**e, "membro": int(bool(e["membro"])), "updated_at": agora} for e in entidades])
+
+# --- RETENÇÃO (ver retention.py) ---
+# Cada função apaga um único lote (transação curta, o lock de escrita não fica preso) e o
+# retention.py repete até sobrar menos que o lote. As estatísticas de cliques continuam em
+# clicks_daily, que nunca é podado: apagar posts/links antigos não muda os totais.
+def purge_old_posts(dias: float, lote: int) -> list:
+    """Remove um lote de posts mais antigos que 'dias' e retorna os image_path deles."""
+    corte = _utc_str(time.time() - dias * 86400)
+    with get_connection() as conn:
+        rows = conn.execute(
+            "DELETE FROM posts WHERE id IN (SELECT id FROM posts WHERE created_at < ? LIMIT ?) RETURNING image_path",
+            (corte, lote)
+        ).fetchall()
+    return [r[0] for r in rows]
+
+def purge_old_short_links(dias: float, lote: int) -> int:
+    """
+    Remove links criados há mais de 'dias' que não têm post e não receberam clique no período.
+    Cuidado: o link para de funcionar nas mensagens antigas do canal, por isso a política vem desligada.
+    """
+    corte = time.time() - dias * 86400
+    with get_connection() as conn:
+        rows = conn.execute('''
+            DELETE FROM short_links WHERE id IN (
+                SELECT l.id FROM short_links l
+                WHERE l.created_at < ?
+                  AND NOT EXISTS (SELECT 1 FROM posts p WHERE p.short_code = l.short_code)
+                  AND NOT EXISTS (SELECT 1 FROM clicks_daily d WHERE d.short_code = l.short_code AND d.dia >= ?)
+                LIMIT ?
+            ) RETURNING short_code
+        ''', (_utc_str(corte), _utc_day(corte), lote)).fetchall()
+    for (code,) in rows:
+        uncache_short_url(code)
+    return len(rows)
+
+def purge_click_details(dias: float, lote: int) -> int:
+    """Remove eventos de clique já agregados e linhas de clicks_hourly mais antigos que 'dias'."""
+    corte = int(time.time() - dias * 86400)
+    with get_connection() as conn:
+        cur = conn.execute(
+            "DELETE FROM click_events WHERE id IN (SELECT id FROM click_events WHERE id <= ? AND ts < ? LIMIT ?)",
+            (_get_rollup_watermark(conn), corte, lote)
+        )
+        removidos = cur.rowcount
+        cur = conn.execute(
+            "DELETE FROM clicks_hourly WHERE rowid IN (SELECT rowid FROM clicks_hourly WHERE hora < ? LIMIT ?)",
+            (corte, lote)
+        )
+        return removidos + cur.rowcount
+
+def purge_finished_publish_jobs(dias: float, lote: int) -> int:
+    """Remove jobs 'concluido'/'falhou' sem alteração há mais de 'dias'."""
+    corte = _utc_str(time.time() - dias * 86400)
+    with get_connection() as conn:
+        cur = conn.execute(
+            "DELETE FROM publish_jobs WHERE id IN (SELECT id FROM publish_jobs "
+            "WHERE status IN ('concluido', 'falhou') AND updated_at < ? LIMIT ?)",
+            (corte, lote)
+        )
+        return cur.rowcount
+
+def get_media_references() -> dict:
+    """Arquivos ainda em uso: imagens dos posts e payloads (JSON) dos jobs ativos e das ofertas pendentes."""
+    with get_connection() as conn:
+        imagens = [r[0] for r in conn.execute("SELECT image_path FROM posts WHERE image_path IS NOT NULL AND image_path != ''")]
+        payloads = [r[0] for r in conn.execute("SELECT payload FROM publish_jobs WHERE status IN ('pendente', 'processando')")]
+        payloads += [r[0] for r in conn.execute("SELECT payload FROM pending_offers")]
+    return {"imagens": imagens, "payloads": payloads}
+
+RETENCAO_VACUUM_PAGINAS = 2000  # ~8 MB por rodada com páginas de 4 KB
+
+def compact_storage(paginas: int = RETENCAO_VACUUM_PAGINAS) -> int:
+    """
+    Devolve ao disco até 'paginas' páginas livres (VACUUM incremental) e trunca o WAL.
+    Bancos criados sem auto_vacuum são convertidos uma única vez com um VACUUM completo.
+    Retorna quantas páginas foram liberadas.
+    """
+    with get_connection() as conn:
+        conn.commit()  # PRAGMA auto_vacuum e VACUUM não rodam dentro de transação
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            print("🗜️ Convertendo o banco para auto_vacuum incremental (VACUUM completo, só desta vez)...")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        livres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # Cada passo do cursor libera uma página: o fetchall() executa o pragma até o fim
+        conn.execute(f"PRAGMA incremental_vacuum({int(paginas)})").fetchall()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return min(livres, paginas)
+
+# Inicializa o banco ao importar (no fim do módulo, depois de todas as funções usadas no schema)
+init_db()
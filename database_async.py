@@ -0,0 +1,165 @@
+"""
+Versões assíncronas das funções do database.py.
+
+Todo o processo divide um único loop do asyncio (Telethon, aiogram e o dashboard aiohttp),
+então nenhuma chamada ao SQLite deve rodar direto dentro de uma corrotina: aqui cada função
+é executada num executor dedicado ao banco e a corrotina só aguarda o resultado.
+As funções repassam para o backend escolhido no storage.py (SQLite por padrão, ou Postgres).
+
+Uso:
+    import database_async as adb
+    canais = await adb.get_canais()
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import storage
+
+# Poucas threads bastam: com WAL as leituras andam em paralelo e as escritas são serializadas pelo SQLite
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+async def run_db(func, *args, **kwargs):
+    """Executa uma função síncrona de banco no executor dedicado e aguarda o resultado."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+def shutdown():
+    """Encerra o executor e fecha as conexões do pool (chamar ao desligar o processo)."""
+    _executor.shutdown(wait=True)
+    database.close_pool()
+
+# nome da função -> callbacks avisados depois de cada chamada (ver add_change_listener)
+_change_listeners = {}
+
+def add_change_listener(callback, nomes):
+    """
+    Registra callback(nome, args, resultado) chamado no loop depois que uma das funções
+    'nomes' deste módulo termina sem erro (ex: add_canal, increment_click).
+    Serve para manter caches derivados em dia sem consultar o banco de novo.
+    """
+    for nome in nomes:
+        _change_listeners.setdefault(nome, []).append(callback)
+
+def _notify_change(nome: str, args: tuple, resultado):
+    for callback in _change_listeners.get(nome, ()):
+        try:
+            callback(nome, args, resultado)
+        except Exception as e:
+            print(f"⚠️ Erro no listener de {nome}: {e}")
+
+# Nomes repassados ao backend: todos precisam existir na interface storage.Storage (ver test_storage.py)
+_delegadas = set()
+
+def _delegate(nome: str):
+    """Função assíncrona que repassa a chamada ao backend de armazenamento ativo (storage.py)."""
+    _delegadas.add(nome)
+    async def wrapper(*args, **kwargs):
+        resultado = await getattr(storage.get_storage(), nome)(*args, **kwargs)
+        if nome in _change_listeners:
+            _notify_change(nome, args, resultado)
+        return resultado
+    wrapper.__name__ = nome
+    return wrapper
+
+# --- CANAIS ---
+get_canais = _delegate("get_canais")
+add_canal = _delegate("add_canal")
+remove_canal = _delegate("remove_canal")
+
+# --- KEYWORDS ---
+get_keywords = _delegate("get_keywords")
+add_keyword = _delegate("add_keyword")
+remove_keyword = _delegate("remove_keyword")
+get_negative_keywords = _delegate("get_negative_keywords")
+add_negative_keyword = _delegate("add_negative_keyword")
+remove_negative_keyword = _delegate("remove_negative_keyword")
+
+# --- CONFIGURAÇÕES ---
+async def get_config(chave: str) -> str:
+    """A leitura sai do cache em memória do database.py (carregado no init_db), sem tocar o disco."""
+    return database.get_config(chave)
+
+set_config = _delegate("set_config")
+reload_config = _delegate("reload_config")
+
+# --- HISTÓRICO (DEDUPLICAÇÃO) ---
+check_duplicate = _delegate("check_duplicate")
+add_to_history = _delegate("add_to_history")
+purge_expired_history = _delegate("purge_expired_history")
+
+# --- ADMINS ---
+get_admins = _delegate("get_admins")
+add_admin = _delegate("add_admin")
+remove_admin = _delegate("remove_admin")
+is_admin = _delegate("is_admin")
+
+# --- SORTEIOS ---
+create_giveaway = _delegate("create_giveaway")
+get_active_giveaways = _delegate("get_active_giveaways")
+close_giveaway = _delegate("close_giveaway")
+get_active_sorteios = get_active_giveaways
+create_sorteio = create_giveaway
+finalize_sorteio = close_giveaway
+
+# --- ENCURTADOR E ESTATÍSTICAS ---
+create_short_link = _delegate("create_short_link")
+
+async def get_long_url_by_code(code: str):
+    """Códigos já resolvidos saem da memória sem passar pelo backend."""
+    return database.get_cached_long_url(code) or await storage.get_storage().get_long_url_by_code(code)
+
+async def increment_click(code: str, ua_class: str = None):
+    """O clique só é somado em memória; a gravação em lote fica com flush_clicks."""
+    database.record_click(code, ua_class)
+    if "increment_click" in _change_listeners:
+        _notify_change("increment_click", (code, ua_class), None)
+
+record_click = increment_click
+flush_clicks = _delegate("flush_clicks")
+rollup_clicks = _delegate("rollup_clicks")
+get_click_analytics = _delegate("get_click_analytics")
+get_short_links_stats = _delegate("get_short_links_stats")
+get_total_clicks = _delegate("get_total_clicks")
+
+# --- POSTS ---
+add_post = _delegate("add_post")
+get_posts = _delegate("get_posts")
+get_posts_page = _delegate("get_posts_page")
+
+# --- FILA DE PUBLICAÇÃO ---
+enqueue_publish_job = _delegate("enqueue_publish_job")
+claim_publish_job = _delegate("claim_publish_job")
+next_publish_job_due = _delegate("next_publish_job_due")
+renew_publish_job = _delegate("renew_publish_job")
+checkpoint_publish_job = _delegate("checkpoint_publish_job")
+complete_publish_job = _delegate("complete_publish_job")
+fail_publish_job = _delegate("fail_publish_job")
+get_publish_queue_stats = _delegate("get_publish_queue_stats")
+
+# --- OFERTAS AGUARDANDO APROVAÇÃO ---
+add_pending_offer = _delegate("add_pending_offer")
+get_pending_offer = _delegate("get_pending_offer")
+update_pending_offer = _delegate("update_pending_offer")
+take_pending_offer = _delegate("take_pending_offer")
+purge_expired_pending_offers = _delegate("purge_expired_pending_offers")
+
+# --- MARCAS DOS CANAIS MONITORADOS ---
+get_channel_watermarks = _delegate("get_channel_watermarks")
+set_channel_watermark = _delegate("set_channel_watermark")
+
+# --- CACHE DE ENTIDADES DO TELEGRAM ---
+get_telegram_entities = _delegate("get_telegram_entities")
+save_telegram_entities = _delegate("save_telegram_entities")
+
+# --- RETENÇÃO ---
+purge_old_posts = _delegate("purge_old_posts")
+purge_old_short_links = _delegate("purge_old_short_links")
+purge_click_details = _delegate("purge_click_details")
+purge_finished_publish_jobs = _delegate("purge_finished_publish_jobs")
+get_media_references = _delegate("get_media_references")
+compact_storage = _delegate("compact_storage")
@@ -0,0 +1,167 @@
+"""
+Cache persistente das entidades do Telegram (canais monitorados e diálogos do userbot).
+
+Antes, todo startup mandava um JoinChannelRequest para cada linha da tabela canais e depois
+um get_entity para cada uma, em série: com dezenas de canais isso levava minutos e provocava
+FloodWait. Agora o peer ID, o access_hash e a participação de cada canal ficam na tabela
+telegram_entities:
+  - no startup, os canais já conhecidos entram no filtro de IDs direto do banco, e os access
+    hashes são devolvidos à sessão do Telethon (a StringSession não guarda entidades), então
+    get_messages/get_input_entity funcionam sem resolver de novo;
+  - só os canais novos (ou renomeados) são resolvidos, e só entra quem ainda não é membro,
+    com concorrência limitada e pausa global quando o Telegram manda FloodWait;
+  - os canais conhecidos há mais de ENTIDADE_VALIDADE_SEGUNDOS são revalidados em segundo plano;
+  - a lista de grupos do dashboard (get_dialogs) sai da mesma tabela.
+"""
+import asyncio
+import time
+from typing import Optional
+
+from telethon import types, utils
+from telethon.errors import ChannelInvalidError, FloodWaitError, UsernameInvalidError
+from telethon.tl.functions.channels import JoinChannelRequest
+
+import database_async as adb
+from database import normalize_channel
+
+BOOTSTRAP_CONCORRENCIA = 4
+# FloodWait maior que isso desiste do canal nesta rodada (fica em canais_sem_id)
+FLOOD_MAX_ESPERA = 600
+FLOOD_TENTATIVAS = 3
+ENTIDADE_VALIDADE_SEGUNDOS = 7 * 86400
+DIALOGOS_VALIDADE_SEGUNDOS = 3600
+DIALOGOS_LIMITE = 100
+
+_flood_ate = 0.0  # Instante (monotonic) até quando todas as chamadas esperam por causa de um FloodWait
+_dialogos_em = None  # Última vez que a lista de diálogos foi buscada no Telegram (monotonic)
+_semaforo = None
+
+def _limite() -> asyncio.Semaphore:
+    global _semaforo
+    if _semaforo is None:
+        _semaforo = asyncio.Semaphore(BOOTSTRAP_CONCORRENCIA)
+    return _semaforo
+
+async def _com_flood(chamada):
+    """Faz a chamada ao Telegram respeitando (e registrando para todos) o FloodWait."""
+    global _flood_ate
+    for tentativa in range(FLOOD_TENTATIVAS):
+        espera = _flood_ate - time.monotonic()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        try:
+            return await chamada()
+        except FloodWaitError as e:
+            if e.seconds > FLOOD_MAX_ESPERA or tentativa == FLOOD_TENTATIVAS - 1:
+                raise
+            _flood_ate = max(_flood_ate, time.monotonic() + e.seconds + 1)
+            print(f"⏳ FloodWait de {e.seconds}s do Telegram: pausando a inicialização dos canais.")
+
+def _linha(entidade, nome: Optional[str], membro: bool) -> dict:
+    return {
+        "peer_id": utils.get_peer_id(entidade),
+        "access_hash": getattr(entidade, "access_hash", None) or 0,
+        "nome": nome,
+        "titulo": utils.get_display_name(entidade),
+        "username": getattr(entidade, "username", None),
+        "tipo": "canal" if getattr(entidade, "broadcast", False) else "grupo",
+        "membro": membro,
+    }
+
+def _entidade(linha: dict):
+    """Reconstrói o mínimo da entidade para a sessão do Telethon (ID, hash, username e título)."""
+    real_id, tipo_peer = utils.resolve_id(linha["peer_id"])
+    if tipo_peer is types.PeerChannel and linha["access_hash"]:
+        return types.Channel(
+            id=real_id, title=linha["titulo"] or "", photo=types.ChatPhotoEmpty(), date=None,
+            access_hash=linha["access_hash"], username=linha["username"],
+            broadcast=linha["tipo"] == "canal", megagroup=linha["tipo"] != "canal",
+        )
+    if tipo_peer is types.PeerChat:
+        return types.Chat(id=real_id, title=linha["titulo"] or "", photo=types.ChatPhotoEmpty(),
+                          participants_count=0, date=None, version=0)
+    return None
+
+def semear_sessao(client, linhas: list):
+    """Devolve à sessão do Telethon os access hashes conhecidos (get_input_entity sem rede)."""
+    entidades = [e for e in map(_entidade, linhas) if e]
+    if entidades:
+        client.session.process_entities(entidades)
+
+async def registrar_canal(client, canal: str) -> Optional[int]:
+    """Resolve o canal, entra se ainda não for membro e grava no cache. Retorna o peer ID."""
+    nome = normalize_channel(canal)
+    alvo = int(nome) if nome.lstrip("-").isdigit() else nome
+    async with _limite():
+        try:
+            entidade = await _com_flood(lambda: client.get_entity(alvo))
+            if isinstance(entidade, types.Channel) and entidade.left:
+                print(f"🔗 Entrando no canal: {nome}...")
+                resultado = await _com_flood(lambda: client(JoinChannelRequest(entidade)))
+                entidade = next((c for c in getattr(resultado, "chats", []) if c.id == entidade.id), entidade)
+                print(f"✅ Userbot garantido no canal: {nome}")
+        except (ChannelInvalidError, UsernameInvalidError):
+            print(f"⚠️ Erro: Canal ou Username inválido: {canal}")
+            return None
+        except Exception as e:
+            # Sem resolver não dá para saber se o canal existe: não entra no cache nem no filtro
+            # (fica em canais_sem_id e é tentado de novo no próximo startup)
+            print(f"⚠️ Não foi possível entrar/resolver o canal {canal}: {e}")
+            return None
+    linha = _linha(entidade, nome.lower(), True)
+    await adb.save_telegram_entities([linha])
+    print(f"✅ ID Resolvido: @{nome} -> {linha['peer_id']}")
+    return linha["peer_id"]
+
+async def inicializar(client, canais: list):
+    """
+    Monta o filtro de IDs dos canais monitorados: o que está no cache entra direto, o resto
+    é resolvido em paralelo (limitado). Retorna (ids {peer_id: nome}, nomes sem ID, canais a revalidar).
+    """
+    linhas = await adb.get_telegram_entities()
+    semear_sessao(client, linhas)
+    por_nome = {l["nome"]: l for l in linhas if l["nome"]}
+    vencimento = time.time() - ENTIDADE_VALIDADE_SEGUNDOS
+    ids, pendentes, revalidar = {}, [], []
+    for canal in canais:
+        nome = normalize_channel(canal).lower()
+        linha = por_nome.get(nome)
+        if linha and linha["membro"]:
+            ids[linha["peer_id"]] = nome
+            if linha["updated_at"] < vencimento:
+                revalidar.append(canal)
+        else:
+            pendentes.append(canal)
+    print(f"🗂️ {len(ids)} canal(is) vieram do cache de entidades; {len(pendentes)} para entrar/resolver.")
+
+    resolvidos = await asyncio.gather(*[registrar_canal(client, canal) for canal in pendentes])
+    sem_id = set()
+    for canal, peer_id in zip(pendentes, resolvidos):
+        nome = normalize_channel(canal).lower()
+        if peer_id is None:
+            sem_id.add(nome)
+        else:
+            ids[peer_id] = nome
+    return ids, sem_id, revalidar
+
+async def revalidar(client, canais: list):
+    """Confere em segundo plano os canais do cache que não são checados há muito tempo."""
+    await asyncio.gather(*[registrar_canal(client, canal) for canal in canais])
+
+async def listar_grupos(client, atualizar: bool = False) -> list:
+    """
+    Grupos e canais do userbot (para o dashboard), do cache. Os diálogos só são buscados no
+    Telegram quando o cache venceu (ou atualizar=True) e o userbot está conectado.
+    """
+    global _dialogos_em
+    vencido = _dialogos_em is None or time.monotonic() - _dialogos_em > DIALOGOS_VALIDADE_SEGUNDOS
+    if (atualizar or vencido) and client.is_connected():
+        dialogos = await _com_flood(lambda: client.get_dialogs(limit=DIALOGOS_LIMITE))
+        linhas = [_linha(d.entity, None, True) for d in dialogos if d.is_group or d.is_channel]
+        # Lista completa (menos que o limite): quem não apareceu saiu do grupo/canal
+        await adb.save_telegram_entities(linhas, substituir_membros=len(dialogos) < DIALOGOS_LIMITE)
+        _dialogos_em = time.monotonic()
+    return [
+        {"id": l["peer_id"], "name": l["titulo"], "username": f"@{l['username']}" if l["username"] else None}
+        for l in await adb.get_telegram_entities() if l["membro"]
+    ]
@@ -0,0 +1,114 @@
+"""
+Filtro de keywords compilado (Aho-Corasick).
+
+Keywords e keywords negativas viram um único autômato, montado só quando a lista muda
+(add/remove pelo admin.py ou pela /api/keywords, avisados pelo database_async). Cada
+mensagem é percorrida uma vez, sem acento e sem caixa, e volta com todas as keywords
+encontradas: o custo não depende de quantas keywords estão cadastradas.
+
+Uso:
+    matcher = await keyword_matcher.obter_matcher()
+    positivas, negativas = matcher.verificar(texto)
+"""
+import unicodedata
+from typing import Optional
+
+import database_async as adb
+
+def dobrar(texto: str) -> str:
+    """Minúsculas e sem acento ('Promoção' -> 'promocao'), para comparar keywords."""
+    if texto.isascii():
+        return texto.lower()
+    decomposto = unicodedata.normalize("NFKD", texto.casefold())
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+class AhoCorasick:
+    """Autômato de múltiplos padrões: buscar() devolve os índices de todos os padrões presentes no texto."""
+
+    def __init__(self, padroes: list):
+        self._goto = [{}]
+        self._fail = [0]
+        self._saida = [()]
+        for indice, padrao in enumerate(padroes):
+            if padrao:
+                self._inserir(padrao, indice)
+        self._ligar_falhas()
+
+    def _inserir(self, padrao: str, indice: int):
+        estado = 0
+        for c in padrao:
+            proximo = self._goto[estado].get(c)
+            if proximo is None:
+                proximo = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._saida.append(())
+                self._goto[estado][c] = proximo
+            estado = proximo
+        self._saida[estado] += (indice,)
+
+    def _ligar_falhas(self):
+        # BFS: a falha de cada nó é o maior sufixo dele que também é prefixo de algum padrão
+        fila = list(self._goto[0].values())
+        for estado in fila:
+            for c, filho in self._goto[estado].items():
+                fila.append(filho)
+                falha = self._fail[estado]
+                while falha and c not in self._goto[falha]:
+                    falha = self._fail[falha]
+                destino = self._goto[falha].get(c, 0)
+                self._fail[filho] = destino if destino != filho else 0
+                self._saida[filho] += self._saida[self._fail[filho]]
+
+    def buscar(self, texto: str) -> set:
+        goto, fail, saida = self._goto, self._fail, self._saida
+        encontrados = set()
+        estado = 0
+        for c in texto:
+            while estado and c not in goto[estado]:
+                estado = fail[estado]
+            estado = goto[estado].get(c, 0)
+            if saida[estado]:
+                encontrados.update(saida[estado])
+        return encontrados
+
+class KeywordMatcher:
+    def __init__(self, keywords: list, negativas: list):
+        self.keywords = list(keywords)
+        self.negativas = list(negativas)
+        self._automato = AhoCorasick([dobrar(kw) for kw in self.keywords + self.negativas])
+
+    def verificar(self, texto: str):
+        """Retorna (keywords encontradas, negativas encontradas), na ordem em que estão cadastradas."""
+        if not texto:
+            return [], []
+        encontrados = self._automato.buscar(dobrar(texto))
+        total_positivas = len(self.keywords)
+        positivas = [kw for i, kw in enumerate(self.keywords) if i in encontrados]
+        negativas = [kw for i, kw in enumerate(self.negativas) if i + total_positivas in encontrados]
+        return positivas, negativas
+
+_matcher: Optional[KeywordMatcher] = None
+_versao = 0
+
+def invalidar(*_):
+    """Descarta o autômato; o próximo obter_matcher() monta de novo com as listas do banco."""
+    global _matcher, _versao
+    _matcher = None
+    _versao += 1
+
+async def obter_matcher() -> KeywordMatcher:
+    global _matcher
+    matcher = _matcher
+    if matcher is not None:
+        return matcher
+    versao = _versao
+    matcher = KeywordMatcher(await adb.get_keywords(), await adb.get_negative_keywords())
+    if versao == _versao:
+        # Se a lista mudou durante a leitura, esse autômato já nasceu velho: usa só desta vez
+        _matcher = matcher
+    return matcher
+
+adb.add_change_listener(invalidar, [
+    "add_keyword", "remove_keyword", "add_negative_keyword", "remove_negative_keyword",
+])
@@ -1,35 +1,73 @@
+import asyncio
 import re
+import threading
+import time
+from collections import OrderedDict
 import httpx
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 
+# URL curta -> (instante, URL final). Várias fontes repassam o mesmo link e o
+# process_and_replace_links expande de novo o que o product_id.py já expandiu.
+EXPAND_CACHE_MAX = 2000
+EXPAND_CACHE_TTL = 6 * 3600
+_expand_cache = OrderedDict()
+_expand_cache_lock = threading.Lock()  # Inserção + descarte da mais antiga de uma vez só
+# Expansões em andamento: chamadas simultâneas do mesmo link esperam a mesma requisição
+_expand_em_voo = {}
+
 async def expand_url(short_url: str) -> str:
     """
     Função assíncrona que acessa a URL curta e retorna a URL de destino final (após os redirecionamentos).
     """
+    cache = _expand_cache.get(short_url)
+    if cache and cache[0] > time.time() - EXPAND_CACHE_TTL:
+        return cache[1]
+    tarefa = _expand_em_voo.get(short_url)
+    if tarefa is None:
+        tarefa = asyncio.ensure_future(_expandir(short_url))
+        _expand_em_voo[short_url] = tarefa
+        tarefa.add_done_callback(lambda _: _expand_em_voo.pop(short_url, None))
     try:
-        # Usamos follow_redirects=True para acompanhar toda a cadeia até o link final da loja
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        }
-        async with httpx.AsyncClient(follow_redirects=True, timeout=15.0, headers=headers) as client:
-            response = await client.get(short_url)
-            final_url = str(response.url)
-            
-            # --- RECUPERAÇÃO DE ANTI-BOT ML ---
-            # Se o Mercado Livre redirecionar para verificação de conta, extraímos o link real do parâmetro 'go'
-            if "/gz/account-verification" in final_url and "go=" in final_url:
-                from urllib.parse import unquote
-                parsed = urlparse(final_url)
-                qs = parse_qs(parsed.query)
-                if 'go' in qs:
-                    recovered_url = unquote(qs['go'][0])
-                    print(f"[ML] Anti-Bot detectado! Recuperando URL original de 'go': {recovered_url}")
-                    return recovered_url
-            
-            return final_url
+        # shield: se quem chamou for cancelado, a requisição continua para os outros que esperam
+        final_url = await asyncio.shield(tarefa)
     except Exception as e:
         print(f"Erro ao expandir URL {short_url}: {e}")
         return short_url
+    with _expand_cache_lock:
+        _expand_cache[short_url] = (time.time(), final_url)
+        _expand_cache.move_to_end(short_url)
+        while len(_expand_cache) > EXPAND_CACHE_MAX:
+            _expand_cache.popitem(last=False)
+    return final_url
+
+def expansao_em_cache(short_url: str):
+    """URL final de um link curto que já foi expandido (sem ir à rede), ou None."""
+    cache = _expand_cache.get(short_url)
+    if cache and cache[0] > time.time() - EXPAND_CACHE_TTL:
+        return cache[1]
+    return None
+
+async def _expandir(short_url: str) -> str:
+    # Usamos follow_redirects=True para acompanhar toda a cadeia até o link final da loja
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    }
+    async with httpx.AsyncClient(follow_redirects=True, timeout=15.0, headers=headers) as client:
+        response = await client.get(short_url)
+        final_url = str(response.url)
+        
+        # --- RECUPERAÇÃO DE ANTI-BOT ML ---
+        # Se o Mercado Livre redirecionar para verificação de conta, extraímos o link real do parâmetro 'go'
+        if "/gz/account-verification" in final_url and "go=" in final_url:
+            from urllib.parse import unquote
+            parsed = urlparse(final_url)
+            qs = parse_qs(parsed.query)
+            if 'go' in qs:
+                recovered_url = unquote(qs['go'][0])
+                print(f"[ML] Anti-Bot detectado! Recuperando URL original de 'go': {recovered_url}")
+                return recovered_url
+        
+        return final_url
 
 def extract_urls(text: str) -> list[str]:
     """
@@ -164,7 +202,8 @@ async def process_and_replace_links(text: str, extra_link: str = None) -> tuple[
                     short_domain = "https://" + short_domain
                 short_domain = short_domain.rstrip("/")
                 
-                short_code = database.create_short_link(converted_url)
+                import database_async
+                short_code = await database_async.create_short_link(converted_url)
                 converted_url = f"{short_domain}/{short_code}"
                 print(f"🔗 Link Encurtado: {converted_url}")
 
@@ -82,25 +82,32 @@ async def main():
     # Banco de dados
     from database import init_db
     init_db()
+    # Backend de armazenamento (SQLite local ou Postgres, conforme STORAGE_BACKEND)
+    from storage import init_storage, close_storage
+    await init_storage()
 
     # Imports locais para evitar circular dependency
     from web_dashboard import start_web_server
     from monitor import start_monitoring
     from admin import start_admin_bot
+    from maintenance import start_maintenance
 
     # Criamos as tarefas
     dashboard_task = asyncio.create_task(run_task_with_retry("Dashboard Web", start_web_server, delay=5))
     await asyncio.sleep(2)
     monitor_task = asyncio.create_task(run_task_with_retry("Monitoramento", start_monitoring, delay=20))
     admin_task = asyncio.create_task(run_task_with_retry("Bot Admin", start_admin_bot, delay=10))
+    maintenance_task = asyncio.create_task(run_task_with_retry("Manutenção", start_maintenance, delay=30))
     
-    tasks = [dashboard_task, monitor_task, admin_task]
+    tasks = [dashboard_task, monitor_task, admin_task, maintenance_task]
 
     try:
         await asyncio.gather(*tasks)
     except KeyboardInterrupt:
         print("Finalizando...")
         for t in tasks: t.cancel()
+    finally:
+        await close_storage()
 
 if __name__ == "__main__":
     if sys.platform == 'win32':
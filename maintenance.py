@@ -0,0 +1,58 @@
+"""
+Tarefas periódicas de manutenção (rodam em background junto com o bot).
+
+Cada job é (nome, função, intervalo em segundos). Funções síncronas rodam no executor
+do banco (database_async.run_db); corrotinas são aguardadas direto no loop. Cada execução
+roda na sua própria task: um job demorado (retenção com VACUUM completo) não atrasa os
+outros, como a gravação dos cliques a cada 5 s, e o mesmo job nunca roda duas vezes ao mesmo tempo.
+"""
+import asyncio
+import time
+
+import database_async as adb
+import pending_offers
+import retention
+import status_snapshot
+from database_async import run_db
+
+# Resolução do agendador: nenhum job roda com intervalo menor que isso
+TICK_SECONDS = 5
+
+# Os jobs de banco passam pelo database_async para valerem em qualquer backend (storage.py)
+JOBS = [
+    ("Gravação dos cliques do encurtador", adb.flush_clicks, 5),
+    ("Agregação horária/diária dos cliques", adb.rollup_clicks, 60),
+    ("Recarga das configurações", adb.reload_config, 60),
+    ("Releitura completa do status do painel", status_snapshot.invalidar_tudo, 60),
+    ("Expiração do histórico de duplicatas", adb.purge_expired_history, 300),
+    ("Expiração das ofertas aguardando aprovação", pending_offers.expirar_vencidas, 300),
+    ("Retenção de posts, cliques, mídias e compactação do banco", retention.aplicar_retencao, 3600),
+]
+
+async def _run_job(nome, func):
+    try:
+        if asyncio.iscoroutinefunction(func):
+            resultado = await func()
+        else:
+            resultado = await run_db(func)
+        if resultado:
+            print(f"🧹 Manutenção [{nome}]: {resultado} registro(s) processado(s).")
+    except Exception as e:
+        print(f"⚠️ Erro na manutenção [{nome}]: {e}")
+
+async def start_maintenance():
+    """Loop principal: dispara cada job quando o seu intervalo vence (e a execução anterior já terminou)."""
+    proximas = {}
+    em_execucao = {}
+    try:
+        while True:
+            agora = time.monotonic()
+            for nome, func, intervalo in JOBS:
+                anterior = em_execucao.get(nome)
+                if agora >= proximas.get(nome, 0) and (anterior is None or anterior.done()):
+                    proximas[nome] = agora + intervalo
+                    em_execucao[nome] = asyncio.create_task(_run_job(nome, func))
+            await asyncio.sleep(TICK_SECONDS)
+    finally:
+        for tarefa in em_execucao.values():
+            tarefa.cancel()
@@ -2,23 +2,30 @@ import asyncio
 import os
 import re
 import hashlib
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from dataclasses import dataclass, field
+from typing import Optional
 from telethon import TelegramClient, events, utils
-from telethon.tl.functions.channels import JoinChannelRequest
-from telethon.errors import ChannelInvalidError, UsernameInvalidError
-from config import API_ID, API_HASH, TARGET_CHANNEL
-from database import get_canais, get_keywords, get_config, check_duplicate, add_to_history, get_negative_keywords, normalize_channel
+from config import API_ID, API_HASH
+from database import get_config, normalize_channel
+import database_async as adb
+import entity_cache
+import keyword_matcher
+import offer_index
+import product_id
+import rate_limiter
+import title_extractor
+from pipeline import Pipeline
 
 from rewriter import reescrever_promocao
 from links import process_and_replace_links, extract_urls, expand_url
 from publisher import publish_deal, bot
-from watermark import apply_watermark
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
-from whatsapp_publisher import send_whatsapp_msg
 
 # O ADMIN_USER_ID agora é recuperado do banco de dados (chave 'admin_id')
 
-# Variável global para armazenar as ofertas que aguardam aprovação manual
-ofertas_pendentes_admin = []
+# As ofertas que aguardam aprovação manual ficam no banco (ver pending_offers.py)
 
 # Certifique-se de que o diretório de downloads existe
 base_downloads_path = "downloads"
@@ -36,48 +43,51 @@ else:
     print("📁 Usando sessão via arquivo local (literalmente_userbot.session)")
     client = TelegramClient('literalmente_userbot', API_ID, API_HASH)
 
-# Fila para gerenciar o delay e as postagens
-post_queue = asyncio.Queue()
+# Fila persistente para gerenciar o delay e as postagens (tabela publish_jobs, ver publish_queue.py)
+import publish_queue
+from publish_queue import OfertaPublicacao
 
 def debug_log(message):
     """Loga mensagens apenas se o modo debug estiver ativo."""
     if get_config("debug_mode") == "1":
         print(f"[DEBUG] {message}")
 
+# Workers de publicação em paralelo (config 'publicacao_workers'); o ritmo de cada destino
+# fica por conta dos token buckets do rate_limiter.py
+PUBLICACAO_WORKERS_PADRAO = 3
+
+def _publicacao_workers() -> int:
+    try:
+        return max(int(get_config("publicacao_workers") or PUBLICACAO_WORKERS_PADRAO), 1)
+    except ValueError:
+        return PUBLICACAO_WORKERS_PADRAO
+
 async def worker_queue():
-    """Worker que fica rodando em background consumindo a fila e aplicando o delay"""
+    """Worker que fica rodando em background consumindo a fila persistente (cada oferta sai no horário agendado)"""
     while True:
+        job = None
         try:
-            item = await post_queue.get()
+            # O delay_minutos já vem no horário do job (publish_queue.enqueue): só sai o que venceu
+            job = await publish_queue.proximo_job()
+            texto_final = job.oferta.texto
+            media_path = job.oferta.media_path
+            source_url = job.oferta.source_url
             
-            # Suporta diferentes tamanhos da tupla
-            if len(item) == 4:
-                texto_final, media_path, reply_markup, source_url = item
-            elif len(item) == 3:
-                texto_final, media_path, reply_markup = item
-                source_url = None
+            if job.target_url:
+                # Já tinha saído no canal antes do reinício: só faltam as etapas seguintes
+                target_url = job.target_url
+                print(f"⏭️ Job #{job.id} já publicado ({target_url}), concluindo etapas pendentes...")
             else:
-                texto_final, media_path = item
-                reply_markup = None
-                source_url = None
-            
-            delay_str = get_config("delay_minutos") or "0"
-            try:
-                delay_mins = float(delay_str)
-            except:
-                delay_mins = 0
-                
-            if delay_mins > 0:
-                print(f"⏳ Delay ativado. Aguardando {delay_mins} minutos antes de publicar...")
-                await asyncio.sleep(delay_mins * 60)
-            
-            print("📤 Worker publicando oferta da fila...")
-            target_url = await publish_deal(texto_final, media_path, reply_markup=reply_markup)
+                print("📤 Worker publicando oferta da fila...")
+                target_url = await publish_deal(texto_final, media_path, produto_id=job.oferta.produto_id)
+                if not target_url:
+                    await publish_queue.falhar(job, "nenhum canal de destino aceitou a publicação")
+                    continue
+                await publish_queue.marcar_publicado(job, target_url)
             
             # --- NOVO: Salvar Metadados do Post para o Dashboard (Aba POSTS) ---
             try:
                 if target_url: # Só salva se deu certo ir pro Telegram
-                    from database import add_post
                     import shutil
                     import time
                     import re
@@ -102,19 +112,21 @@ async def worker_queue():
                         os.makedirs(uploads_dir, exist_ok=True)
                         
                         ext = os.path.splitext(media_path)[1]
-                        filename = f"auto_{int(time.time())}{ext}"
+                        filename = f"auto_{int(time.time())}_{job.id}{ext}"  # Workers em paralelo: o segundo sozinho pode repetir
                         permanent_media_path = os.path.join(uploads_dir, filename)
                         
                         shutil.copy2(media_path, permanent_media_path)
                         print(f"🖼️ Cópia da imagem salva para o Dashboard: {permanent_media_path}")
                         
                     # 4. Registrar no Banco
-                    add_post(title, permanent_media_path, target_url, short_code)
+                    await adb.add_post(title, permanent_media_path, target_url, short_code)
                     print(f"📊 Post automático registrado na aba POSTS (Código: {short_code})")
             except Exception as e:
                 print(f"⚠️ Erro ao registrar post no Dashboard: {e}")
 
             # --- Notificação de Conclusão ---
+            # Cada etapa lenta começa renovando a reserva: passou do prazo, outro worker já pegou o job
+            await publish_queue.renovar(job)
             admin_id_str = get_config("admin_id")
             if admin_id_str and target_url:
                 try:
@@ -123,6 +135,7 @@ async def worker_queue():
                         msg_conclusao += f"📥 [Fonte Original]({source_url})\n"
                     msg_conclusao += f"📤 [Postagem no Canal]({target_url})"
                     
+                    await rate_limiter.telegram(admin_id_str)
                     if media_path and os.path.exists(media_path):
                         from aiogram.types import FSInputFile
                         photo = FSInputFile(media_path)
@@ -133,79 +146,658 @@ async def worker_queue():
                     print(f"Aviso ao notificar admin na conclusao: {e}")
             
             # --- Envio para WhatsApp (Se habilitado) ---
+            await publish_queue.renovar(job)
             try:
-                from whatsapp_publisher import send_whatsapp_msg, format_whatsapp_text
-                msg_wa = format_whatsapp_text(texto_final)
-                send_whatsapp_msg(msg_wa, media_path)
+                from whatsapp_publisher import publicar_whatsapp, format_whatsapp_text, whatsapp_destinos
+                if whatsapp_destinos():
+                    # Cada grupo espera sua vez no ritmo da Green-API; as chamadas (requests) rodam numa thread
+                    await publicar_whatsapp(format_whatsapp_text(texto_final), media_path)
             except Exception as e:
                 print(f"Erro ao disparar para WhatsApp: {e}")
             
-            # Limpar a mídia local (temporária em downloads/) depois de publicar de verdade
-            if media_path and os.path.exists(media_path):
-                try:
-                    os.remove(media_path)
-                    print("🗑️ Mídia temporária apagada.")
-                except Exception as e:
-                    print(f"Não foi possível apagar arquivo temporário: {e}")
-                    
-            post_queue.task_done()
+            # Conclui o job e limpa a mídia local (temporária em downloads/) depois de publicar de verdade
+            if await publish_queue.concluir(job):
+                print("🗑️ Job concluído e mídia temporária apagada.")
+        except publish_queue.ReservaPerdida as e:
+            # Quem retomou o job termina as etapas e cuida da mídia
+            print(f"⚠️ Parando a publicação: {e}")
         except Exception as e:
             print(f"Erro no worker de fila: {e}")
             import traceback
             traceback.print_exc()
+            if job is not None:
+                try:
+                    await publish_queue.falhar(job, str(e))
+                except Exception as e2:
+                    print(f"Erro ao devolver job para a fila: {e2}")
             await asyncio.sleep(5)
 
-# Cache global para IDs dos canais monitorados
+# Canais monitorados: peer ID -> nome. O handler só consulta o frozenset monitored_ids, trocado
+# inteiro a cada mudança (add_canal/remove_canal avisam pelo database_async), então checar
+# uma mensagem de chat não monitorado é uma busca em memória, sem banco e sem rede.
 monitored_ids_cache = {}
+monitored_ids = frozenset()
+# Usernames (minúsculos) que ainda não conseguimos resolver para ID
+canais_sem_id = set()
 
-async def resolve_monitored_channels():
-    """Resolve os IDs de todos os canais no banco de dados para o cache de monitoramento."""
-    global monitored_ids_cache
-    source_channels = get_canais()
-    new_cache = {}
-    print(f"🔍 Atualizando cache de IDs para {len(source_channels)} canais...")
-    
-    for channel in source_channels:
+def _publicar_ids():
+    global monitored_ids
+    monitored_ids = frozenset(monitored_ids_cache)
+
+async def ensure_joined_channels():
+    """
+    Monta o filtro de IDs dos canais monitorados. Os já conhecidos vêm do cache de entidades
+    (entity_cache.py); só os novos são resolvidos/entram, em paralelo limitado.
+    """
+    global monitored_ids_cache, canais_sem_id
+    source_channels = await adb.get_canais()
+    print(f"📋 Verificando {len(source_channels)} canais monitorados...")
+    ids, sem_id, revalidar = await entity_cache.inicializar(client, source_channels)
+    monitored_ids_cache = ids
+    canais_sem_id = sem_id
+    _publicar_ids()
+    print(f"✨ Cache atualizado com {len(monitored_ids_cache)} IDs.")
+    if revalidar:
+        asyncio.create_task(entity_cache.revalidar(client, revalidar))
+
+async def _monitorar_canal(channel: str):
+    """Canal novo (admin ou dashboard): entra, resolve o ID e já passa a filtrar por ele."""
+    channel_name = normalize_channel(channel)
+    if not client.is_connected():
+        return  # O ensure_joined_channels do startup pega o canal do banco
+    peer_id = await entity_cache.registrar_canal(client, channel_name)
+    if peer_id is None:
+        canais_sem_id.add(channel_name.lower())
+        return
+    monitored_ids_cache[peer_id] = channel_name.lower()
+    canais_sem_id.discard(channel_name.lower())
+    _publicar_ids()
+    print(f"✅ Canal @{channel_name} ({peer_id}) adicionado ao monitoramento.")
+
+def _parar_de_monitorar(channel: str):
+    nome = normalize_channel(channel).lower()
+    for peer_id in [p for p, n in monitored_ids_cache.items() if n == nome or str(p) == nome]:
+        del monitored_ids_cache[peer_id]
+    canais_sem_id.discard(nome)
+    _publicar_ids()
+
+def _ao_mudar_canais(nome: str, args: tuple, resultado):
+    if nome == "remove_canal":
+        _parar_de_monitorar(args[0])
+    elif resultado:
+        asyncio.create_task(_monitorar_canal(args[0]))
+
+adb.add_change_listener(_ao_mudar_canais, ["add_canal", "remove_canal"])
+
+# --- PIPELINE DAS MENSAGENS MONITORADAS ---
+# O handler do Telethon só faz o pré-filtro por ID e coloca a mensagem na fila; o resto do
+# fluxo roda nos estágios abaixo (pipeline.py), cada um com fila limitada e seus workers:
+# filtro -> enriquecimento -> links -> reescrita -> roteamento.
+
+@dataclass(eq=False)
+class MensagemMonitorada:
+    """Mensagem de canal monitorado passando pelos estágios do pipeline."""
+    event: object
+    chat_id: int
+    texto: str = ""
+    source_url: str = ""
+    produto: Optional[str] = None
+    media_path: Optional[str] = None
+    links_botoes: list = field(default_factory=list)
+    texto_com_placeholders: str = ""
+    placeholder_map: dict = field(default_factory=dict)
+    texto_final: str = ""
+    hash_texto: Optional[str] = None  # Hash do texto, gravado no histórico quando a oferta entra na fila
+    reserva: Optional[tuple] = None  # (produto, preço) reservado no product_id, solto se a oferta for descartada
+
+# Chaves (chat_id, msg_id) e (chat_id, grouped_id) já vistas, para não processar a mesma mensagem
+# (múltiplos triggers do Telethon, catch-up) nem o mesmo álbum duas vezes. LRU limitado: as mais
+# antigas saem uma a uma, em vez de o cache inteiro ser esquecido de uma vez.
+MAX_CHAVES_RECENTES = 5000
+_mensagens_vistas = OrderedDict()
+_albuns_vistos = OrderedDict()
+# Marca de cada canal monitorado (gravada no banco): todas as mensagens até ela já saíram do
+# pipeline, para a fila/aprovação ou descartadas. Os estágios terminam fora de ordem, então a
+# marca não passa da menor mensagem do canal que ainda está em andamento: o que estava nas filas
+# em memória num reinício fica acima da marca e volta pelo catch-up.
+_marcas_canais = {}
+_em_andamento = {}  # chat_id -> Counter dos IDs de mensagem dentro do pipeline
+_maior_concluida = {}  # chat_id -> maior ID de mensagem que já saiu do pipeline
+_trava_historico = asyncio.Lock()
+# Hashes de texto das mensagens ainda no pipeline: só vão para o histórico (cooldown) quando a
+# oferta entra na fila, então o que for descartado no caminho não bloqueia o mesmo texto depois
+_textos_em_andamento = set()
+
+# Catch-up depois de quedas/reinícios: até CATCHUP_MAX_MENSAGENS por canal, em lotes, e só as recentes
+CATCHUP_LOTE = 50
+CATCHUP_MAX_MENSAGENS = 200
+CATCHUP_MAX_IDADE_SEGUNDOS = 6 * 3600
+
+def _ja_visto(vistos: OrderedDict, chave) -> bool:
+    """Registra a chave no LRU; True se ela já estava lá."""
+    if chave in vistos:
+        vistos.move_to_end(chave)
+        return True
+    vistos[chave] = True
+    if len(vistos) > MAX_CHAVES_RECENTES:
+        vistos.popitem(last=False)
+    return False
+
+async def _avancar_marca(chat_id: int, msg_id: int):
+    if msg_id > _marcas_canais.get(chat_id, 0):
+        _marcas_canais[chat_id] = msg_id
+        await adb.set_channel_watermark(chat_id, msg_id)
+
+async def _entrar_no_pipeline(event, chat_id: int):
+    """Coloca a mensagem no pipeline, segurando a marca do canal até ela sair."""
+    _em_andamento.setdefault(chat_id, Counter())[event.message.id] += 1
+    await pipeline_mensagens.enviar(MensagemMonitorada(event, chat_id))
+
+async def _concluir_marca(chat_id: int, msg_id: int):
+    pendentes = _em_andamento.get(chat_id)
+    if pendentes is not None:
+        pendentes[msg_id] -= 1
+        if pendentes[msg_id] <= 0:
+            del pendentes[msg_id]
+    _maior_concluida[chat_id] = max(msg_id, _maior_concluida.get(chat_id, 0))
+    marca = _maior_concluida[chat_id]
+    if pendentes:
+        marca = min(marca, min(pendentes) - 1)
+    await _avancar_marca(chat_id, marca)
+
+async def _estagio_filtro(m: MensagemMonitorada):
+    """Filtros locais: pausa, repetidas, tipo de mídia, álbum, keywords, preço mínimo e texto repetido."""
+    event = m.event
+    chat_id = m.chat_id
+    chat = await event.get_chat()
+    chat_title = getattr(chat, 'title', 'Sem Título')
+    chat_username = getattr(chat, 'username', 'N/A')
+    debug_log(f"Mensagem recebida de '{chat_title}' (@{chat_username}) [ID: {chat_id}]")
+
+    print(f"🎯 MENSAGEM DE CANAL MONITORADO: '{chat_title}' (@{chat_username}) [ID: {chat_id}]")
+
+
+
+    # Verifica mensagens já processadas pelo par (canal, ID): o ID sozinho se repete entre canais
+    if _ja_visto(_mensagens_vistas, (chat_id, event.message.id)):
+        debug_log(f"Mensagem já processada ignorada (ID: {event.message.id})")
+        return
+
+    # Verifica se o bot está pausado globalmente
+    if get_config("pausado") == "1":
+        debug_log("Bot pausado globalmente.")
+        return
+
+    # --- FILTRO DE MÍDIA (Urgente: Apenas Texto ou Foto) ---
+    if event.message.media:
+        from telethon.tl.types import MessageMediaPhoto
+        if not isinstance(event.message.media, MessageMediaPhoto):
+            debug_log(f"🚫 Ignorado: Mídia do tipo '{type(event.message.media).__name__}' não permitida (Apenas fotos/texto).")
+            return
+
+    # Verifica se a mensagem faz parte de um álbum já processado
+    if event.message.grouped_id:
+        if _ja_visto(_albuns_vistos, (chat_id, event.message.grouped_id)):
+            debug_log(f"Mensagem extra do mesmo álbum ignorada: {event.message.grouped_id}")
+            return
+
+    print("\n" + "="*50)
+    channel_name = chat_username or chat_id
+    print(f"🚨 Nova mensagem identificada no canal fonte: {channel_name}")
+    mensagem_texto = event.raw_text
+
+    # Se a mensagem for só mídia ou mensagem vazia ignora
+    if not mensagem_texto and not event.message.media:
+        return
+
+    # Keywords e negativas numa passada só pelo autômato compilado (keyword_matcher.py)
+    matcher = await keyword_matcher.obter_matcher()
+    found_kws, found_negativas = matcher.verificar(mensagem_texto)
+    if found_negativas:
+        print(f"🚫 Ignorado: A mensagem contém a keyword negativa: '{found_negativas[0]}'")
+        print(f"📝 Texto analisado (trecho): {mensagem_texto[:100]}...")
+        return
+
+    # Verifica as keywords (se a lista não for vazia)
+    if matcher.keywords and mensagem_texto:
+        if not found_kws:
+            print(f"⏭️ Ignorado: Nenhuma keyword encontrada. Texto analisado (trecho): {mensagem_texto[:100]}...")
+            print(f"🔍 Keywords configuradas: {', '.join(matcher.keywords)}")
+            return
+        else:
+            print(f"✅ Keywords encontradas: {', '.join(found_kws)}")
+
+    # Verifica Preço Mínimo (Se houver $ / R$ no texto)
+    preco_min = float(get_config("preco_minimo") or "0")
+    if preco_min > 0:
+        # Busca valores obrigatoriamente procedidos por R$
+        valores_encontrados = re.findall(r'R\$\s?(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)', mensagem_texto)
+        if valores_encontrados:
+            # Converte o primeiro valor achado pra float
+            str_valor = valores_encontrados[0].replace('.', '').replace(',', '.')
+            try:
+                valor_num = float(str_valor)
+                if valor_num < preco_min:
+                    print(f"🛑 Ignorado por Filtro de Preço: R${valor_num:.2f} é menor que mínimo R${preco_min:.2f}")
+                    return
+            except:
+                pass
+
+    # --- DEDUPLICAÇÃO RÁPIDA (mesmo texto já visto dentro do cooldown_minutos) ---
+    # Ignora os links na comparação: o mesmo post repassado por outro canal vem com outro link de afiliado
+    texto_normalizado = re.sub(r'https?://\S+', '', mensagem_texto.lower())
+    texto_normalizado = re.sub(r'\s+', ' ', texto_normalizado).strip()
+    if len(texto_normalizado) >= 30:
+        hash_oferta = hashlib.sha1(texto_normalizado.encode('utf-8')).hexdigest()
+        # Com vários workers no estágio, a consulta e a reserva não podem intercalar
+        async with _trava_historico:
+            if hash_oferta in _textos_em_andamento or await adb.check_duplicate(hash_oferta):
+                print("🛑 Ignorado: o mesmo texto já foi processado dentro do cooldown.")
+                return
+            _textos_em_andamento.add(hash_oferta)
+        m.hash_texto = hash_oferta
+    m.texto = mensagem_texto
+    return m
+
+async def _estagio_enriquecimento(m: MensagemMonitorada):
+    """Duplicidade nos canais destino (ID do produto ou título), aviso ao admin, mídia e marca d'água."""
+    event = m.event
+    chat_id = m.chat_id
+    mensagem_texto = m.texto
+    # --- DEDUPLICAÇÃO NOS CANAIS DESTINO ---
+    # Pega o primeiro valor R$ achado (ou 0 se não houver)
+    todos_precos = re.findall(r'R\$\s?(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)', mensagem_texto)
+    valor_referencia = todos_precos[0] if todos_precos else "0"
+    valor_referencia_limpo = valor_referencia.replace('.', '').replace(',', '.')
+
+    # ID canônico do produto pelos links (product_id.py): com ele a checagem é exata
+    produto = await product_id.identificar(mensagem_texto)
+    titulo_real = None
+    publicada = None
+    if produto:
+        print(f"🆔 Produto identificado pelo link: {produto}. Verificando duplicidade por (produto, R$ {valor_referencia})...")
+        publicada = offer_index.buscar_por_produto(produto, valor_referencia_limpo)
+        if publicada is None:
+            if not product_id.reservar(produto, valor_referencia_limpo):
+                # Outra fonte mandou a mesma oferta há pouco e ela ainda está sendo processada/na fila
+                print(f"🛑 Post ignorado: o produto {produto} por R$ {valor_referencia} já foi aceito a partir de outra mensagem.")
+                return
+            m.reserva = (produto, valor_referencia_limpo)
+    if publicada is None:
+        # Sem ID no link, ou ID que não está no índice: as ofertas semeadas no startup vêm dos posts
+        # publicados, com os links do nosso encurtador (sem ID), então a checagem por título continua valendo
+        # Título pelas regras locais (title_extractor.py: cache, slug da loja, texto); a IA só entra com confiança baixa
+        titulo_real = (await title_extractor.obter_titulo(mensagem_texto)).titulo
+
+        link_match = re.search(r'(https?://[^\s]+)', mensagem_texto)
+        referencia = link_match.group(1).split('?')[0] if link_match else ""
+
+        # Se nem as regras nem a IA chegaram a um título claro
+        if not titulo_real or titulo_real == "Oferta Desconhecida":
+            if referencia:
+                # Se tiver link mas não tiver titulo, tenta resgatar por scraping em último caso
+                # Se for Shopee, tenta a API oficial primeiro para evitar block de scraper
+                from affiliate import get_shopee_product_info
+                shopee_info = None
+                if "shopee.com.br" in referencia:
+                    shopee_info = await get_shopee_product_info(referencia)
+
+                if shopee_info and shopee_info.get("title"):
+                    titulo_real = shopee_info["title"]
+                    print(f"✅ Titulo Shopee obtido via API: {titulo_real}")
+                else:
+                    from scraper import fetch_product_metadata
+                    try:
+                        metadata = await fetch_product_metadata(referencia)
+                        if metadata and metadata.get("title"):
+                            titulo_real = metadata["title"].strip()
+                    except Exception as e:
+                        print(f"⚠️ Erro no scraper de fallback: {e}")
+                # Próximas mensagens com o mesmo link saem do cache, sem scraping nem IA
+                title_extractor.lembrar(referencia, titulo_real)
+
+        # Se ainda assim não tiver, vai pra primeira linha
+        if not titulo_real or titulo_real == "Oferta Desconhecida":
+            if referencia:
+                titulo_real = referencia
+            else:
+                primeira_linha = mensagem_texto.split('\n')[0].strip()
+                titulo_real = re.sub(r'[^\w\s]', '', primeira_linha).strip().lower()[:50]
+
+        # Busca no índice local das ofertas publicadas nos canais destino (offer_index.py)
+        print(f"🔍 Verificando duplicidade nos canais de destino... Buscando: '{titulo_real}' e 'R$ {valor_referencia}'")
+        publicada = offer_index.buscar_duplicada(titulo_real, valor_referencia_limpo)
+
+    oferta_duplicada = publicada is not None
+    canal_duplicado = publicada.canal if publicada else ""
+    if oferta_duplicada:
+        print(f"🛑 Post ignorado: Exatamente este produto '{titulo_real or produto}' por R$ {valor_referencia} já foi postado no canal de destino {canal_duplicado} nos últimos 60 minutos.")
+        admin_id_str = get_config("admin_id")
+        if admin_id_str:
+            try:
+                msg_info = f"🚫 **Post Ignorado por Duplicação no {canal_duplicado}**\nO produto *{titulo_real or produto}* por R$ {valor_referencia} já foi anunciado pelo robô há menos de 60 minutos."
+                await bot.send_message(chat_id=int(admin_id_str), text=msg_info, parse_mode="Markdown")
+            except: pass
+        return
+
+    # --- NOTIFICAÇÃO ADMIN ---
+    admin_id_str = get_config("admin_id")
+
+    # Tenta gerar o link da postagem original
+    source_url = ""
+    chat_username_for_link = getattr(event.chat, 'username', None)
+    if chat_username_for_link:
+        source_url = f"https://t.me/{chat_username_for_link}/{event.message.id}"
+    else:
+        source_url = f"https://t.me/c/{str(event.chat_id).replace('-100', '')}/{event.message.id}"
+
+    if admin_id_str:
         try:
-            channel_name = normalize_channel(channel)
-            entity = await client.get_entity(channel_name)
-            peer_id = utils.get_peer_id(entity)
-            new_cache[peer_id] = channel_name.lower()
-            print(f"✅ ID Resolvido: @{channel_name} -> {peer_id}")
+            msg_info = f"🔎 **Nova oferta detectada!**\nCanal: `{getattr(event.chat, 'title', None) or chat_id}`\n📥 [Postagem Original]({source_url})\n⏳ Processando publicação..."
+            await bot.send_message(chat_id=int(admin_id_str), text=msg_info, parse_mode="Markdown", disable_web_page_preview=True)
         except Exception as e:
-            print(f"⚠️ Não foi possível resolver ID para {channel}: {e}")
-            
-    monitored_ids_cache = new_cache
-    print(f"✨ Cache atualizado com {len(monitored_ids_cache)} IDs.")
+            print(f"Erro ao notificar admin sobre detecção: {e}")
+
+    # --- FASE 0: Extrair Mídia (Telegram ou Scraper) ---
+    media_path = None
+    source_has_media = bool(event.message.media)
+
+    # Tenta baixar a mídia do Telegram primeiro (fallback)
+    if source_has_media:
+        print("⏬ Baixando mídia do Telegram...")
+        media_path = await event.message.download_media(file="downloads/")
+        print(f"✅ Mídia do Telegram baixada: {media_path}")
+
+    # --- FASE 1: Extrair, Remover e Processar Links (Conversão e Expansão) ---
+    print("🔗 Processando links e substituindo por placeholders...")
+
+    # Extrair links de botões (Inline Keyboard) do canal original
+    original_button_links = []
+    if event.message.reply_markup:
+        from telethon.tl.types import ReplyInlineMarkup, KeyboardButtonUrl
+        if isinstance(event.message.reply_markup, ReplyInlineMarkup):
+            for row in event.message.reply_markup.rows:
+                for button in row.buttons:
+                    if isinstance(button, KeyboardButtonUrl):
+                        original_button_links.append(button.url)
+                        print(f"🔘 Link de botão detectado: {button.url}")
+
+    # Identificar o primeiro link de produto para tentar pegar imagem limpa
+    primeiro_link_produto = None
+    all_source_urls = extract_urls(mensagem_texto) + original_button_links
+    if all_source_urls:
+        # Pega o primeiro link que pareça de uma loja
+        for l in all_source_urls:
+            if any(store in l.lower() for store in ["amazon", "mercadolivre", "shopee", "magazineluiza", "casasbahia"]):
+                primeiro_link_produto = l
+                break
+
+    # Se achamos um link de produto, tentamos pegar a imagem limpa da loja
+    if primeiro_link_produto:
+        print(f"🔍 Tentando buscar imagem limpa da loja: {primeiro_link_produto}")
+        from affiliate import get_shopee_product_info
+        shopee_info = None
+        if "shopee.com.br" in primeiro_link_produto:
+            shopee_info = await get_shopee_product_info(primeiro_link_produto)
+
+        if shopee_info and shopee_info.get("image"):
+            from scraper import download_image
+            temp_clean_path = await download_image(shopee_info["image"])
+            if temp_clean_path:
+                print(f"📸 Imagem Shopee obtida via API: {temp_clean_path}")
+                if media_path and os.path.exists(media_path):
+                    try: os.remove(media_path)
+                    except: pass
+                media_path = temp_clean_path
+        else:
+            from scraper import fetch_product_metadata
+            try:
+                # Expandir se necessário para o scraper funcionar melhor
+                expanded_for_img = await expand_url(primeiro_link_produto)
+                metadata = await fetch_product_metadata(expanded_for_img)
+                if metadata and metadata.get("local_image_path"):
+                    temp_clean_path = metadata["local_image_path"]
+                    print(f"📸 Imagem limpa encontrada na loja: {temp_clean_path}")
+
+                    # Se baixou a limpa, prioriza ela sobre a do Telegram
+                    if media_path and os.path.exists(media_path):
+                        try:
+                            os.remove(media_path)
+                        except: pass
+                    media_path = temp_clean_path
+                    print("✨ Usando imagem original do site (limpa de logos do concorrente).")
+            except Exception as e:
+                print(f"⚠️ Falha ao tentar buscar imagem limpa: {e}")
 
-async def ensure_joined_channels():
-    """Garante que o Userbot está participando de todos os canais monitorados."""
-    source_channels = get_canais()
-    print(f"📋 Verificando filiação em {len(source_channels)} canais...")
-    
-    for channel in source_channels:
+    # Aplica a marca d'água (se houver imagem, seja do telegram ou do scraper)
+    if media_path and os.path.exists(media_path):
         try:
-            # Normaliza e tenta entrar
-            channel_name = normalize_channel(channel)
-            print(f"🔗 Verificando canal: {channel_name}...")
-            await client(JoinChannelRequest(channel_name))
-            print(f"✅ Userbot garantido no canal: {channel_name}")
-        except (ChannelInvalidError, UsernameInvalidError):
-            print(f"⚠️ Erro: Canal ou Username inválido: {channel}")
+            from watermark import apply_watermark
+            media_path = apply_watermark(media_path)
+            print("🖌️ Marca d'água aplicada à imagem final.")
         except Exception as e:
-            if "already a participant" in str(e).lower():
-                print(f"ℹ️ Userbot já participa do canal: {channel}")
+            print(f"⚠️ Não foi possível aplicar marca d'água: {e}")
+    m.source_url = source_url
+    m.produto = produto
+    m.media_path = media_path
+    m.links_botoes = original_button_links
+    return m
+
+async def _estagio_links(m: MensagemMonitorada):
+    """Converte os links (afiliado/encurtador) e descarta mensagens sem link de compra."""
+    mensagem_texto = m.texto
+    original_button_links = m.links_botoes
+    media_path = m.media_path
+    # Se houver links nos botões, vamos injetá-los no texto (no final) para que o bot os processe e crie nossos próprios botões
+    texto_para_processar = mensagem_texto
+    if original_button_links:
+        # Adiciona os links dos botões ao final do texto para garantir que sejam capturados
+        links_str = "\n".join(original_button_links)
+        texto_para_processar += f"\n{links_str}"
+        print(f"➕ {len(original_button_links)} links de botões adicionados ao texto para processamento.")
+
+    texto_com_placeholders, placeholder_map = await process_and_replace_links(texto_para_processar)
+    print(f"✅ {len(placeholder_map)} links encontrados no total.")
+
+    # --- FILTRO DE QUALIDADE: Validar se há links de compra reais ---
+    # Após o refatoramento para Whitelist no links.py, placeholder_map só terá:
+    # 1. Links de lojas válidos (convertidos)
+    # 2. None (para links bloqueados)
+    valid_buy_links = {p: url for p, url in placeholder_map.items() if url}
+
+    if not valid_buy_links:
+        print("⏭️ Ignorado: Nenhum link de COMPRA válido encontrado (Apenas links de conteúdo ou vazios).")
+        # Se baixou mídia, limpa
+        if media_path and os.path.exists(media_path):
+            os.remove(media_path)
+        return
+
+    # --- FILTRO ADICIONAL: Palavras de "Conteúdo" sem indicação de oferta ---
+    palavras_filtro_conteudo = ["análise completa", "testei o", "vídeo novo", "inscreva-se", "meu canal"]
+    if any(p in mensagem_texto.lower() for p in palavras_filtro_conteudo) and len(valid_buy_links) < 1:
+        # Caso extremo onde o link de compra é camuflado mas o texto é claramente um ad de vídeo
+        print("⏭️ Ignorado: Texto identificado como promoção de conteúdo/vídeo.")
+        if media_path and os.path.exists(media_path):
+            os.remove(media_path)
+        return
+
+    print(f"🛍️ {len(valid_buy_links)} links de compra reais identificados. Prosseguindo...")
+    m.texto_com_placeholders = texto_com_placeholders
+    m.placeholder_map = placeholder_map
+    return m
+
+async def _estagio_reescrita(m: MensagemMonitorada):
+    """Reescreve a copy com o Gemini e remonta o texto final com os links e a assinatura."""
+    texto_com_placeholders = m.texto_com_placeholders
+    placeholder_map = m.placeholder_map
+    # --- FASE 2: Reescrever Texto com Gemini ---
+    print("🧠 Passando para o Gemini reescrever a copy...")
+    texto_reescrito = await reescrever_promocao(texto_com_placeholders)
+
+    # --- FASE 3: Remontar o Texto Final Substituindo Placeholders ---
+    texto_final = texto_reescrito
+
+    if placeholder_map:
+        for placeholder, final_url in placeholder_map.items():
+            # Se o link original era da blacklist ou deu erro e for None, ignoramos a formatação ou deletamos o placeholder
+            if final_url is None:
+                texto_final = texto_final.replace(placeholder, "")
             else:
-                print(f"⚠️ Erro ao entrar no canal {channel}: {e}")
-    
-    # Após entrar, resolvemos os IDs para o cache
-    await resolve_monitored_channels()
+                botao_html = f"🛒 <a href='{final_url}'>Pegar promoção</a>"
+                texto_final = texto_final.replace(placeholder, botao_html)
+
+    # Remove qualquer placeholder residual que o Gemini possa ter inventado
+    texto_final = re.sub(r'\[LINK_\d+\]', '', texto_final)
+
+    # --- FASE 3.5: Adicionar Assinatura Customizada ---
+    assinatura = get_config("assinatura")
+    if assinatura:
+        texto_final += f"\n\n{assinatura}"
+
+    print("✅ Texto final pronto!")
+    m.texto_final = texto_final
+    return m
+
+async def _estagio_roteamento(m: MensagemMonitorada):
+    """Direciona a oferta pronta: aprovação manual do admin ou fila de publicação."""
+    texto_final = m.texto_final
+    media_path = m.media_path
+    source_url = m.source_url
+    produto = m.produto
+    # --- FASE 4: Direcionamento (Aprovação, Fila ou Direto) ---
+    admin_id_str = get_config("admin_id")
+    if not admin_id_str:
+        print("⚠️ Admin ID não configurado no banco. O administrador precisa dar /start no bot.")
+        # Se não tem admin mas o bot deveria postar, vamos colocar na fila apenas se NÃO for manual
+        if get_config("aprovacao_manual") != "1":
+            await publish_queue.enqueue(OfertaPublicacao(texto_final, media_path, source_url, produto_id=produto, hash_texto=m.hash_texto))
+            await _liberar_mensagem(m)
+            return m
+        return
+
+    admin_id = int(admin_id_str)
+    msg_amostra = f"**NOVA OFERTA ENCONTRADA!**\n\n{texto_final}"
+
+    if get_config("aprovacao_manual") == "1":
+        # Lógica de aprovação manual
+        print(f"⚖️ Modo Aprovação Manual ativado. Enviando para o Admin {admin_id}...")
+
+        # Salva a oferta para aprovação futura
+        import pending_offers
+        item_id = await pending_offers.adicionar(OfertaPublicacao(texto_final, media_path, source_url, origem="aprovacao", produto_id=produto, hash_texto=m.hash_texto))
+
+        markup = InlineKeyboardMarkup(inline_keyboard=[
+            [
+                InlineKeyboardButton(text="✅ Postar", callback_data=f"aprovar_{item_id}"),
+                InlineKeyboardButton(text="✏️ Editar", callback_data=f"editar_{item_id}"),
+                InlineKeyboardButton(text="❌ Descartar", callback_data=f"recusar_{item_id}")
+            ]
+        ])
+
+        if media_path:
+            photo = FSInputFile(media_path)
+            try:
+                await bot.send_photo(chat_id=admin_id, photo=photo, caption=msg_amostra, reply_markup=markup, parse_mode="HTML")
+            except Exception as e:
+                # Se falhar o html
+                await bot.send_photo(chat_id=admin_id, photo=photo, caption=msg_amostra[:1024], reply_markup=markup)
+        else:
+            await bot.send_message(chat_id=admin_id, text=msg_amostra, reply_markup=markup, parse_mode="HTML", disable_web_page_preview=True)
+
+    else:
+        # Automático, joga na fila, o Worker dá o delay e posta
+        print("📥 Enviando oferta para a fila de publicação...")
+        await publish_queue.enqueue(OfertaPublicacao(texto_final, media_path, source_url, produto_id=produto, hash_texto=m.hash_texto))
+    await _liberar_mensagem(m)
+    return m
+
+async def _liberar_mensagem(m: MensagemMonitorada):
+    """A mensagem saiu do pipeline: o texto deixa de estar reservado em memória e a marca do canal anda."""
+    _textos_em_andamento.discard(m.hash_texto)
+    await _concluir_marca(m.chat_id, m.event.message.id)
+
+async def _descartar_mensagem(m: MensagemMonitorada):
+    """Estágio descartou ou falhou: apaga a mídia que já tinha sido baixada e solta as reservas."""
+    await _liberar_mensagem(m)
+    if m.reserva:
+        # A mesma oferta vinda de outra fonte pode seguir
+        product_id.liberar(*m.reserva)
+    if m.media_path and os.path.exists(m.media_path):
+        os.remove(m.media_path)
+
+pipeline_mensagens = (
+    Pipeline("mensagens", ao_falhar=_descartar_mensagem, ao_descartar=_descartar_mensagem)
+    .estagio("filtro", _estagio_filtro, workers=1)
+    .estagio("enriquecimento", _estagio_enriquecimento, workers=4)
+    .estagio("links", _estagio_links, workers=4)
+    .estagio("reescrita", _estagio_reescrita, workers=2)
+    .estagio("roteamento", _estagio_roteamento, workers=1)
+)
+
+def _evento_de(msg):
+    """Embrulha uma mensagem buscada com get_messages no mesmo evento que o handler recebe."""
+    evento = events.NewMessage.Event(msg)
+    # As entidades que já vieram na resposta evitam que o evento busque o chat de novo
+    evento._entities.update({utils.get_peer_id(e): e for e in (msg.chat, msg.sender) if e})
+    evento._set_client(client)
+    return evento
+
+async def recuperar_perdidas(marcas: dict):
+    """
+    Catch-up: busca em lotes as mensagens postadas nos canais monitorados depois da marca de
+    cada um (enquanto o userbot estava desconectado ou parado) e as coloca no pipeline, da
+    mais antiga para a mais nova. O que também chegar ao vivo é barrado pela chave (canal, ID).
+    """
+    limite = datetime.now(timezone.utc) - timedelta(seconds=CATCHUP_MAX_IDADE_SEGUNDOS)
+    total = 0
+    for chat_id in list(monitored_ids):
+        marca = marcas.get(chat_id)
+        if not marca:
+            continue  # Canal sem marca (novo): começa pelas mensagens ao vivo
+        perdidas = []
+        offset_id = 0
+        try:
+            while len(perdidas) < CATCHUP_MAX_MENSAGENS:
+                lote = await client.get_messages(chat_id, limit=CATCHUP_LOTE, min_id=marca, offset_id=offset_id)
+                recentes = [msg for msg in lote if msg.date >= limite]
+                perdidas.extend(recentes[:CATCHUP_MAX_MENSAGENS - len(perdidas)])
+                if len(lote) < CATCHUP_LOTE or len(recentes) < len(lote):
+                    break
+                offset_id = lote[-1].id
+        except Exception as e:
+            print(f"⚠️ Não foi possível recuperar mensagens perdidas de {monitored_ids_cache.get(chat_id, chat_id)}: {e}")
+        for msg in reversed(perdidas):
+            await _entrar_no_pipeline(_evento_de(msg), chat_id)
+        total += len(perdidas)
+    if total:
+        print(f"📬 Catch-up: {total} mensagem(ns) postada(s) durante a desconexão enviada(s) ao pipeline.")
+
+async def new_message_handler(event):
+    # Pré-filtro: chat fora do conjunto de IDs monitorados sai antes de qualquer outro trabalho
+    chat_id = event.chat_id
+    if chat_id not in monitored_ids:
+        if not canais_sem_id:
+            return
+        # Canal ainda sem ID resolvido: confere o username só pela entidade que já veio no update (sem rede)
+        chat_username = (getattr(event.chat, 'username', None) or '').lower()
+        if chat_username not in canais_sem_id:
+            return
+        monitored_ids_cache[chat_id] = chat_username
+        canais_sem_id.discard(chat_username)
+        _publicar_ids()
+    # O resto do fluxo roda nos estágios do pipeline; se a fila de entrada estiver cheia, espera aqui
+    await _entrar_no_pipeline(event, chat_id)
+
+# Workers de publicação: criados uma vez só, e não a cada reinício do start_monitoring
+_workers_publicacao = []
 
 async def start_monitoring():
-    source_channels = get_canais()
+    source_channels = await adb.get_canais()
     
-    # Inicia o worker em background
-    asyncio.create_task(worker_queue())
+    # Inicia os workers de publicação em background
+    if not _workers_publicacao:
+        for _ in range(_publicacao_workers()):
+            _workers_publicacao.append(asyncio.create_task(worker_queue()))
     
     print("⏳ Conectando o Userbot ao Telegram...")
     try:
@@ -255,451 +847,37 @@ async def start_monitoring():
     # Executa o auto-join
     await ensure_joined_channels()
     
-    print(f"✅ Monitoramento iniciado! Canais no Banco: {source_channels}")
+    # Índice das ofertas já publicadas: lê a última hora dos canais destino uma única vez
+    from config import get_target_channels
+    await offer_index.semear(client, get_target_channels())
     
-    # Cache para não processar o mesmo álbum (várias fotos) duas vezes
-    processed_grouped_ids = set()
-    # Cache para não processar a mesma mensagem duas vezes (ex: edições rápidas ou múltiplos triggers do Telethon)
-    processed_message_ids = set()
+    print(f"✅ Monitoramento iniciado! Canais no Banco: {source_channels}")
     
-    @client.on(events.NewMessage())
-    async def new_message_handler(event):
-        try:
-            # Verifica se o canal está na lista monitorada (vinda do banco de dados)
-            source_channels = get_canais()
-            
-            # Identificadores possíveis: @username ou ID numérico (como string ou int)
-            chat = await event.get_chat()
-            chat_title = getattr(chat, 'title', 'Sem Título')
-            chat_username = getattr(chat, 'username', 'N/A')
-            chat_id = event.chat_id
-            debug_log(f"Mensagem recebida de '{chat_title}' (@{chat_username}) [ID: {chat_id}]")
-            
-            is_monitored = False
-            
-            # Check por ID (mais confiável)
-            if chat_id in monitored_ids_cache:
-                is_monitored = True
-            else:
-                # Fallback por Username (caso o cache esteja desatualizado)
-                monitored_list = [normalize_channel(c).lower() for c in get_canais()]
-                if chat_username and chat_username.lower() in monitored_list:
-                    is_monitored = True
-                    # Aproveita para atualizar o cache
-                    monitored_ids_cache[chat_id] = chat_username.lower()
-                elif str(chat_id) in monitored_list:
-                    is_monitored = True
-                
-            if not is_monitored:
-                return
-
-            print(f"🎯 MENSAGEM DE CANAL MONITORADO: '{chat_title}' (@{chat_username}) [ID: {chat_id}]")
-
-            
-
-            # Verifica se o bot está pausado globalmente
-            if get_config("pausado") == "1":
-                debug_log("Bot pausado globalmente.")
-                return
-                
-            # Verifica mensagens já processadas pelo ID exato
-            if event.message.id in processed_message_ids:
-                debug_log(f"Mensagem já processada ignorada (ID: {event.message.id})")
-                return
-            processed_message_ids.add(event.message.id)
-            if len(processed_message_ids) > 1000:
-                processed_message_ids.clear()
-                
-            # --- FILTRO DE MÍDIA (Urgente: Apenas Texto ou Foto) ---
-            if event.message.media:
-                from telethon.tl.types import MessageMediaPhoto
-                if not isinstance(event.message.media, MessageMediaPhoto):
-                    debug_log(f"🚫 Ignorado: Mídia do tipo '{type(event.message.media).__name__}' não permitida (Apenas fotos/texto).")
-                    return
-
-            # Verifica se a mensagem faz parte de um álbum já processado
-            if event.message.grouped_id:
-                if event.message.grouped_id in processed_grouped_ids:
-                    debug_log(f"Mensagem extra do mesmo álbum ignorada: {event.message.grouped_id}")
-                    return
-                processed_grouped_ids.add(event.message.grouped_id)
-                # Mantém o set pequeno
-                if len(processed_grouped_ids) > 500:
-                    processed_grouped_ids.clear()
-                
-            print("\n" + "="*50)
-            channel_name = chat_username or chat_id
-            print(f"🚨 Nova mensagem identificada no canal fonte: {channel_name}")
-            mensagem_texto = event.raw_text
-            
-            # Se a mensagem for só mídia ou mensagem vazia ignora
-            if not mensagem_texto and not event.message.media:
-                return
-
-            # Verifica keywords negativas
-            negative_keywords = get_negative_keywords()
-            if negative_keywords and mensagem_texto:
-                for n_kw in negative_keywords:
-                    if n_kw.lower() in mensagem_texto.lower():
-                        print(f"🚫 Ignorado: A mensagem contém a keyword negativa: '{n_kw}'")
-                        print(f"📝 Texto analisado (trecho): {mensagem_texto[:100]}...")
-                        return
-                
-            # Verifica as keywords (se a lista não for vazia)
-            keywords = get_keywords()
-            if keywords and mensagem_texto:
-                has_keyword = any(kw.lower() in mensagem_texto.lower() for kw in keywords)
-                if not has_keyword:
-                    matched_none = True
-                    print(f"⏭️ Ignorado: Nenhuma keyword encontrada. Texto analisado (trecho): {mensagem_texto[:100]}...")
-                    print(f"🔍 Keywords configuradas: {', '.join(keywords)}")
-                    return
-                else:
-                    found_kws = [kw for kw in keywords if kw.lower() in mensagem_texto.lower()]
-                    print(f"✅ Keywords encontradas: {', '.join(found_kws)}")
-                
-            # Verifica Preço Mínimo (Se houver $ / R$ no texto)
-            preco_min = float(get_config("preco_minimo") or "0")
-            if preco_min > 0:
-                # Busca valores obrigatoriamente procedidos por R$
-                valores_encontrados = re.findall(r'R\$\s?(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)', mensagem_texto)
-                if valores_encontrados:
-                    # Converte o primeiro valor achado pra float
-                    str_valor = valores_encontrados[0].replace('.', '').replace(',', '.')
-                    try:
-                        valor_num = float(str_valor)
-                        if valor_num < preco_min:
-                            print(f"🛑 Ignorado por Filtro de Preço: R${valor_num:.2f} é menor que mínimo R${preco_min:.2f}")
-                            return
-                    except:
-                        pass
-                
-            # --- DEDUPLICAÇÃO NOS CANAIS DESTINO ---
-            from config import get_target_channels
-            target_channels = get_target_channels()
-            
-            # Tenta buscar o título exato via IA para evitar falsos positivos
-            from rewriter import extrair_nome_produto
-            titulo_real = await extrair_nome_produto(mensagem_texto)
-            
-            link_match = re.search(r'(https?://[^\s]+)', mensagem_texto)
-            referencia = link_match.group(1).split('?')[0] if link_match else ""
-            
-            # Se a IA por algum motivo falhou em extrair um título claro
-            if not titulo_real or titulo_real == "Oferta Desconhecida":
-                if referencia:
-                    # Se tiver link mas não tiver titulo, tenta resgatar por scraping em último caso
-                    # Se for Shopee, tenta a API oficial primeiro para evitar block de scraper
-                    from affiliate import get_shopee_product_info
-                    shopee_info = None
-                    if "shopee.com.br" in referencia:
-                        shopee_info = await get_shopee_product_info(referencia)
-                    
-                    if shopee_info and shopee_info.get("title"):
-                        titulo_real = shopee_info["title"]
-                        print(f"✅ Titulo Shopee obtido via API: {titulo_real}")
-                    else:
-                        from scraper import fetch_product_metadata
-                        try:
-                            metadata = await fetch_product_metadata(referencia)
-                            if metadata and metadata.get("title"):
-                                titulo_real = metadata["title"].strip()
-                        except Exception as e:
-                            print(f"⚠️ Erro no scraper de fallback: {e}")
-                
-            # Se ainda assim não tiver, vai pra primeira linha
-            if not titulo_real or titulo_real == "Oferta Desconhecida":
-                if referencia:
-                    titulo_real = referencia
-                else:
-                    primeira_linha = mensagem_texto.split('\n')[0].strip()
-                    titulo_real = re.sub(r'[^\w\s]', '', primeira_linha).strip().lower()[:50]
-            
-            # Pega o primeiro valor R$ achado (ou 0 se não houver)
-            todos_precos = re.findall(r'R\$\s?(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)', mensagem_texto)
-            valor_referencia = todos_precos[0] if todos_precos else "0"
-            valor_referencia_limpo = valor_referencia.replace('.', '').replace(',', '.')
-            
-            # Busca no histórico recente dos canais destino
-            oferta_duplicada = False
-            canal_duplicado = ""
-            
-            for channel_target in target_channels:
-                print(f"🔍 Verificando duplicidade no canal de destino ({channel_target})... Buscando: '{titulo_real}' e 'R$ {valor_referencia}'")
-                try:
-                    # Retorna mensagens das últimas 1 hora (60 minutos) usando o telethon client iter_messages
-                    from datetime import datetime, timedelta, timezone
-                    time_threshold = datetime.now(timezone.utc) - timedelta(minutes=60)
-                    
-                    async for past_msg in client.iter_messages(channel_target, offset_date=datetime.now(timezone.utc)):
-                        if past_msg.date < time_threshold:
-                            break # Só checa a última hora
-                        
-                        if past_msg.text:
-                            # Limpa o texto passado e o titulo real pesquisado para fazer match case-insensitive e sem acentos de forma basica
-                            past_text_lower = past_msg.text.lower()
-                            titulo_pesquisa_lower = titulo_real.lower()
-                            
-                            # Precisa achar palavras-chave do título e o valor exato no post do canal destino
-                            # Dividimos o titulo real pesquisado em tokens
-                            tokens_titulo = [t for t in titulo_pesquisa_lower.split() if len(t) > 3]
-                            
-                            # Match 1: O valor numérico precisa estar no post
-                            valor_encontrado_historico = re.findall(r'R\$\s?(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)', past_text_lower)
-                            valores_historico_limpos = [v.replace('.', '').replace(',', '.') for v in valor_encontrado_historico]
-                            
-                            teve_match_valor = valor_referencia_limpo in valores_historico_limpos
-                            teve_match_titulo = False
-                            
-                            if tokens_titulo:
-                                matches = sum(1 for t in tokens_titulo if t in past_text_lower)
-                                # Se pelo menos 50% dos tokens do produto alvo estiverem no post destino
-                                if matches / len(tokens_titulo) >= 0.5:
-                                    teve_match_titulo = True
-                            else:
-                                 # Se o titulo for só uma short string (ou link), busca raw match
-                                 if titulo_pesquisa_lower in past_text_lower:
-                                      teve_match_titulo = True
-                                      
-                            if teve_match_valor and teve_match_titulo:
-                                oferta_duplicada = True
-                                canal_duplicado = channel_target
-                                print(f"🛑 Post ignorado: Exatamente este produto '{titulo_real}' por R$ {valor_referencia} já foi postado no canal de destino {channel_target} nos últimos 60 minutos.")
-                                break
-                    
-                    if oferta_duplicada:
-                        break # Não precisa checar outros canais se já achou duplicata em um
-                        
-                except Exception as e:
-                    print(f"⚠️ Erro ao verificar histórico do canal de destino {channel_target}: {e}")
-                
-            if oferta_duplicada:
-                admin_id_str = get_config("admin_id")
-                if admin_id_str:
-                    try:
-                        msg_info = f"🚫 **Post Ignorado por Duplicação no {canal_duplicado}**\nO produto *{titulo_real}* por R$ {valor_referencia} já foi anunciado pelo robô há menos de 60 minutos."
-                        await bot.send_message(chat_id=int(admin_id_str), text=msg_info, parse_mode="Markdown")
-                    except: pass
-                return
-
-            # --- NOTIFICAÇÃO ADMIN ---
-            admin_id_str = get_config("admin_id")
-            
-            # Tenta gerar o link da postagem original
-            source_url = ""
-            chat_username_for_link = getattr(event.chat, 'username', None)
-            if chat_username_for_link:
-                source_url = f"https://t.me/{chat_username_for_link}/{event.message.id}"
-            else:
-                source_url = f"https://t.me/c/{str(event.chat_id).replace('-100', '')}/{event.message.id}"
-                
-            if admin_id_str:
-                try:
-                    msg_info = f"🔎 **Nova oferta detectada!**\nCanal: `{getattr(event.chat, 'title', None) or chat_id}`\n📥 [Postagem Original]({source_url})\n⏳ Processando publicação..."
-                    await bot.send_message(chat_id=int(admin_id_str), text=msg_info, parse_mode="Markdown", disable_web_page_preview=True)
-                except Exception as e:
-                    print(f"Erro ao notificar admin sobre detecção: {e}")
-            
-            # --- FASE 0: Extrair Mídia (Telegram ou Scraper) ---
-            media_path = None
-            source_has_media = bool(event.message.media)
-            
-            # Tenta baixar a mídia do Telegram primeiro (fallback)
-            if source_has_media:
-                print("⏬ Baixando mídia do Telegram...")
-                media_path = await event.message.download_media(file="downloads/")
-                print(f"✅ Mídia do Telegram baixada: {media_path}")
-
-            # --- FASE 1: Extrair, Remover e Processar Links (Conversão e Expansão) ---
-            print("🔗 Processando links e substituindo por placeholders...")
-            
-            # Extrair links de botões (Inline Keyboard) do canal original
-            original_button_links = []
-            if event.message.reply_markup:
-                from telethon.tl.types import ReplyInlineMarkup, KeyboardButtonUrl
-                if isinstance(event.message.reply_markup, ReplyInlineMarkup):
-                    for row in event.message.reply_markup.rows:
-                        for button in row.buttons:
-                            if isinstance(button, KeyboardButtonUrl):
-                                original_button_links.append(button.url)
-                                print(f"🔘 Link de botão detectado: {button.url}")
-
-            # Identificar o primeiro link de produto para tentar pegar imagem limpa
-            primeiro_link_produto = None
-            all_source_urls = extract_urls(mensagem_texto) + original_button_links
-            if all_source_urls:
-                # Pega o primeiro link que pareça de uma loja
-                for l in all_source_urls:
-                    if any(store in l.lower() for store in ["amazon", "mercadolivre", "shopee", "magazineluiza", "casasbahia"]):
-                        primeiro_link_produto = l
-                        break
-
-            # Se achamos um link de produto, tentamos pegar a imagem limpa da loja
-            if primeiro_link_produto:
-                print(f"🔍 Tentando buscar imagem limpa da loja: {primeiro_link_produto}")
-                from affiliate import get_shopee_product_info
-                shopee_info = None
-                if "shopee.com.br" in primeiro_link_produto:
-                    shopee_info = await get_shopee_product_info(primeiro_link_produto)
-                
-                if shopee_info and shopee_info.get("image"):
-                    from scraper import download_image
-                    temp_clean_path = await download_image(shopee_info["image"])
-                    if temp_clean_path:
-                        print(f"📸 Imagem Shopee obtida via API: {temp_clean_path}")
-                        if media_path and os.path.exists(media_path):
-                            try: os.remove(media_path)
-                            except: pass
-                        media_path = temp_clean_path
-                else:
-                    from scraper import fetch_product_metadata
-                    try:
-                        # Expandir se necessário para o scraper funcionar melhor
-                        expanded_for_img = await expand_url(primeiro_link_produto)
-                        metadata = await fetch_product_metadata(expanded_for_img)
-                        if metadata and metadata.get("local_image_path"):
-                            temp_clean_path = metadata["local_image_path"]
-                            print(f"📸 Imagem limpa encontrada na loja: {temp_clean_path}")
-                            
-                            # Se baixou a limpa, prioriza ela sobre a do Telegram
-                            if media_path and os.path.exists(media_path):
-                                try:
-                                    os.remove(media_path)
-                                except: pass
-                            media_path = temp_clean_path
-                            print("✨ Usando imagem original do site (limpa de logos do concorrente).")
-                    except Exception as e:
-                        print(f"⚠️ Falha ao tentar buscar imagem limpa: {e}")
-
-            # Aplica a marca d'água (se houver imagem, seja do telegram ou do scraper)
-            if media_path and os.path.exists(media_path):
-                try:
-                    from watermark import apply_watermark
-                    media_path = apply_watermark(media_path)
-                    print("🖌️ Marca d'água aplicada à imagem final.")
-                except Exception as e:
-                    print(f"⚠️ Não foi possível aplicar marca d'água: {e}")
-
-            # Se houver links nos botões, vamos injetá-los no texto (no final) para que o bot os processe e crie nossos próprios botões
-            texto_para_processar = mensagem_texto
-            if original_button_links:
-                # Adiciona os links dos botões ao final do texto para garantir que sejam capturados
-                links_str = "\n".join(original_button_links)
-                texto_para_processar += f"\n{links_str}"
-                print(f"➕ {len(original_button_links)} links de botões adicionados ao texto para processamento.")
-
-            texto_com_placeholders, placeholder_map = await process_and_replace_links(texto_para_processar)
-            print(f"✅ {len(placeholder_map)} links encontrados no total.")
-
-            # --- FILTRO DE QUALIDADE: Validar se há links de compra reais ---
-            # Após o refatoramento para Whitelist no links.py, placeholder_map só terá:
-            # 1. Links de lojas válidos (convertidos)
-            # 2. None (para links bloqueados)
-            valid_buy_links = {p: url for p, url in placeholder_map.items() if url}
-            
-            if not valid_buy_links:
-                print("⏭️ Ignorado: Nenhum link de COMPRA válido encontrado (Apenas links de conteúdo ou vazios).")
-                # Se baixou mídia, limpa
-                if media_path and os.path.exists(media_path):
-                    os.remove(media_path)
-                return
-            
-            # --- FILTRO ADICIONAL: Palavras de "Conteúdo" sem indicação de oferta ---
-            palavras_filtro_conteudo = ["análise completa", "testei o", "vídeo novo", "inscreva-se", "meu canal"]
-            if any(p in mensagem_texto.lower() for p in palavras_filtro_conteudo) and len(valid_buy_links) < 1:
-                # Caso extremo onde o link de compra é camuflado mas o texto é claramente um ad de vídeo
-                print("⏭️ Ignorado: Texto identificado como promoção de conteúdo/vídeo.")
-                if media_path and os.path.exists(media_path):
-                    os.remove(media_path)
-                return
-
-            print(f"🛍️ {len(valid_buy_links)} links de compra reais identificados. Prosseguindo...")
-
-            
-            # --- FASE 2: Reescrever Texto com Gemini ---
-            print("🧠 Passando para o Gemini reescrever a copy...")
-            texto_reescrito = await reescrever_promocao(texto_com_placeholders)
-            
-            # --- FASE 3: Remontar o Texto Final Substituindo Placeholders ---
-            texto_final = texto_reescrito
-            
-            if placeholder_map:
-                for placeholder, final_url in placeholder_map.items():
-                    # Se o link original era da blacklist ou deu erro e for None, ignoramos a formatação ou deletamos o placeholder
-                    if final_url is None:
-                        texto_final = texto_final.replace(placeholder, "")
-                    else:
-                        botao_html = f"🛒 <a href='{final_url}'>Pegar promoção</a>"
-                        texto_final = texto_final.replace(placeholder, botao_html)
-                        
-            # Remove qualquer placeholder residual que o Gemini possa ter inventado
-            texto_final = re.sub(r'\[LINK_\d+\]', '', texto_final)
-                    
-            # --- FASE 3.5: Adicionar Assinatura Customizada ---
-            assinatura = get_config("assinatura")
-            if assinatura:
-                texto_final += f"\n\n{assinatura}"
-            
-            print("✅ Texto final pronto!")
-            
-            # --- FASE 4: Direcionamento (Aprovação, Fila ou Direto) ---
-            admin_id_str = get_config("admin_id")
-            if not admin_id_str:
-                print("⚠️ Admin ID não configurado no banco. O administrador precisa dar /start no bot.")
-                # Se não tem admin mas o bot deveria postar, vamos colocar na fila apenas se NÃO for manual
-                if get_config("aprovacao_manual") != "1":
-                    await post_queue.put((texto_final, media_path, None, source_url))
-                return
-
-            admin_id = int(admin_id_str)
-            msg_amostra = f"**NOVA OFERTA ENCONTRADA!**\n\n{texto_final}"
-
-            if get_config("aprovacao_manual") == "1":
-                # Lógica de aprovação manual
-                print(f"⚖️ Modo Aprovação Manual ativado. Enviando para o Admin {admin_id}...")
-                
-                # Salva a oferta para aprovação futura
-                ofertas_pendentes_admin.append({"texto": texto_final, "media": media_path, "source_url": source_url})
-                item_id = len(ofertas_pendentes_admin) - 1
-                
-                markup = InlineKeyboardMarkup(inline_keyboard=[
-                    [
-                        InlineKeyboardButton(text="✅ Postar", callback_data=f"aprovar_{item_id}"),
-                        InlineKeyboardButton(text="✏️ Editar", callback_data=f"editar_{item_id}"),
-                        InlineKeyboardButton(text="❌ Descartar", callback_data=f"recusar_{item_id}")
-                    ]
-                ])
-
-                if media_path:
-                    photo = FSInputFile(media_path)
-                    try:
-                        await bot.send_photo(chat_id=admin_id, photo=photo, caption=msg_amostra, reply_markup=markup, parse_mode="HTML")
-                    except Exception as e:
-                        # Se falhar o html
-                        await bot.send_photo(chat_id=admin_id, photo=photo, caption=msg_amostra[:1024], reply_markup=markup)
-                else:
-                    await bot.send_message(chat_id=admin_id, text=msg_amostra, reply_markup=markup, parse_mode="HTML", disable_web_page_preview=True)
-
-            else:
-                # Automático, joga na fila, o Worker dá o delay e posta
-                print("📥 Enviando oferta para a fila de publicação...")
-                await post_queue.put((texto_final, media_path, None, source_url))
-            
-        except Exception as e:
-            print(f"❌ Erro ao processar mensagem: {e}")
-            admin_id_str = get_config("admin_id")
-            if admin_id_str:
-                pass
+    pipeline_mensagens.iniciar()
+    # Marcas gravadas antes do reinício: o catch-up usa a foto de agora, antes das mensagens ao vivo avançarem
+    for chat_id, msg_id in (await adb.get_channel_watermarks()).items():
+        _marcas_canais[chat_id] = max(msg_id, _marcas_canais.get(chat_id, 0))
+    marcas = dict(_marcas_canais)
+
+    # Sai junto com esta execução: um reinício pelo run_task_with_retry não deixa handlers duplicados
+    client.add_event_handler(new_message_handler, events.NewMessage())
+    try:
+        asyncio.create_task(recuperar_perdidas(marcas))
 
-    # Loop de reconexão persistente para evitar quedas por [Errno 104] (Connection reset by peer)
-    while True:
-        try:
-            if not client.is_connected():
-                await client.connect()
-            await client.run_until_disconnected()
-        except Exception as connection_error:
-            print(f"⚠️ Aviso: Telethon desconectado. Reconectando em 10 segundos... Motivo: {connection_error}")
-            await asyncio.sleep(10)
+        # Loop de reconexão persistente para evitar quedas por [Errno 104] (Connection reset by peer)
+        while True:
+            try:
+                if not client.is_connected():
+                    marcas = dict(_marcas_canais)
+                    await client.connect()
+                    # O que foi postado enquanto estava desconectado entra pelo catch-up
+                    asyncio.create_task(recuperar_perdidas(marcas))
+                await client.run_until_disconnected()
+            except Exception as connection_error:
+                print(f"⚠️ Aviso: Telethon desconectado. Reconectando em 10 segundos... Motivo: {connection_error}")
+                await asyncio.sleep(10)
+    finally:
+        client.remove_event_handler(new_message_handler)
 
 async def handle_manual_post(text, media=None):
     # Lógica para posts manuais via Mini App
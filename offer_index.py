@@ -0,0 +1,146 @@
+"""
+Índice local das ofertas que o próprio bot publicou nos canais destino.
+
+Antes, cada mensagem recebida varria com iter_messages a última hora de todos os canais
+destino (uma ida à API do Telegram por mensagem, com risco de FloodWait). Agora o
+publish_deal registra aqui cada oferta publicada (tokens do texto, preços e ID do produto),
+o startup semeia o índice uma única vez com o histórico recente dos canais, e a checagem
+de duplicidade vira uma consulta em memória.
+"""
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import product_id
+from keyword_matcher import dobrar
+
+# Mesma janela da checagem antiga no histórico dos canais destino
+JANELA_SEGUNDOS = 3600
+
+_RE_PRECO = re.compile(r'R\$\s?(\d{1,3}(?:\.\d{3})*(?:,\d{2})?)')
+_RE_URL = re.compile(r'https?://\S+')
+_RE_TAG_HTML = re.compile(r'<[^<]+?>')
+_RE_PALAVRA = re.compile(r'\w+')
+
+@dataclass(eq=False)
+class OfertaIndexada:
+    ts: float
+    canal: str
+    texto: str          # Sem acento, minúsculo e sem URLs
+    tokens: frozenset
+    precos: frozenset   # Valores R$ normalizados ("1299.90")
+    produto_id: Optional[str] = None
+
+_ofertas = deque()  # Em ordem de publicação, para expirar pelo começo
+_por_preco = {}
+_por_produto = {}
+
+def normalizar_preco(valor: str) -> str:
+    """'1.299,90' -> '1299.90' (mesmo formato da checagem antiga)."""
+    return valor.replace('.', '').replace(',', '.')
+
+def extrair_precos(texto: str) -> list:
+    return [normalizar_preco(v) for v in _RE_PRECO.findall(texto or "")]
+
+def _limpar_texto(texto: str) -> str:
+    return dobrar(_RE_URL.sub(' ', _RE_TAG_HTML.sub('', texto or "")))
+
+def _tokens_titulo(titulo: str) -> list:
+    return [t for t in dobrar(titulo).split() if len(t) > 3]
+
+def _expirar(agora: float):
+    limite = agora - JANELA_SEGUNDOS
+    while _ofertas and _ofertas[0].ts < limite:
+        oferta = _ofertas.popleft()
+        for preco in oferta.precos:
+            lista = _por_preco.get(preco)
+            if lista:
+                lista.remove(oferta)
+                if not lista:
+                    del _por_preco[preco]
+        if oferta.produto_id and _por_produto.get(oferta.produto_id) is oferta:
+            del _por_produto[oferta.produto_id]
+
+def registrar(texto: str, canal: str, ts: float = None, produto_id: str = None):
+    """Indexa uma oferta publicada (chamado pelo publish_deal e pela semeadura do startup)."""
+    agora = time.time()
+    ts = agora if ts is None else ts
+    if ts < agora - JANELA_SEGUNDOS or not texto:
+        return
+    limpo = _limpar_texto(texto)
+    oferta = OfertaIndexada(
+        ts=ts,
+        canal=str(canal),
+        texto=limpo,
+        tokens=frozenset(_RE_PALAVRA.findall(limpo)),
+        precos=frozenset(extrair_precos(texto)),
+        produto_id=produto_id or product_id.do_texto(texto),
+    )
+    _expirar(agora)
+    # A semeadura vem do mais novo para o mais antigo: mantém a deque ordenada por ts
+    if _ofertas and ts < _ofertas[-1].ts:
+        indice = len(_ofertas)
+        while indice and _ofertas[indice - 1].ts > ts:
+            indice -= 1
+        _ofertas.insert(indice, oferta)
+    else:
+        _ofertas.append(oferta)
+    for preco in oferta.precos:
+        _por_preco.setdefault(preco, []).append(oferta)
+    if oferta.produto_id:
+        atual = _por_produto.get(oferta.produto_id)
+        if atual is None or atual.ts <= ts:
+            _por_produto[oferta.produto_id] = oferta
+
+def buscar_por_produto(produto_id: str, preco: str) -> Optional[OfertaIndexada]:
+    """Oferta publicada na janela com o mesmo ID de produto (product_id.py) e o mesmo preço."""
+    _expirar(time.time())
+    oferta = _por_produto.get(produto_id)
+    if oferta and preco in oferta.precos:
+        return oferta
+    return None
+
+def buscar_duplicada(titulo: str, preco: str, produto_id: str = None) -> Optional[OfertaIndexada]:
+    """
+    Oferta publicada na janela com o mesmo preço e o mesmo produto: mesmo ID de produto,
+    ou pelo menos metade das palavras (> 3 letras) do título no texto publicado.
+    """
+    if produto_id:
+        oferta = buscar_por_produto(produto_id, preco)
+        if oferta:
+            return oferta
+    else:
+        _expirar(time.time())
+    candidatas = _por_preco.get(preco)
+    if not candidatas:
+        return None
+    tokens = _tokens_titulo(titulo)
+    titulo_limpo = dobrar(titulo)
+    for oferta in reversed(candidatas):
+        if tokens:
+            # Comparação por trecho, como a antiga ('fone' casa com 'fones')
+            matches = sum(1 for t in tokens if t in oferta.tokens or t in oferta.texto)
+            if matches / len(tokens) >= 0.5:
+                return oferta
+        elif titulo_limpo and titulo_limpo in oferta.texto:
+            return oferta
+    return None
+
+async def semear(client, canais: list):
+    """Carrega uma única vez a última janela de posts dos canais destino (startup do userbot)."""
+    limite = datetime.now(timezone.utc) - timedelta(seconds=JANELA_SEGUNDOS)
+    total = 0
+    for canal in canais:
+        try:
+            async for msg in client.iter_messages(canal):
+                if msg.date < limite:
+                    break
+                if msg.text:
+                    registrar(msg.text, canal, ts=msg.date.timestamp())
+                    total += 1
+        except Exception as e:
+            print(f"⚠️ Não foi possível carregar o histórico do canal destino {canal}: {e}")
+    print(f"🗂️ Índice de ofertas publicadas semeado com {total} post(s) da última hora.")
@@ -0,0 +1,73 @@
+"""
+Ofertas aguardando aprovação manual do admin.
+
+Ficam na tabela pending_offers (não mais numa lista em memória): o id é estável, então os
+botões "Postar/Editar/Descartar" continuam funcionando depois de um reinício. Cada oferta
+expira após 'aprovacao_ttl_horas' (padrão 24h) e existe um limite de pendentes
+('aprovacao_max_pendentes', padrão 200); em ambos os casos a mídia associada é apagada.
+"""
+from typing import Optional
+
+import database_async as adb
+from database import get_config
+from publish_queue import OfertaPublicacao, descartar as descartar_oferta
+
+TTL_HORAS_PADRAO = 24
+MAX_PENDENTES_PADRAO = 200
+
+def _config_num(chave: str, padrao: float) -> float:
+    try:
+        return float(get_config(chave) or padrao)
+    except ValueError:
+        return padrao
+
+def _descartar_payloads(payloads: list) -> int:
+    for payload in payloads:
+        try:
+            descartar_oferta(OfertaPublicacao.from_json(payload))
+        except Exception as e:
+            print(f"⚠️ Erro ao apagar mídia de oferta pendente: {e}")
+    return len(payloads)
+
+async def adicionar(oferta: OfertaPublicacao) -> int:
+    """Guarda a oferta para aprovação e retorna o id usado nos botões."""
+    ttl = _config_num("aprovacao_ttl_horas", TTL_HORAS_PADRAO) * 3600
+    limite = int(_config_num("aprovacao_max_pendentes", MAX_PENDENTES_PADRAO))
+    offer_id, removidas = await adb.add_pending_offer(oferta.to_json(), ttl, limite)
+    if oferta.hash_texto:
+        # Já entra no cooldown: o mesmo texto repassado por outras fontes não gera outro pedido ao admin
+        await adb.add_to_history(oferta.hash_texto)
+    if removidas:
+        print(f"🧹 Limite de {limite} ofertas pendentes atingido: {len(removidas)} mais antiga(s) descartada(s).")
+        _descartar_payloads(removidas)
+    return offer_id
+
+async def obter(offer_id: int) -> Optional[OfertaPublicacao]:
+    payload = await adb.get_pending_offer(offer_id)
+    return OfertaPublicacao.from_json(payload) if payload else None
+
+async def editar_texto(offer_id: int, texto: str) -> Optional[OfertaPublicacao]:
+    oferta = await obter(offer_id)
+    if oferta is None:
+        return None
+    oferta.texto = texto
+    if not await adb.update_pending_offer(offer_id, oferta.to_json()):
+        return None
+    return oferta
+
+async def retirar(offer_id: int) -> Optional[OfertaPublicacao]:
+    """Remove a oferta da lista de pendentes (aprovação). Só um chamador consegue retirar."""
+    payload = await adb.take_pending_offer(offer_id)
+    return OfertaPublicacao.from_json(payload) if payload else None
+
+async def descartar(offer_id: int) -> bool:
+    """Recusa a oferta e apaga a mídia."""
+    oferta = await retirar(offer_id)
+    if oferta is None:
+        return False
+    descartar_oferta(oferta)
+    return True
+
+async def expirar_vencidas() -> int:
+    """Job de manutenção: remove as ofertas vencidas e as mídias delas."""
+    return _descartar_payloads(await adb.purge_expired_pending_offers())
@@ -0,0 +1,135 @@
+"""
+Pipeline em estágios, cada um com fila limitada e um grupo de workers.
+
+O handler do Telethon fazia o fluxo inteiro dentro do callback do update (filtros, IA,
+scraping, marca d'água, conversão de links, reescrita...), então um scraping lento da
+Shopee ou um retry do Gemini segurava todas as mensagens que vinham atrás. Agora o
+handler só coloca a mensagem na fila de entrada e cada estágio tem seus próprios workers:
+enquanto um espera a rede, os outros continuam andando.
+
+Cada estágio é uma função async que recebe o item e devolve o item (ou outro objeto)
+para o próximo estágio, ou None para descartar. As filas são limitadas: quando um estágio
+fica para trás, o anterior espera no put (contrapressão) em vez de acumular memória.
+
+Configuração (lida ao iniciar; valores vazios usam os padrões de cada estágio):
+    pipeline_workers_<estagio>   quantidade de workers do estágio
+    pipeline_fila_max            tamanho máximo de cada fila
+"""
+import asyncio
+import inspect
+from typing import Awaitable, Callable, Optional
+
+from database import get_config
+
+TAMANHO_FILA_PADRAO = 50
+
+class Estagio:
+    def __init__(self, nome: str, func: Callable[[object], Awaitable[object]], workers: int):
+        self.nome = nome
+        self.func = func
+        self.workers_padrao = workers
+        self.workers = workers
+        self.fila: Optional[asyncio.Queue] = None
+        self.processados = 0
+        self.descartados = 0
+        self.erros = 0
+
+def _config_int(chave: str, padrao: int) -> int:
+    try:
+        return max(int(get_config(chave) or padrao), 1)
+    except ValueError:
+        return padrao
+
+class Pipeline:
+    def __init__(self, nome: str, ao_falhar: Callable[[object], None] = None, ao_descartar: Callable[[object], None] = None):
+        self.nome = nome
+        self.estagios = []
+        # Chamado com o item quando um estágio levanta exceção (ex: apagar mídia já baixada)
+        self.ao_falhar = ao_falhar
+        # Chamado com o item quando um estágio o descarta (devolve None). Os dois podem ser async.
+        self.ao_descartar = ao_descartar
+        self._tarefas = []
+
+    def estagio(self, nome: str, func, workers: int = 1):
+        """Acrescenta um estágio no fim do pipeline."""
+        self.estagios.append(Estagio(nome, func, workers))
+        return self
+
+    @property
+    def iniciado(self) -> bool:
+        return bool(self._tarefas)
+
+    def iniciar(self):
+        """Cria as filas e os workers de todos os estágios (uma vez só)."""
+        if self.iniciado:
+            return
+        tamanho = _config_int("pipeline_fila_max", TAMANHO_FILA_PADRAO)
+        for estagio in self.estagios:
+            estagio.fila = asyncio.Queue(maxsize=tamanho)
+            estagio.workers = _config_int(f"pipeline_workers_{estagio.nome}", estagio.workers_padrao)
+        for indice, estagio in enumerate(self.estagios):
+            for _ in range(estagio.workers):
+                self._tarefas.append(asyncio.create_task(self._worker(indice)))
+        resumo = ", ".join(f"{e.nome}×{e.workers}" for e in self.estagios)
+        print(f"🧵 Pipeline '{self.nome}' iniciado: {resumo} (filas de até {tamanho} itens).")
+
+    async def enviar(self, item):
+        """Entrada do pipeline. Espera se a fila do primeiro estágio estiver cheia."""
+        await self.estagios[0].fila.put(item)
+
+    async def _executar(self, estagio: Estagio, item):
+        try:
+            resultado = await estagio.func(item)
+        except Exception as e:
+            estagio.erros += 1
+            print(f"❌ Erro no estágio '{estagio.nome}' ao processar mensagem: {e}")
+            await self._chamar(self.ao_falhar, item)
+            return None
+        if resultado is None:
+            estagio.descartados += 1
+            await self._chamar(self.ao_descartar, item)
+        else:
+            estagio.processados += 1
+        return resultado
+
+    async def _chamar(self, callback, item):
+        if callback is None:
+            return
+        try:
+            resultado = callback(item)
+            if inspect.isawaitable(resultado):
+                await resultado
+        except Exception as e:
+            print(f"⚠️ Erro ao limpar item descartado: {e}")
+
+    async def _worker(self, indice: int):
+        estagio = self.estagios[indice]
+        proximo = self.estagios[indice + 1] if indice + 1 < len(self.estagios) else None
+        while True:
+            item = await estagio.fila.get()
+            try:
+                resultado = await self._executar(estagio, item)
+                if resultado is not None and proximo:
+                    await proximo.fila.put(resultado)  # Contrapressão: espera o próximo estágio ter espaço
+            finally:
+                # Só depois de repassar, para o esvaziar() não ver as duas filas vazias no meio da troca
+                estagio.fila.task_done()
+
+    def status(self) -> list:
+        """Ocupação das filas e contadores de cada estágio."""
+        return [
+            {
+                "estagio": e.nome,
+                "workers": e.workers,
+                "fila": e.fila.qsize() if e.fila else 0,
+                "processados": e.processados,
+                "descartados": e.descartados,
+                "erros": e.erros,
+            }
+            for e in self.estagios
+        ]
+
+    async def esvaziar(self):
+        """Aguarda todos os itens em andamento passarem por todos os estágios (usado nos testes)."""
+        for estagio in self.estagios:
+            await estagio.fila.join()
@@ -0,0 +1,100 @@
+"""
+Identidade canônica do produto a partir dos links da oferta.
+
+A maioria das ofertas traz um link que identifica o produto exatamente (ASIN da Amazon,
+MLB do Mercado Livre, loja/item da Shopee, item do AliExpress). Com o ID, a duplicidade é
+checada pela chave (produto, preço) sem chamar a IA nem comparar títulos; o Gemini só é
+usado quando nenhum link tem ID. Links curtos de loja (amzn.to, meli.la, s.shopee...) são
+expandidos antes, com cache e coalescência no links.expand_url.
+
+Várias fontes postando a mesma oferta ao mesmo tempo: a primeira mensagem reserva a chave
+(reservar) e as outras são descartadas antes de chegar ao LLM, mesmo antes de a primeira
+ser publicada e entrar no offer_index. Se a primeira não chegar a ser publicada, a reserva é
+solta (liberar) para as outras fontes da mesma oferta.
+"""
+import re
+import time
+from typing import Optional
+from urllib.parse import unquote
+
+# Quantos links de uma mensagem no máximo são expandidos para achar o ID
+MAX_LINKS_EXPANDIDOS = 3
+# Mesma janela do índice de ofertas publicadas (offer_index.JANELA_SEGUNDOS)
+RESERVA_SEGUNDOS = 3600
+
+_RE_URL = re.compile(r'https?://\S+')
+_PADROES = [
+    ("amazon", re.compile(r'amazon\.com(?:\.br)?/(?:[^\s?#]*/)?(?:dp|gp/product|exec/obidos/ASIN|aw/d)/([A-Z0-9]{10})(?![A-Z0-9])', re.I)),
+    ("mercadolivre", re.compile(r'(?:mercadoli[vb]re\.com(?:\.br)?|meli\.la)/.*?\b(MLB)-?(\d{6,})', re.I)),
+    ("shopee", re.compile(r'shopee\.com(?:\.br)?/(?:[^\s?#]*-i\.(\d+)\.(\d+)|(?:universal-link/)?product/(\d+)/(\d+))', re.I)),
+    ("shopee_qs", re.compile(r'shopee\.com(?:\.br)?/.*?[?&]itemid=(\d+).*?[?&]shopid=(\d+)', re.I)),
+    ("aliexpress", re.compile(r'aliexpress\.[a-z.]+/(?:[^\s?#]*/)?item/(\d+)', re.I)),
+    ("aliexpress_qs", re.compile(r'aliexpress\.[a-z.]+/.*?[?&]productIds=(\d+)', re.I)),
+]
+
+def extrair(url: str) -> Optional[str]:
+    """ID canônico do produto na URL (ex: 'amazon:B0ABC12345', 'shopee:123.456') ou None."""
+    if not url:
+        return None
+    url = unquote(url)
+    for nome, padrao in _PADROES:
+        match = padrao.search(url)
+        if not match:
+            continue
+        grupos = [g for g in match.groups() if g]
+        if nome == "amazon":
+            return f"amazon:{grupos[0].upper()}"
+        if nome == "mercadolivre":
+            return f"mercadolivre:MLB{grupos[1]}"
+        if nome == "shopee":
+            return f"shopee:{grupos[0]}.{grupos[1]}"
+        if nome == "shopee_qs":
+            return f"shopee:{grupos[1]}.{grupos[0]}"  # itemid vem antes de shopid na query
+        return f"aliexpress:{grupos[0]}"
+    return None
+
+def do_texto(texto: str) -> Optional[str]:
+    """Primeiro ID encontrado nas URLs do texto, sem acessar a rede."""
+    for url in _RE_URL.findall(texto or ""):
+        produto = extrair(url)
+        if produto:
+            return produto
+    return None
+
+async def identificar(texto: str) -> Optional[str]:
+    """ID do produto da oferta, expandindo os links curtos de loja quando preciso."""
+    from links import expand_url, extract_urls, is_store_link
+    urls = extract_urls(texto or "")
+    for url in urls:
+        produto = extrair(url)
+        if produto:
+            return produto
+    for url in [u for u in urls if is_store_link(u)][:MAX_LINKS_EXPANDIDOS]:
+        produto = extrair(await expand_url(url))
+        if produto:
+            return produto
+    return None
+
+_reservas = {}  # (produto, preço) -> instante da reserva
+
+def reservar(produto: str, preco: str) -> bool:
+    """
+    Marca (produto, preço) como aceito por esta instância. Retorna False se outra mensagem
+    já reservou a mesma chave dentro da janela (é a mesma oferta vinda de outra fonte).
+    """
+    agora = time.time()
+    for chave in [c for c, ts in _reservas.items() if ts < agora - RESERVA_SEGUNDOS]:
+        del _reservas[chave]
+    chave = (produto, preco)
+    if chave in _reservas:
+        return False
+    _reservas[chave] = agora
+    return True
+
+def liberar(produto: str, preco: str = None):
+    """
+    Solta a reserva de uma oferta que não vai ser publicada (descartada no pipeline, recusada
+    pelo admin, expirada ou morta na fila). Sem o preço, solta todas as do produto.
+    """
+    for chave in [c for c in _reservas if c[0] == produto and (preco is None or c[1] == preco)]:
+        del _reservas[chave]
@@ -0,0 +1,173 @@
+"""
+Fila persistente de publicação (substitui o antigo asyncio.Queue do monitor).
+
+As ofertas vão para a tabela publish_jobs; o worker do monitor.py consome com
+proximo_job(). Se o processo reiniciar no meio (/reiniciar, /api/restart, redeploy),
+o job volta a ficar disponível quando o prazo de visibilidade vence e a publicação
+continua de onde parou: se a oferta já tinha saído no canal (target_url gravado),
+ela não é postada de novo.
+
+Cada claim incrementa as tentativas do job, e esse número é a reserva do worker: renovar,
+checkpoint, concluir e falhar só valem para a mesma tentativa ainda 'processando'. O worker
+renova a reserva antes de cada etapa lenta; se ela venceu e outro worker pegou o job,
+renovar levanta ReservaPerdida e o primeiro para sem mexer no job nem na mídia.
+
+Agendamento: cada oferta entra na tabela já com o horário de publicação (agora +
+delay_minutos), e a fila é consumida em ordem desse horário (índice em status,
+disponivel_em). O delay vira a espera de cada oferta e deixa de ser um sleep no worker
+antes de cada item, que limitava a fila inteira a uma oferta por janela de delay. Sem nada
+vencido, o worker dorme até o próximo vencimento (ou até chegar job novo). Opcionalmente,
+intervalo_publicacao_segundos garante um espaço mínimo entre duas liberações.
+"""
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+import database_async as adb
+
+# Tempo que um job fica reservado para o worker antes de poder ser retomado (renovado a cada etapa)
+VISIBILIDADE_SEGUNDOS = 600
+MAX_TENTATIVAS = 5
+# Espera antes de tentar de novo: 1, 2, 4, 8... minutos
+ESPERA_BASE_SEGUNDOS = 60
+# Sem aviso de job novo, o worker ainda confere a tabela nesse intervalo (jobs retomados/reagendados)
+INTERVALO_CONSULTA = 15
+
+@dataclass
+class OfertaPublicacao:
+    """Oferta pronta para publicar (texto final já com links e assinatura)."""
+    texto: str
+    media_path: Optional[str] = None
+    source_url: Optional[str] = None
+    origem: str = "monitor"  # 'monitor', 'aprovacao' ou 'manual'
+    produto_id: Optional[str] = None  # ID canônico (product_id.py), vai para o offer_index ao publicar
+    hash_texto: Optional[str] = None  # Hash do texto da fonte (monitor.py), entra no histórico ao ir para a fila
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, payload: str) -> "OfertaPublicacao":
+        dados = json.loads(payload)
+        return cls(**{k: v for k, v in dados.items() if k in cls.__dataclass_fields__})
+
+@dataclass
+class JobPublicacao:
+    id: int
+    oferta: OfertaPublicacao
+    tentativas: int  # Também identifica a reserva deste worker
+    target_url: Optional[str] = None  # Preenchido quando a oferta já saiu no canal
+
+class ReservaPerdida(Exception):
+    """O prazo de visibilidade venceu e o job foi pego por outro worker."""
+
+_novo_job = asyncio.Event()
+# Só um worker por vez espera a próxima liberação: é ele quem respeita o intervalo mínimo
+_trava_liberacao = asyncio.Lock()
+_ultima_liberacao = 0.0
+
+def _config_segundos(chave: str, multiplicador: float = 1) -> float:
+    from database import get_config
+    try:
+        return max(float(get_config(chave) or "0"), 0) * multiplicador
+    except ValueError:
+        return 0
+
+async def enqueue(oferta: OfertaPublicacao, atraso: float = None) -> int:
+    """Grava a oferta na fila com o horário de publicação (padrão: agora + delay_minutos) e acorda o worker."""
+    if atraso is None:
+        atraso = _config_segundos("delay_minutos", 60)
+    job_id = await adb.enqueue_publish_job(oferta.to_json(), atraso)
+    if oferta.hash_texto:
+        # Cooldown do texto repetido só a partir daqui (ou de pending_offers.adicionar, na aprovação
+        # manual): ofertas descartadas no caminho não contam
+        await adb.add_to_history(oferta.hash_texto)
+    if atraso > 0:
+        print(f"⏳ Oferta agendada para daqui a {round(atraso / 60, 1):g} minuto(s) (job #{job_id}).")
+    _novo_job.set()
+    return job_id
+
+def apagar_midia(oferta: OfertaPublicacao):
+    if oferta.media_path and os.path.exists(oferta.media_path):
+        try:
+            os.remove(oferta.media_path)
+        except Exception as e:
+            print(f"Não foi possível apagar arquivo temporário: {e}")
+
+def descartar(oferta: OfertaPublicacao):
+    """Oferta que não vai ser publicada: apaga a mídia e solta a reserva do produto (product_id.py)."""
+    apagar_midia(oferta)
+    if oferta.produto_id:
+        import product_id
+        product_id.liberar(oferta.produto_id)
+
+async def _aguardar_proximo_vencimento():
+    """Dorme até o próximo job vencer, chegar um job novo ou passar o INTERVALO_CONSULTA."""
+    vencimento = await adb.next_publish_job_due()
+    espera = INTERVALO_CONSULTA
+    if vencimento is not None:
+        espera = min(max(vencimento - time.time(), 0), INTERVALO_CONSULTA)
+    try:
+        await asyncio.wait_for(_novo_job.wait(), timeout=espera)
+    except asyncio.TimeoutError:
+        pass
+
+async def proximo_job() -> JobPublicacao:
+    """Aguarda até existir um job vencido (e o intervalo mínimo passar) e o reserva para este worker."""
+    global _ultima_liberacao
+    async with _trava_liberacao:
+        while True:
+            espera = _ultima_liberacao + _config_segundos("intervalo_publicacao_segundos") - time.monotonic()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            # Limpa antes de consultar: um enqueue durante a consulta não se perde
+            _novo_job.clear()
+            job = await adb.claim_publish_job(VISIBILIDADE_SEGUNDOS, MAX_TENTATIVAS)
+            if job is None:
+                await _aguardar_proximo_vencimento()
+                continue
+            oferta = OfertaPublicacao.from_json(job["payload"])
+            if job["morto"]:
+                print(f"💀 Job de publicação #{job['id']} esgotou as tentativas e foi descartado.")
+                descartar(oferta)
+                continue
+            if job["tentativas"] > 1:
+                print(f"♻️ Retomando job de publicação #{job['id']} (tentativa {job['tentativas']}).")
+            _ultima_liberacao = time.monotonic()
+            return JobPublicacao(job["id"], oferta, job["tentativas"], job["target_url"])
+
+async def renovar(job: JobPublicacao):
+    """Estende a reserva antes de uma etapa lenta; levanta ReservaPerdida se o job já é de outro worker."""
+    if not await adb.renew_publish_job(job.id, job.tentativas, VISIBILIDADE_SEGUNDOS):
+        raise ReservaPerdida(f"job #{job.id} (tentativa {job.tentativas}) foi retomado por outro worker")
+
+async def marcar_publicado(job: JobPublicacao, target_url: str):
+    """Checkpoint: a oferta já saiu no canal, uma retomada não deve publicar de novo."""
+    job.target_url = target_url
+    if not await adb.checkpoint_publish_job(job.id, job.tentativas, target_url, VISIBILIDADE_SEGUNDOS):
+        raise ReservaPerdida(f"job #{job.id} (tentativa {job.tentativas}) foi retomado por outro worker")
+
+async def concluir(job: JobPublicacao) -> bool:
+    """Marca o job como concluído e apaga a mídia. Se a reserva foi perdida, a mídia fica para quem a tem."""
+    if not await adb.complete_publish_job(job.id, job.tentativas):
+        print(f"⚠️ Job de publicação #{job.id} já foi retomado por outro worker; mídia mantida.")
+        return False
+    apagar_midia(job.oferta)
+    return True
+
+async def falhar(job: JobPublicacao, erro: str) -> bool:
+    """Devolve o job para a fila com espera exponencial ou manda para a fila de mortos."""
+    espera = ESPERA_BASE_SEGUNDOS * (2 ** (job.tentativas - 1))
+    morto = await adb.fail_publish_job(job.id, job.tentativas, erro, MAX_TENTATIVAS, espera)
+    if morto is None:
+        print(f"⚠️ Falha do job de publicação #{job.id} ignorada: ele já foi retomado por outro worker ({erro}).")
+        return False
+    if morto:
+        print(f"💀 Job de publicação #{job.id} falhou {job.tentativas}x e foi para a fila de mortos: {erro}")
+        descartar(job.oferta)
+    else:
+        print(f"🔁 Job de publicação #{job.id} falhou ({erro}). Nova tentativa em {espera // 60} min.")
+    return morto
@@ -14,10 +14,16 @@ except Exception as e:
     print(f"Erro ao inicializar o Bot: {e}")
     bot = None
 
-async def send_with_retry(coro_maker):
-    """Executa enviando a mensagem com retry automatico pra FloodWait e erros de conexao."""
+async def send_with_retry(coro_maker, chat_id=None):
+    """
+    Executa enviando a mensagem com retry automatico pra FloodWait e erros de conexao.
+    Com chat_id, cada tentativa espera a vez no limite de envio do chat (rate_limiter.py).
+    """
+    import rate_limiter
     for attempt in range(4): # Aumentado para 4 tentativas (original 3 + 1 final)
         try:
+            if chat_id is not None:
+                await rate_limiter.telegram(chat_id)
             return await coro_maker()
         except Exception as e:
             err_str = str(e).lower()
@@ -40,11 +46,14 @@ async def send_with_retry(coro_maker):
                 # Outros erros (ex: Bad Request) nao devem ser repetidos cegamente
                 raise e
                 
+    if chat_id is not None:
+        await rate_limiter.telegram(chat_id)
     return await coro_maker()
 
-async def publish_deal(text: str, media_path: str | None = None, reply_markup = None):
+async def publish_deal(text: str, media_path: str | None = None, reply_markup = None, produto_id: str | None = None):
     """
     Publica a oferta processada em todos os canais configurados.
+    produto_id (product_id.py) entra no índice de ofertas publicadas usado na deduplicação.
     """
     from config import get_target_channels
     target_channels = get_target_channels()
@@ -57,9 +66,7 @@ async def publish_deal(text: str, media_path: str | None = None, reply_markup =
         print("[ERR] Nenhum canal de destino configurado.")
         return None
 
-    first_success_url = None
-
-    for channel_id in target_channels:
+    async def publicar_no_canal(channel_id):
         try:
             print(f"[Publisher] Publicando oferta no canal {channel_id}...")
             
@@ -69,28 +76,28 @@ async def publish_deal(text: str, media_path: str | None = None, reply_markup =
             
             if media_path and not is_long_text and os.path.exists(media_path):
                 try:
-                    sent_msg = await send_with_retry(lambda: bot.send_photo(chat_id=channel_id, photo=FSInputFile(media_path), caption=text, parse_mode="HTML", reply_markup=reply_markup))
+                    sent_msg = await send_with_retry(lambda: bot.send_photo(chat_id=channel_id, photo=FSInputFile(media_path), caption=text, parse_mode="HTML", reply_markup=reply_markup), chat_id=channel_id)
                 except Exception as e:
                     err_str = str(e).lower()
                     if "parse" in err_str or "entities" in err_str or "bad request" in err_str:
                         print(f"[Telegram] Erro de HTML em {channel_id}: {e}. Tentando sem formatacao...")
-                        sent_msg = await send_with_retry(lambda: bot.send_photo(chat_id=channel_id, photo=FSInputFile(media_path), caption=text, reply_markup=reply_markup))
+                        sent_msg = await send_with_retry(lambda: bot.send_photo(chat_id=channel_id, photo=FSInputFile(media_path), caption=text, reply_markup=reply_markup), chat_id=channel_id)
                     else:
                         raise e
             else:
                 photo_msg = None
                 if media_path and os.path.exists(media_path):
-                    photo_msg = await send_with_retry(lambda: bot.send_photo(chat_id=channel_id, photo=FSInputFile(media_path)))
+                    photo_msg = await send_with_retry(lambda: bot.send_photo(chat_id=channel_id, photo=FSInputFile(media_path)), chat_id=channel_id)
                     await asyncio.sleep(0.5)
                 
                 try:
-                    sent_msg = await send_with_retry(lambda: bot.send_message(chat_id=channel_id, text=text, disable_web_page_preview=True, parse_mode="HTML", reply_markup=reply_markup))
+                    sent_msg = await send_with_retry(lambda: bot.send_message(chat_id=channel_id, text=text, disable_web_page_preview=True, parse_mode="HTML", reply_markup=reply_markup), chat_id=channel_id)
                 except Exception as e:
                     err_str = str(e).lower()
                     if "parse" in err_str or "entities" in err_str or "bad request" in err_str:
                         print(f"[Telegram] Erro de HTML no texto em {channel_id}: {e}. Tentando sem formatacao...")
                         try:
-                            sent_msg = await send_with_retry(lambda: bot.send_message(chat_id=channel_id, text=text, disable_web_page_preview=True, reply_markup=reply_markup))
+                            sent_msg = await send_with_retry(lambda: bot.send_message(chat_id=channel_id, text=text, disable_web_page_preview=True, reply_markup=reply_markup), chat_id=channel_id)
                         except Exception as fallback_e:
                             if photo_msg:
                                 try: await bot.delete_message(chat_id=channel_id, message_id=photo_msg.message_id)
@@ -104,19 +111,25 @@ async def publish_deal(text: str, media_path: str | None = None, reply_markup =
                 
             print(f"[OK] Oferta publicada com sucesso no canal {channel_id}!")
             
-            # Gera URL de retorno (usa apenas a primeira de sucesso para o dashboard)
-            if not first_success_url:
-                target_url = ""
-                if str(channel_id).startswith("-100"):
-                    target_url = f"https://t.me/c/{str(channel_id).replace('-100', '')}/{sent_msg.message_id}"
-                elif str(channel_id).startswith("@"):
-                    target_url = f"https://t.me/{str(channel_id).replace('@', '')}/{sent_msg.message_id}"
-                else:
-                    target_url = f"https://t.me/{channel_id}/{sent_msg.message_id}"
-                first_success_url = target_url
+            # Entra no índice local usado pela checagem de duplicidade (sem varrer o canal depois)
+            try:
+                import offer_index
+                offer_index.registrar(text, channel_id, produto_id=produto_id)
+            except Exception as e:
+                print(f"[WARN] Erro ao indexar oferta publicada: {e}")
+            
+            # Gera URL de retorno
+            if str(channel_id).startswith("-100"):
+                return f"https://t.me/c/{str(channel_id).replace('-100', '')}/{sent_msg.message_id}"
+            elif str(channel_id).startswith("@"):
+                return f"https://t.me/{str(channel_id).replace('@', '')}/{sent_msg.message_id}"
+            return f"https://t.me/{channel_id}/{sent_msg.message_id}"
                 
         except Exception as e:
             print(f"[ERR] Erro ao publicar no canal {channel_id}: {e}")
-            continue # Tenta o próximo canal
+            return None # Os outros canais seguem normalmente
 
-    return first_success_url
+    # Canais em paralelo: quem dita o ritmo é o limite de envio de cada um (rate_limiter.py)
+    urls = await asyncio.gather(*[publicar_no_canal(channel_id) for channel_id in target_channels])
+    # Usa apenas a primeira de sucesso (na ordem dos canais) para o dashboard
+    return next((url for url in urls if url), None)
@@ -0,0 +1,62 @@
+"""
+Limites de envio por destino (token buckets) para a publicação em paralelo.
+
+Com vários workers de publicação, quem segura o ritmo não é mais a execução em série e
+sim os limites de cada destino:
+    Telegram (Bot API)  ~30 mensagens/s no total do bot e ~20/min por grupo ou canal
+    Green-API           um envio a cada 1,5 s (o mesmo intervalo que já era usado entre grupos)
+
+Cada destino tem um balde que enche na taxa do limite até a capacidade (rajada). Quem pede
+mais fichas do que o balde tem fica "devendo": o saldo fica negativo e quem vier depois
+espera o tempo de repor a dívida. Assim as esperas saem em ordem de chegada, sem laço de tentativa,
+e um pedido maior que a capacidade (ex: vários grupos do WhatsApp de uma vez) também funciona.
+"""
+import asyncio
+import time
+
+TELEGRAM_GLOBAL_POR_SEGUNDO = 30
+TELEGRAM_CHAT_POR_MINUTO = 20
+TELEGRAM_CHAT_RAJADA = 3
+WHATSAPP_INTERVALO_SEGUNDOS = 1.5
+
+class TokenBucket:
+    def __init__(self, taxa: float, capacidade: float):
+        self.taxa = taxa              # Fichas por segundo
+        self.capacidade = capacidade  # Máximo acumulado (tamanho da rajada)
+        self.fichas = capacidade
+        self.atualizado = time.monotonic()
+
+    def reservar(self, custo: float = 1) -> float:
+        """
+        Tira as fichas na hora e devolve quantos segundos esperar até poder começar. Um pedido
+        maior que a capacidade começa quando o balde enche e deixa a dívida para o próximo.
+        """
+        agora = time.monotonic()
+        self.fichas = min(self.capacidade, self.fichas + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+        espera = max(min(custo, self.capacidade) - self.fichas, 0) / self.taxa
+        self.fichas -= custo
+        return espera
+
+    async def adquirir(self, custo: float = 1):
+        espera = self.reservar(custo)
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+_telegram_global = TokenBucket(TELEGRAM_GLOBAL_POR_SEGUNDO, TELEGRAM_GLOBAL_POR_SEGUNDO)
+_telegram_chats = {}
+_whatsapp = TokenBucket(1 / WHATSAPP_INTERVALO_SEGUNDOS, 1)
+
+async def telegram(chat_id, custo: int = 1):
+    """Espera a vez de enviar `custo` mensagens ao chat (limite do chat e limite global do bot)."""
+    balde = _telegram_chats.get(str(chat_id))
+    if balde is None:
+        balde = _telegram_chats[str(chat_id)] = TokenBucket(TELEGRAM_CHAT_POR_MINUTO / 60, TELEGRAM_CHAT_RAJADA)
+    # Reserva nos dois ao mesmo tempo e espera o maior prazo
+    espera = max(balde.reservar(custo), _telegram_global.reservar(custo))
+    if espera > 0:
+        await asyncio.sleep(espera)
+
+async def whatsapp(envios: int = 1):
+    """Espera a vez de fazer `envios` chamadas à Green-API."""
+    await _whatsapp.adquirir(envios)
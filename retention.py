@@ -0,0 +1,130 @@
+"""
+Retenção e compactação: mantém o banco e as pastas de mídia com tamanho limitado.
+
+Roda como job do maintenance.py. As políticas vêm da config (valor 0 desliga a política):
+    retencao_posts_dias       (padrão 0)   posts do dashboard e as imagens deles em static/uploads
+    retencao_links_dias       (padrão 0)   links curtos sem post e sem clique no período
+    retencao_cliques_dias     (padrão 30)  detalhe dos cliques (click_events já agregados e clicks_hourly)
+    retencao_jobs_dias        (padrão 7)   jobs concluídos/mortos da fila de publicação
+    retencao_downloads_horas  (padrão 48)  arquivos temporários em downloads/ sem oferta que os use
+
+Os totais e o gráfico diário de cliques (clicks_daily) nunca são apagados. As remoções são
+feitas em lotes, com uma pausa entre eles para não segurar o banco, e no fim o espaço livre
+volta para o disco com VACUUM incremental. Arquivos em static/uploads que nenhum post usa
+(órfãos) também são apagados.
+"""
+import asyncio
+import os
+import time
+
+import database_async as adb
+from database import get_config
+from publish_queue import OfertaPublicacao
+
+UPLOADS_DIR = os.path.join("static", "uploads")
+DOWNLOADS_DIR = "downloads"
+
+RETENCAO_LOTE = 500
+PAUSA_ENTRE_LOTES = 0.05
+# Arquivo recém-criado pode ainda não ter o post/job gravado: só é órfão depois disso
+CARENCIA_ORFAOS_SEGUNDOS = 3600
+
+POLITICAS_PADRAO = {
+    "retencao_posts_dias": 0,  # Apaga posts e imagens: só com opt-in explícito do admin
+    "retencao_links_dias": 0,
+    "retencao_cliques_dias": 30,
+    "retencao_jobs_dias": 7,
+    "retencao_downloads_horas": 48,
+}
+
+def _politica(chave: str) -> float:
+    try:
+        return max(float(get_config(chave) or POLITICAS_PADRAO[chave]), 0)
+    except ValueError:
+        return POLITICAS_PADRAO[chave]
+
+async def _em_lotes(func, dias: float) -> list:
+    """Chama a função de retenção até o lote vir incompleto. Retorna os itens (ou contagens) de cada lote."""
+    resultados = []
+    while True:
+        resultado = await func(dias, RETENCAO_LOTE)
+        resultados.append(resultado)
+        if (len(resultado) if isinstance(resultado, list) else resultado) < RETENCAO_LOTE:
+            return resultados
+        await asyncio.sleep(PAUSA_ENTRE_LOTES)
+
+def _normalizar(caminho: str) -> str:
+    return os.path.normcase(os.path.abspath(caminho))
+
+def _apagar_arquivo(caminho: str) -> bool:
+    try:
+        os.remove(caminho)
+        return True
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        print(f"⚠️ Retenção: não foi possível apagar {caminho}: {e}")
+        return False
+
+def _podar_pasta(pasta: str, em_uso: set, idade_minima: float) -> int:
+    """Apaga os arquivos da pasta que não estão em uso e são mais velhos que idade_minima (segundos)."""
+    if not os.path.isdir(pasta):
+        return 0
+    limite = time.time() - idade_minima
+    removidos = 0
+    with os.scandir(pasta) as entradas:
+        for entrada in entradas:
+            try:
+                if not entrada.is_file() or entrada.stat().st_mtime > limite:
+                    continue
+            except OSError:
+                continue
+            if _normalizar(entrada.path) not in em_uso and _apagar_arquivo(entrada.path):
+                removidos += 1
+    return removidos
+
+async def _midias_em_uso() -> set:
+    refs = await adb.get_media_references()
+    em_uso = {_normalizar(p) for p in refs["imagens"]}
+    for payload in refs["payloads"]:
+        try:
+            media_path = OfertaPublicacao.from_json(payload).media_path
+        except Exception:
+            continue
+        if media_path:
+            em_uso.add(_normalizar(media_path))
+    return em_uso
+
+async def aplicar_retencao() -> int:
+    """Job de manutenção: aplica todas as políticas e compacta o banco. Retorna quantos itens saíram."""
+    total = 0
+
+    dias = _politica("retencao_posts_dias")
+    if dias:
+        for imagens in await _em_lotes(adb.purge_old_posts, dias):
+            total += len(imagens)
+            # A imagem só sai junto com o post se estiver na pasta do dashboard (não mexe em assets)
+            pasta = _normalizar(UPLOADS_DIR)
+            for caminho in imagens:
+                if caminho and os.path.dirname(_normalizar(caminho)) == pasta:
+                    _apagar_arquivo(caminho)
+
+    for chave, func in (
+        ("retencao_links_dias", adb.purge_old_short_links),
+        ("retencao_cliques_dias", adb.purge_click_details),
+        ("retencao_jobs_dias", adb.purge_finished_publish_jobs),
+    ):
+        dias = _politica(chave)
+        if dias:
+            total += sum(await _em_lotes(func, dias))
+
+    em_uso = await _midias_em_uso()
+    total += _podar_pasta(UPLOADS_DIR, em_uso, CARENCIA_ORFAOS_SEGUNDOS)
+    horas = _politica("retencao_downloads_horas")
+    if horas:
+        total += _podar_pasta(DOWNLOADS_DIR, em_uso, max(horas * 3600, CARENCIA_ORFAOS_SEGUNDOS))
+
+    paginas = await adb.compact_storage()
+    if paginas:
+        print(f"🗜️ Retenção: {paginas} página(s) livre(s) devolvida(s) ao disco.")
+    return total
@@ -0,0 +1,144 @@
+"""
+Snapshot em memória do /api/status.
+
+O dashboard consulta o status a cada 2s por aba aberta. Em vez de ir ao banco a cada
+requisição, o snapshot guarda os números e a resposta JSON já serializada:
+- cliques: somados direto no snapshot a cada redirect (increment_click);
+- canais, keywords, links recentes e fila: marcados como "sujos" quando uma função de
+  escrita do database_async roda, e só essa parte é relida na próxima consulta;
+- config (pausado, aprovação, only_admins): atualizada pelo listener de config.
+Sem mudanças, a resposta sai pronta da memória. O maintenance.py marca tudo como sujo
+periodicamente para pegar alterações de outras instâncias (backend Postgres compartilhado).
+"""
+import asyncio
+import json
+from typing import Optional
+
+import database_async as adb
+from database import add_config_listener, get_config
+
+LINKS_RECENTES = 5
+
+async def _contar_canais():
+    return {"canais_count": len(await adb.get_canais())}
+
+async def _contar_keywords():
+    return {"kw_count": len(await adb.get_keywords())}
+
+async def _contar_negativas():
+    return {"nkw_count": len(await adb.get_negative_keywords())}
+
+async def _ler_config():
+    return {
+        "pausado": get_config("pausado"),
+        "aprovacao": get_config("aprovacao_manual"),
+        "only_admins": get_config("only_admins") or "0",
+    }
+
+async def _ler_cliques():
+    return {"total_clicks": await adb.get_total_clicks()}
+
+async def _ler_links():
+    return {"recent_links": await adb.get_short_links_stats(LINKS_RECENTES)}
+
+async def _ler_fila():
+    return {"fila_publicacao": await adb.get_publish_queue_stats()}
+
+# Seção -> função que a relê do banco
+_SECOES = {
+    "canais": _contar_canais,
+    "keywords": _contar_keywords,
+    "negativas": _contar_negativas,
+    "config": _ler_config,
+    "cliques": _ler_cliques,
+    "links": _ler_links,
+    "fila": _ler_fila,
+}
+
+# Função de escrita do database_async -> seção que ela altera
+_ESCRITAS = {
+    "add_canal": "canais",
+    "remove_canal": "canais",
+    "add_keyword": "keywords",
+    "remove_keyword": "keywords",
+    "add_negative_keyword": "negativas",
+    "remove_negative_keyword": "negativas",
+    "create_short_link": "links",
+    "purge_old_short_links": "links",
+    "enqueue_publish_job": "fila",
+    "claim_publish_job": "fila",
+    "complete_publish_job": "fila",
+    "fail_publish_job": "fila",
+    "purge_finished_publish_jobs": "fila",
+}
+
+_CONFIG_CAMPOS = {"pausado": "pausado", "aprovacao_manual": "aprovacao", "only_admins": "only_admins"}
+
+_valores = {}
+_sujas = set(_SECOES)
+_corpo: Optional[bytes] = None
+_lock = asyncio.Lock()
+
+def _ao_escrever(nome: str, args: tuple, resultado):
+    global _corpo
+    if nome == "claim_publish_job" and resultado is None:
+        return  # O worker consulta a fila vazia o tempo todo: nada mudou
+    _sujas.add(_ESCRITAS[nome])
+    _corpo = None
+
+def _ao_clicar(nome: str, args: tuple, resultado):
+    global _corpo
+    if "total_clicks" not in _valores:
+        return
+    _valores["total_clicks"] += 1
+    for link in _valores.get("recent_links", ()):
+        if link["short_code"] == args[0]:
+            link["clicks"] += 1
+    _corpo = None
+
+def _ao_mudar_config(chave: str, valor: str):
+    # Roda na thread que gravou a config: só troca referências, a serialização fica para o loop
+    global _corpo
+    if chave == "only_admins":
+        valor = valor or "0"
+    _valores[_CONFIG_CAMPOS[chave]] = valor
+    _corpo = None
+
+adb.add_change_listener(_ao_escrever, _ESCRITAS)
+adb.add_change_listener(_ao_clicar, ["increment_click"])
+add_config_listener(_ao_mudar_config, _CONFIG_CAMPOS)
+
+async def invalidar_tudo():
+    """Força a releitura completa na próxima consulta (job do maintenance.py)."""
+    global _corpo
+    _sujas.update(_SECOES)
+    _corpo = None
+
+async def obter_json() -> bytes:
+    """Resposta do /api/status já serializada. Só toca o banco nas seções que mudaram."""
+    global _corpo
+    corpo = _corpo
+    if corpo is not None:
+        return corpo
+    async with _lock:
+        # Várias abas esperando o mesmo refresh: só a primeira relê, as outras pegam o resultado
+        while _sujas:
+            secao = _sujas.pop()
+            try:
+                _valores.update(await _SECOES[secao]())
+            except Exception:
+                _sujas.add(secao)
+                raise
+        if _corpo is None:
+            _corpo = json.dumps({
+                "canais_count": _valores["canais_count"],
+                "kw_count": _valores["kw_count"],
+                "nkw_count": _valores["nkw_count"],
+                "pausado": _valores["pausado"],
+                "aprovacao": _valores["aprovacao"],
+                "only_admins": _valores["only_admins"],
+                "total_clicks": _valores["total_clicks"],
+                "recent_links": _valores["recent_links"],
+                "fila_publicacao": _valores["fila_publicacao"],
+            }, ensure_ascii=False).encode("utf-8")
+        return _corpo
@@ -0,0 +1,945 @@
+"""
+Camada de armazenamento plugável.
+
+O backend é escolhido pela variável de ambiente STORAGE_BACKEND:
+    sqlite   (padrão) -> arquivo local do database.py, acessado pelo executor do database_async
+    postgres          -> pool asyncpg em DATABASE_URL; várias instâncias do bot (e um servidor de
+                         redirect escalado à parte) podem dividir o mesmo banco
+
+O resto do código não usa este módulo direto: o database_async delega para get_storage().
+As leituras de config continuam saindo do cache em memória do database.py, que o backend
+preenche (init/reload_config) e atualiza a cada set_config. No Postgres, cada set_config também
+manda um NOTIFY: as outras instâncias escutam (LISTEN) e aplicam a chave na hora, sem esperar
+a recarga periódica do maintenance.py (que fica de reserva se a conexão de escuta cair).
+"""
+import asyncio
+import atexit
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+
+import database
+import database_async
+
+# --- INTERFACE ---
+class Storage(ABC):
+    """
+    Operações que todo backend precisa oferecer (todas assíncronas). Backend sem alguma delas
+    nem chega a ser criado (TypeError), em vez de falhar só na primeira chamada.
+    """
+
+    async def init(self): ...
+    async def close(self): ...
+
+    # Config
+    @abstractmethod
+    async def set_config(self, chave: str, valor: str): ...
+    @abstractmethod
+    async def reload_config(self): ...
+
+    # Canais e keywords
+    @abstractmethod
+    async def get_canais(self): ...
+    @abstractmethod
+    async def add_canal(self, nome: str): ...
+    @abstractmethod
+    async def remove_canal(self, nome: str): ...
+    @abstractmethod
+    async def get_keywords(self): ...
+    @abstractmethod
+    async def add_keyword(self, kw: str): ...
+    @abstractmethod
+    async def remove_keyword(self, kw: str): ...
+    @abstractmethod
+    async def get_negative_keywords(self): ...
+    @abstractmethod
+    async def add_negative_keyword(self, kw: str): ...
+    @abstractmethod
+    async def remove_negative_keyword(self, kw: str): ...
+
+    # Histórico (deduplicação)
+    @abstractmethod
+    async def check_duplicate(self, hash_id: str): ...
+    @abstractmethod
+    async def add_to_history(self, hash_id: str): ...
+    @abstractmethod
+    async def purge_expired_history(self): ...
+
+    # Admins e sorteios
+    @abstractmethod
+    async def get_admins(self): ...
+    @abstractmethod
+    async def add_admin(self, user_id: int, username: str = ""): ...
+    @abstractmethod
+    async def remove_admin(self, user_id: int): ...
+    @abstractmethod
+    async def is_admin(self, user_id: int): ...
+    @abstractmethod
+    async def create_giveaway(self, premio: str): ...
+    @abstractmethod
+    async def get_active_giveaways(self): ...
+    @abstractmethod
+    async def close_giveaway(self, giveaway_id: int, winner_id: int, winner_name: str): ...
+
+    # Encurtador e cliques
+    @abstractmethod
+    async def create_short_link(self, long_url: str): ...
+    @abstractmethod
+    async def get_long_url_by_code(self, code: str): ...
+    @abstractmethod
+    async def flush_clicks(self): ...
+    @abstractmethod
+    async def rollup_clicks(self): ...
+    @abstractmethod
+    async def get_short_links_stats(self, limit=10): ...
+    @abstractmethod
+    async def get_total_clicks(self): ...
+    @abstractmethod
+    async def get_click_analytics(self, dias: int = 7, horas: int = 24, limit: int = 10): ...
+
+    # Posts
+    @abstractmethod
+    async def add_post(self, title: str, image_path: str, post_url: str, short_code: str): ...
+    @abstractmethod
+    async def get_posts(self, search=None, sort="recent", offset=0, limit=20): ...
+    @abstractmethod
+    async def get_posts_page(self, search=None, sort="recent", cursor=None, limit=20): ...
+
+    # Fila de publicação
+    @abstractmethod
+    async def enqueue_publish_job(self, payload: str, atraso: float = 0): ...
+    @abstractmethod
+    async def claim_publish_job(self, visibilidade: float, max_tentativas: int): ...
+    @abstractmethod
+    async def next_publish_job_due(self): ...
+    @abstractmethod
+    async def renew_publish_job(self, job_id: int, tentativa: int, visibilidade: float): ...
+    @abstractmethod
+    async def checkpoint_publish_job(self, job_id: int, tentativa: int, target_url: str, visibilidade: float): ...
+    @abstractmethod
+    async def complete_publish_job(self, job_id: int, tentativa: int): ...
+    @abstractmethod
+    async def fail_publish_job(self, job_id: int, tentativa: int, erro: str, max_tentativas: int, espera: float): ...
+    @abstractmethod
+    async def get_publish_queue_stats(self): ...
+
+    # Ofertas aguardando aprovação
+    @abstractmethod
+    async def add_pending_offer(self, payload: str, ttl: float, limite: int): ...
+    @abstractmethod
+    async def get_pending_offer(self, offer_id: int): ...
+    @abstractmethod
+    async def update_pending_offer(self, offer_id: int, payload: str): ...
+    @abstractmethod
+    async def take_pending_offer(self, offer_id: int): ...
+    @abstractmethod
+    async def purge_expired_pending_offers(self): ...
+
+    # Marcas dos canais monitorados
+    @abstractmethod
+    async def get_channel_watermarks(self): ...
+    @abstractmethod
+    async def set_channel_watermark(self, chat_id: int, msg_id: int): ...
+
+    # Cache de entidades do Telegram
+    @abstractmethod
+    async def get_telegram_entities(self): ...
+    @abstractmethod
+    async def save_telegram_entities(self, entidades: list, substituir_membros: bool = False): ...
+
+    # Retenção (um lote por chamada, ver retention.py)
+    @abstractmethod
+    async def purge_old_posts(self, dias: float, lote: int): ...
+    @abstractmethod
+    async def purge_old_short_links(self, dias: float, lote: int): ...
+    @abstractmethod
+    async def purge_click_details(self, dias: float, lote: int): ...
+    @abstractmethod
+    async def purge_finished_publish_jobs(self, dias: float, lote: int): ...
+    @abstractmethod
+    async def get_media_references(self): ...
+    @abstractmethod
+    async def compact_storage(self): ...
+
+
+# --- SQLITE ---
+def _sync(func):
+    async def metodo(self, *args, **kwargs):
+        return await database_async.run_db(func, *args, **kwargs)
+    metodo.__name__ = func.__name__
+    return metodo
+
+class SQLiteStorage(Storage):
+    """Backend padrão: as funções síncronas do database.py rodando no executor do banco."""
+
+    def __init__(self):
+        # Cliques ainda em memória vão para o arquivo quando o processo termina
+        atexit.register(self._flush_ao_sair)
+
+    def _flush_ao_sair(self):
+        try:
+            database.flush_clicks()
+        except Exception as e:
+            print(f"⚠️ Erro ao gravar cliques pendentes: {e}")
+
+    async def close(self):
+        await self.flush_clicks()
+
+    set_config = _sync(database.set_config)
+    reload_config = _sync(database.reload_config)
+
+    get_canais = _sync(database.get_canais)
+    add_canal = _sync(database.add_canal)
+    remove_canal = _sync(database.remove_canal)
+    get_keywords = _sync(database.get_keywords)
+    add_keyword = _sync(database.add_keyword)
+    remove_keyword = _sync(database.remove_keyword)
+    get_negative_keywords = _sync(database.get_negative_keywords)
+    add_negative_keyword = _sync(database.add_negative_keyword)
+    remove_negative_keyword = _sync(database.remove_negative_keyword)
+
+    check_duplicate = _sync(database.check_duplicate)
+    add_to_history = _sync(database.add_to_history)
+    purge_expired_history = _sync(database.purge_expired_history)
+
+    get_admins = _sync(database.get_admins)
+    add_admin = _sync(database.add_admin)
+    remove_admin = _sync(database.remove_admin)
+    is_admin = _sync(database.is_admin)
+    create_giveaway = _sync(database.create_giveaway)
+    get_active_giveaways = _sync(database.get_active_giveaways)
+    close_giveaway = _sync(database.close_giveaway)
+
+    create_short_link = _sync(database.create_short_link)
+    get_long_url_by_code = _sync(database.get_long_url_by_code)
+    flush_clicks = _sync(database.flush_clicks)
+    rollup_clicks = _sync(database.rollup_clicks)
+    get_short_links_stats = _sync(database.get_short_links_stats)
+    get_total_clicks = _sync(database.get_total_clicks)
+    get_click_analytics = _sync(database.get_click_analytics)
+
+    add_post = _sync(database.add_post)
+    get_posts = _sync(database.get_posts)
+    get_posts_page = _sync(database.get_posts_page)
+
+    enqueue_publish_job = _sync(database.enqueue_publish_job)
+    claim_publish_job = _sync(database.claim_publish_job)
+    next_publish_job_due = _sync(database.next_publish_job_due)
+    renew_publish_job = _sync(database.renew_publish_job)
+    checkpoint_publish_job = _sync(database.checkpoint_publish_job)
+    complete_publish_job = _sync(database.complete_publish_job)
+    fail_publish_job = _sync(database.fail_publish_job)
+    get_publish_queue_stats = _sync(database.get_publish_queue_stats)
+
+    add_pending_offer = _sync(database.add_pending_offer)
+    get_pending_offer = _sync(database.get_pending_offer)
+    update_pending_offer = _sync(database.update_pending_offer)
+    take_pending_offer = _sync(database.take_pending_offer)
+    purge_expired_pending_offers = _sync(database.purge_expired_pending_offers)
+
+    get_channel_watermarks = _sync(database.get_channel_watermarks)
+    set_channel_watermark = _sync(database.set_channel_watermark)
+
+    get_telegram_entities = _sync(database.get_telegram_entities)
+    save_telegram_entities = _sync(database.save_telegram_entities)
+
+    purge_old_posts = _sync(database.purge_old_posts)
+    purge_old_short_links = _sync(database.purge_old_short_links)
+    purge_click_details = _sync(database.purge_click_details)
+    purge_finished_publish_jobs = _sync(database.purge_finished_publish_jobs)
+    get_media_references = _sync(database.get_media_references)
+    compact_storage = _sync(database.compact_storage)
+
+
+# --- POSTGRES (asyncpg) ---
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+# Canal do LISTEN/NOTIFY das mudanças de config (payload: a chave alterada)
+PG_CANAL_CONFIG = "bot_config"
+
+# As datas ficam como TEXT no mesmo formato do CURRENT_TIMESTAMP do SQLite (UTC), para as
+# respostas da API e os cursores de paginação serem idênticos nos dois backends.
+_PG_NOW = "to_char(now() AT TIME ZONE 'utc', 'YYYY-MM-DD HH24:MI:SS')"
+
+PG_MIGRATIONS = [
+    # 1: schema completo (equivale às migrações 1-6 do SQLite)
+    [
+        "CREATE TABLE IF NOT EXISTS canais (id BIGSERIAL PRIMARY KEY, nome_ou_link TEXT UNIQUE NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS keywords (id BIGSERIAL PRIMARY KEY, palavra TEXT UNIQUE NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS negative_keywords (id BIGSERIAL PRIMARY KEY, palavra TEXT UNIQUE NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS config (chave TEXT PRIMARY KEY, valor TEXT NOT NULL)",
+        f"CREATE TABLE IF NOT EXISTS history (hash_id TEXT PRIMARY KEY, posted_at TEXT NOT NULL DEFAULT {_PG_NOW})",
+        "CREATE INDEX IF NOT EXISTS idx_history_posted_at ON history(posted_at)",
+        "CREATE TABLE IF NOT EXISTS admins (user_id BIGINT PRIMARY KEY, username TEXT)",
+        f"""CREATE TABLE IF NOT EXISTS sorteios (
+            id BIGSERIAL PRIMARY KEY, premio TEXT NOT NULL, status TEXT DEFAULT 'aberto',
+            ganhador_id BIGINT, ganhador_nome TEXT, created_at TEXT DEFAULT {_PG_NOW})""",
+        f"""CREATE TABLE IF NOT EXISTS short_links (
+            id BIGSERIAL PRIMARY KEY, short_code TEXT UNIQUE NOT NULL, long_url TEXT NOT NULL,
+            long_url_hash TEXT, created_at TEXT DEFAULT {_PG_NOW}, clicks BIGINT NOT NULL DEFAULT 0)""",
+        "CREATE INDEX IF NOT EXISTS idx_short_links_long_url_hash ON short_links(long_url_hash)",
+        "CREATE INDEX IF NOT EXISTS idx_short_links_created_at ON short_links(created_at)",
+        "CREATE SEQUENCE IF NOT EXISTS short_code_seq",
+        "CREATE TABLE IF NOT EXISTS counters (nome TEXT PRIMARY KEY, valor BIGINT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS click_events (id BIGSERIAL PRIMARY KEY, short_code TEXT NOT NULL, ts BIGINT NOT NULL, ua_class TEXT)",
+        """CREATE TABLE IF NOT EXISTS clicks_hourly (
+            hora BIGINT NOT NULL, short_code TEXT NOT NULL, loja TEXT NOT NULL,
+            clicks BIGINT NOT NULL DEFAULT 0, PRIMARY KEY (hora, short_code))""",
+        """CREATE TABLE IF NOT EXISTS clicks_daily (
+            dia TEXT NOT NULL, short_code TEXT NOT NULL, loja TEXT NOT NULL,
+            clicks BIGINT NOT NULL DEFAULT 0, PRIMARY KEY (dia, short_code))""",
+        f"""CREATE TABLE IF NOT EXISTS posts (
+            id BIGSERIAL PRIMARY KEY, title TEXT, image_path TEXT, post_url TEXT, short_code TEXT,
+            created_at TEXT DEFAULT {_PG_NOW}, clicks BIGINT NOT NULL DEFAULT 0)""",
+        "CREATE INDEX IF NOT EXISTS idx_posts_short_code ON posts(short_code)",
+        "CREATE INDEX IF NOT EXISTS idx_posts_recent ON posts(created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_posts_clicked ON posts(clicks DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_posts_title_fts ON posts USING GIN (to_tsvector('simple', coalesce(title, '')))",
+    ],
+    # 2: fila persistente de publicação
+    [
+        f"""CREATE TABLE IF NOT EXISTS publish_jobs (
+            id BIGSERIAL PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pendente',
+            tentativas INTEGER NOT NULL DEFAULT 0, disponivel_em BIGINT NOT NULL, target_url TEXT, erro TEXT,
+            created_at TEXT DEFAULT {_PG_NOW}, updated_at TEXT DEFAULT {_PG_NOW})""",
+        "CREATE INDEX IF NOT EXISTS idx_publish_jobs_fila ON publish_jobs(status, disponivel_em, id)",
+    ],
+    # 3: ofertas aguardando aprovação manual
+    [
+        f"""CREATE TABLE IF NOT EXISTS pending_offers (
+            id BIGSERIAL PRIMARY KEY, payload TEXT NOT NULL, expira_em BIGINT NOT NULL,
+            created_at TEXT DEFAULT {_PG_NOW})""",
+        "CREATE INDEX IF NOT EXISTS idx_pending_offers_expira_em ON pending_offers(expira_em)",
+    ],
+    # 4: marcas dos canais monitorados
+    [
+        f"""CREATE TABLE IF NOT EXISTS channel_watermarks (
+            chat_id BIGINT PRIMARY KEY, ultimo_msg_id BIGINT NOT NULL,
+            updated_at TEXT DEFAULT {_PG_NOW})""",
+    ],
+    # 5: cache de entidades do Telegram
+    [
+        """CREATE TABLE IF NOT EXISTS telegram_entities (
+            peer_id BIGINT PRIMARY KEY, access_hash BIGINT, nome TEXT, titulo TEXT, username TEXT,
+            tipo TEXT, membro INTEGER NOT NULL DEFAULT 0, updated_at BIGINT NOT NULL)""",
+        "CREATE INDEX IF NOT EXISTS idx_telegram_entities_nome ON telegram_entities(nome)",
+    ],
+    # 6: cliques agregados marcados na própria linha (a marca d'água por id pulava eventos de
+    # flushes simultâneos, porque os ids do BIGSERIAL não são confirmados em ordem)
+    [
+        "ALTER TABLE click_events ADD COLUMN IF NOT EXISTS agregado BOOLEAN NOT NULL DEFAULT FALSE",
+        "UPDATE click_events SET agregado = TRUE WHERE id <= COALESCE((SELECT valor FROM counters WHERE nome = 'click_rollup'), 0)",
+        "CREATE INDEX IF NOT EXISTS idx_click_events_pendentes ON click_events(id) WHERE NOT agregado",
+    ],
+    # 7: posts criados com um link curto reaproveitado começavam em 0 cliques (ver add_post)
+    [
+        """UPDATE posts p SET clicks = l.clicks FROM short_links l
+           WHERE l.short_code = p.short_code AND p.clicks <> l.clicks""",
+    ],
+]
+
+# Chave do advisory lock que serializa as migrações entre instâncias
+_PG_MIGRATION_LOCK = 727001
+# Mesma checagem de reserva do database.py ($1 = id, $2 = tentativa do claim)
+_PG_JOB_DA_TENTATIVA = "id = $1 AND status = 'processando' AND tentativas = $2"
+
+_PG_TSVECTOR = "to_tsvector('simple', coalesce(p.title, ''))"
+
+def _pg_tsquery(search: str) -> str:
+    """
+    Cada palavra vira um prefixo (termo:*) e todas precisam aparecer (AND). Volta vazio se
+    nenhuma palavra sobrar (ex: "R$"): quem chama não deve tratar isso como "sem filtro".
+    """
+    termos = [re.sub(r"[^\w]", "", t) for t in search.split()]
+    return " & ".join(f"{t}:*" for t in termos if t)
+
+def _pg_rowcount(status: str) -> int:
+    # asyncpg devolve o status do comando, ex: "DELETE 12"
+    try:
+        return int(status.split()[-1])
+    except (AttributeError, ValueError, IndexError):
+        return 0
+
+class PostgresStorage(Storage):
+    """
+    Backend Postgres com pool asyncpg. A busca de posts usa tsvector 'simple' (sem
+    stemming e sem tirar acentos, que exigiria a extensão unaccent).
+    """
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.pool = None
+        self._escuta = None  # Conexão fora do pool com o LISTEN de config
+        self._tarefas_config = set()
+
+    async def init(self):
+        import asyncpg
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(self.dsn, min_size=PG_POOL_MIN, max_size=PG_POOL_MAX)
+            await self._migrate()
+            await self.reload_config()
+            print("🐘 Armazenamento Postgres conectado.")
+
+    async def close(self):
+        if self.pool is not None:
+            try:
+                await self.flush_clicks()
+            except Exception as e:
+                print(f"⚠️ Erro ao gravar cliques pendentes: {e}")
+            await self.pool.close()
+            self.pool = None
+        if self._escuta is not None:
+            await self._escuta.close()
+            self._escuta = None
+
+    async def _migrate(self):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", _PG_MIGRATION_LOCK)
+                await conn.execute("CREATE TABLE IF NOT EXISTS schema_version (versao INTEGER NOT NULL)")
+                versao = await conn.fetchval("SELECT max(versao) FROM schema_version") or 0
+                for numero, comandos in enumerate(PG_MIGRATIONS[versao:], start=versao + 1):
+                    for sql in comandos:
+                        await conn.execute(sql)
+                    await conn.execute("INSERT INTO schema_version (versao) VALUES ($1)", numero)
+                    print(f"🗄️ Postgres migrado para a versão {numero}.")
+
+    # Config
+    async def set_config(self, chave: str, valor: str):
+        valor = str(valor)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "INSERT INTO config (chave, valor) VALUES ($1, $2) ON CONFLICT (chave) DO UPDATE SET valor = excluded.valor",
+                    chave, valor
+                )
+                # Entregue no commit para todas as instâncias (inclusive esta, que só reaplica o mesmo valor)
+                await conn.execute("SELECT pg_notify($1, $2)", PG_CANAL_CONFIG, chave)
+        database.apply_config_value(chave, valor)
+
+    async def reload_config(self):
+        rows = await self.pool.fetch("SELECT chave, valor FROM config")
+        database.apply_config_snapshot({r["chave"]: r["valor"] for r in rows})
+        await self._escutar_config()
+
+    async def _escutar_config(self):
+        """Abre (ou reabre, se caiu) a conexão com o LISTEN das mudanças de config."""
+        import asyncpg
+        if self._escuta is not None and not self._escuta.is_closed():
+            return
+        try:
+            self._escuta = await asyncpg.connect(self.dsn)
+            await self._escuta.add_listener(PG_CANAL_CONFIG, self._ao_notificar_config)
+        except Exception as e:
+            self._escuta = None
+            print(f"⚠️ Sem LISTEN de config no Postgres (fica só a recarga periódica): {e}")
+
+    def _ao_notificar_config(self, conexao, pid, canal, chave):
+        tarefa = asyncio.ensure_future(self._aplicar_chave(chave))
+        self._tarefas_config.add(tarefa)
+        tarefa.add_done_callback(self._tarefas_config.discard)
+
+    async def _aplicar_chave(self, chave: str):
+        try:
+            valor = await self.pool.fetchval("SELECT valor FROM config WHERE chave = $1", chave)
+            database.apply_config_value(chave, valor if valor is not None else "")
+        except Exception as e:
+            print(f"⚠️ Erro ao aplicar config '{chave}' avisada por outra instância: {e}")
+
+    # Canais e keywords
+    async def get_canais(self):
+        return [r[0] for r in await self.pool.fetch("SELECT nome_ou_link FROM canais")]
+
+    async def add_canal(self, nome: str):
+        nome_limpo = database.normalize_channel(nome)
+        if not nome_limpo:
+            return False
+        status = await self.pool.execute(
+            "INSERT INTO canais (nome_ou_link) VALUES ($1) ON CONFLICT DO NOTHING", nome_limpo
+        )
+        return _pg_rowcount(status) > 0
+
+    async def remove_canal(self, nome: str):
+        await self.pool.execute("DELETE FROM canais WHERE nome_ou_link = $1", nome.strip())
+
+    async def _get_palavras(self, tabela: str):
+        return [r[0] for r in await self.pool.fetch(f"SELECT palavra FROM {tabela} ORDER BY palavra ASC")]
+
+    async def _add_palavra(self, tabela: str, kw: str):
+        status = await self.pool.execute(
+            f"INSERT INTO {tabela} (palavra) VALUES ($1) ON CONFLICT DO NOTHING", kw.strip().lower()
+        )
+        return _pg_rowcount(status) > 0
+
+    async def _remove_palavra(self, tabela: str, kw: str):
+        await self.pool.execute(f"DELETE FROM {tabela} WHERE palavra = $1", kw.strip().lower())
+
+    async def get_keywords(self): return await self._get_palavras("keywords")
+    async def add_keyword(self, kw: str): return await self._add_palavra("keywords", kw)
+    async def remove_keyword(self, kw: str): await self._remove_palavra("keywords", kw)
+    async def get_negative_keywords(self): return await self._get_palavras("negative_keywords")
+    async def add_negative_keyword(self, kw: str): return await self._add_palavra("negative_keywords", kw)
+    async def remove_negative_keyword(self, kw: str): await self._remove_palavra("negative_keywords", kw)
+
+    # Histórico: consulta direta pela PK, para as instâncias enxergarem as postagens umas das outras
+    async def check_duplicate(self, hash_id: str):
+        limite = database._utc_str(time.time() - database._history_window_seconds())
+        row = await self.pool.fetchrow("SELECT 1 FROM history WHERE hash_id = $1 AND posted_at >= $2", hash_id, limite)
+        return row is not None
+
+    async def add_to_history(self, hash_id: str):
+        await self.pool.execute(
+            "INSERT INTO history (hash_id, posted_at) VALUES ($1, $2) "
+            "ON CONFLICT (hash_id) DO UPDATE SET posted_at = excluded.posted_at",
+            hash_id, database._utc_str(time.time())
+        )
+
+    async def purge_expired_history(self):
+        corte = database._utc_str(time.time() - database._history_window_seconds())
+        return _pg_rowcount(await self.pool.execute("DELETE FROM history WHERE posted_at < $1", corte))
+
+    # Admins e sorteios
+    async def get_admins(self):
+        return [tuple(r) for r in await self.pool.fetch("SELECT user_id, username FROM admins")]
+
+    async def add_admin(self, user_id: int, username: str = ""):
+        status = await self.pool.execute(
+            "INSERT INTO admins (user_id, username) VALUES ($1, $2) ON CONFLICT DO NOTHING", user_id, username
+        )
+        return _pg_rowcount(status) > 0
+
+    async def remove_admin(self, user_id: int):
+        await self.pool.execute("DELETE FROM admins WHERE user_id = $1", user_id)
+
+    async def is_admin(self, user_id: int):
+        return await self.pool.fetchrow("SELECT 1 FROM admins WHERE user_id = $1", user_id) is not None
+
+    async def create_giveaway(self, premio: str):
+        await self.pool.execute("INSERT INTO sorteios (premio) VALUES ($1)", premio)
+
+    async def get_active_giveaways(self):
+        return [tuple(r) for r in await self.pool.fetch("SELECT id, premio FROM sorteios WHERE status = 'aberto'")]
+
+    async def close_giveaway(self, giveaway_id: int, winner_id: int, winner_name: str):
+        await self.pool.execute(
+            "UPDATE sorteios SET status = 'encerrado', ganhador_id = $1, ganhador_nome = $2 WHERE id = $3",
+            winner_id, winner_name, giveaway_id
+        )
+
+    # Encurtador: mesma bijeção do SQLite, alimentada por uma SEQUENCE compartilhada entre as instâncias
+    async def create_short_link(self, long_url: str):
+        url_hash = database._long_url_hash(long_url)
+        async with self.pool.acquire() as conn:
+            code = await conn.fetchval(
+                "SELECT short_code FROM short_links WHERE long_url_hash = $1 AND long_url = $2 LIMIT 1",
+                url_hash, long_url
+            )
+            while code is None:
+                seq = await conn.fetchval("SELECT nextval('short_code_seq')")
+                code = await conn.fetchval(
+                    "INSERT INTO short_links (short_code, long_url, long_url_hash) VALUES ($1, $2, $3) "
+                    "ON CONFLICT (short_code) DO NOTHING RETURNING short_code",
+                    database._encode_short_code(seq), long_url, url_hash
+                )
+        database.cache_short_url(code, long_url)
+        return code
+
+    async def get_long_url_by_code(self, code: str):
+        long_url = await self.pool.fetchval("SELECT long_url FROM short_links WHERE short_code = $1", code)
+        if long_url:
+            database.cache_short_url(code, long_url)
+        return long_url
+
+    async def flush_clicks(self):
+        lote, eventos = database.take_pending_clicks()
+        if not eventos:
+            return 0
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    deltas = [(delta, code) for code, delta in lote.items()]
+                    await conn.executemany("UPDATE short_links SET clicks = clicks + $1 WHERE short_code = $2", deltas)
+                    await conn.executemany("UPDATE posts SET clicks = clicks + $1 WHERE short_code = $2", deltas)
+                    await conn.executemany("INSERT INTO click_events (short_code, ts, ua_class) VALUES ($1, $2, $3)", eventos)
+        except Exception:
+            database.restore_pending_clicks(lote, eventos)
+            raise
+        return len(eventos)
+
+    async def rollup_clicks(self):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Cada instância reserva as linhas que agrega (SKIP LOCKED) e as marca na mesma
+                # transação: um evento confirmado depois (flush de outra instância) continua pendente
+                eventos = await conn.fetch(
+                    "SELECT e.id, e.short_code, e.ts, l.long_url FROM click_events e "
+                    "LEFT JOIN short_links l ON l.short_code = e.short_code "
+                    "WHERE NOT e.agregado ORDER BY e.id LIMIT $1 FOR UPDATE OF e SKIP LOCKED", database.CLICK_ROLLUP_BATCH
+                )
+                if not eventos:
+                    return 0
+                por_hora, por_dia = {}, {}
+                for _, code, ts, url in eventos:
+                    loja = database._loja_da_url(url)
+                    chave_hora = (ts - ts % 3600, code, loja)
+                    chave_dia = (database._utc_day(ts), code, loja)
+                    por_hora[chave_hora] = por_hora.get(chave_hora, 0) + 1
+                    por_dia[chave_dia] = por_dia.get(chave_dia, 0) + 1
+                await conn.executemany(
+                    "INSERT INTO clicks_hourly (hora, short_code, loja, clicks) VALUES ($1, $2, $3, $4) "
+                    "ON CONFLICT (hora, short_code) DO UPDATE SET clicks = clicks_hourly.clicks + excluded.clicks",
+                    [(*chave, n) for chave, n in por_hora.items()]
+                )
+                await conn.executemany(
+                    "INSERT INTO clicks_daily (dia, short_code, loja, clicks) VALUES ($1, $2, $3, $4) "
+                    "ON CONFLICT (dia, short_code) DO UPDATE SET clicks = clicks_daily.clicks + excluded.clicks",
+                    [(*chave, n) for chave, n in por_dia.items()]
+                )
+                await conn.execute("UPDATE click_events SET agregado = TRUE WHERE id = ANY($1::bigint[])", [e[0] for e in eventos])
+        return len(eventos)
+
+    async def get_short_links_stats(self, limit=10):
+        rows = await self.pool.fetch(
+            "SELECT short_code, long_url, clicks, created_at FROM short_links ORDER BY created_at DESC LIMIT $1", limit
+        )
+        stats = [dict(r) for r in rows]
+        pendentes = database.pending_clicks_by_code([item["short_code"] for item in stats])
+        for item in stats:
+            item["clicks"] += pendentes[item["short_code"]]
+        return stats
+
+    async def get_total_clicks(self):
+        async with self.pool.acquire() as conn:
+            total = await conn.fetchval("SELECT COALESCE(SUM(clicks), 0)::bigint FROM clicks_daily")
+            total += await conn.fetchval("SELECT COUNT(*) FROM click_events WHERE NOT agregado")
+        return total + database.pending_clicks_total()
+
+    async def get_click_analytics(self, dias: int = 7, horas: int = 24, limit: int = 10):
+        desde_dia = database._utc_day(time.time() - dias * 86400)
+        agora = int(time.time())
+        desde_hora = agora - agora % 3600 - (horas - 1) * 3600
+        async with self.pool.acquire() as conn:
+            por_loja = await conn.fetch(
+                "SELECT loja, SUM(clicks)::bigint AS clicks FROM clicks_daily WHERE dia >= $1 GROUP BY loja ORDER BY clicks DESC",
+                desde_dia
+            )
+            por_dia = await conn.fetch(
+                "SELECT dia, SUM(clicks)::bigint AS clicks FROM clicks_daily WHERE dia >= $1 GROUP BY dia ORDER BY dia",
+                desde_dia
+            )
+            por_hora = await conn.fetch(
+                "SELECT hora, SUM(clicks)::bigint AS clicks FROM clicks_hourly WHERE hora >= $1 GROUP BY hora ORDER BY hora",
+                desde_hora
+            )
+            top_links = await conn.fetch(
+                "SELECT d.short_code, MAX(l.long_url) AS long_url, SUM(d.clicks)::bigint AS clicks FROM clicks_daily d "
+                "LEFT JOIN short_links l ON l.short_code = d.short_code "
+                "WHERE d.dia >= $1 GROUP BY d.short_code ORDER BY clicks DESC LIMIT $2",
+                desde_dia, limit
+            )
+        return {
+            "por_loja": [dict(r) for r in por_loja],
+            "por_dia": [dict(r) for r in por_dia],
+            "por_hora": [dict(r) for r in por_hora],
+            "top_links": [dict(r) for r in top_links],
+        }
+
+    # Posts
+    async def add_post(self, title: str, image_path: str, post_url: str, short_code: str):
+        await self.pool.execute(
+            "INSERT INTO posts (title, image_path, post_url, short_code, clicks) "
+            "VALUES ($1, $2, $3, $4, COALESCE((SELECT clicks FROM short_links WHERE short_code = $4), 0))",
+            title, image_path, post_url, short_code
+        )
+
+    async def get_posts(self, search=None, sort="recent", offset=0, limit=20):
+        params = []
+        query = "SELECT p.* FROM posts p"
+        tsquery = _pg_tsquery(search) if search else ""
+        if search and not tsquery:
+            return []  # Busca só com símbolos: nenhum post, e não todos
+        if tsquery:
+            params.append(tsquery)
+            query += f" WHERE {_PG_TSVECTOR} @@ to_tsquery('simple', $1)"
+        if sort == "clicked":
+            query += " ORDER BY p.clicks DESC, p.id DESC"
+        elif tsquery and sort == "relevance":
+            query += f" ORDER BY ts_rank({_PG_TSVECTOR}, to_tsquery('simple', $1)) DESC, p.id DESC"
+        else:
+            query += " ORDER BY p.created_at DESC, p.id DESC"
+        params.extend([limit, offset])
+        query += f" LIMIT ${len(params) - 1} OFFSET ${len(params)}"
+        return [dict(r) for r in await self.pool.fetch(query, *params)]
+
+    async def get_posts_page(self, search=None, sort="recent", cursor=None, limit=20):
+        where, params = [], []
+        tsquery = _pg_tsquery(search) if search else ""
+        if search and not tsquery:
+            return {"posts": [], "next_cursor": None}
+        if tsquery:
+            params.append(tsquery)
+            where.append(f"{_PG_TSVECTOR} @@ to_tsquery('simple', $1)")
+
+        anterior = database._decode_cursor(cursor) if cursor else None
+        por_relevancia = bool(tsquery) and sort == "relevance"
+        deslocamento = 0
+        if por_relevancia:
+            ordem = f" ORDER BY ts_rank({_PG_TSVECTOR}, to_tsquery('simple', $1)) DESC, p.id DESC"
+            deslocamento = anterior[0] if anterior and len(anterior) == 1 else 0
+        else:
+            coluna = "p.clicks" if sort == "clicked" else "p.created_at"
+            ordem = f" ORDER BY {coluna} DESC, p.id DESC"
+            if anterior and len(anterior) == 2:
+                params.extend(anterior)
+                where.append(f"({coluna}, p.id) < (${len(params) - 1}, ${len(params)})")
+
+        query = "SELECT p.* FROM posts p"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        params.extend([limit, deslocamento])
+        query += ordem + f" LIMIT ${len(params) - 1} OFFSET ${len(params)}"
+        posts = [dict(r) for r in await self.pool.fetch(query, *params)]
+
+        next_cursor = None
+        if len(posts) == limit:
+            ultimo = posts[-1]
+            if por_relevancia:
+                next_cursor = database._encode_cursor([deslocamento + limit])
+            elif sort == "clicked":
+                next_cursor = database._encode_cursor([ultimo["clicks"], ultimo["id"]])
+            else:
+                next_cursor = database._encode_cursor([ultimo["created_at"], ultimo["id"]])
+        return {"posts": posts, "next_cursor": next_cursor}
+
+
+    # Fila de publicação: SKIP LOCKED deixa várias instâncias consumirem a mesma fila sem disputa
+    async def enqueue_publish_job(self, payload: str, atraso: float = 0):
+        return await self.pool.fetchval(
+            "INSERT INTO publish_jobs (payload, disponivel_em) VALUES ($1, $2) RETURNING id",
+            payload, int(time.time() + atraso)
+        )
+
+    async def claim_publish_job(self, visibilidade: float, max_tentativas: int):
+        agora = int(time.time())
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow(f"""
+                    UPDATE publish_jobs
+                    SET status = 'processando', tentativas = tentativas + 1, disponivel_em = $1, updated_at = {_PG_NOW}
+                    WHERE id = (
+                        SELECT id FROM publish_jobs
+                        WHERE status IN ('pendente', 'processando') AND disponivel_em <= $2
+                        ORDER BY disponivel_em, id LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, payload, tentativas, target_url
+                """, int(agora + visibilidade), agora)
+                if row is None:
+                    return None
+                job = dict(row)
+                job["morto"] = job["tentativas"] > max_tentativas
+                if job["morto"]:
+                    await conn.execute(
+                        f"UPDATE publish_jobs SET status = 'falhou', erro = COALESCE(erro, 'tentativas esgotadas'), "
+                        f"updated_at = {_PG_NOW} WHERE id = $1", job["id"]
+                    )
+                return job
+
+    async def next_publish_job_due(self):
+        return await self.pool.fetchval(
+            "SELECT MIN(disponivel_em) FROM publish_jobs WHERE status IN ('pendente', 'processando')"
+        )
+
+    async def renew_publish_job(self, job_id: int, tentativa: int, visibilidade: float):
+        status = await self.pool.execute(
+            f"UPDATE publish_jobs SET disponivel_em = $3, updated_at = {_PG_NOW} WHERE {_PG_JOB_DA_TENTATIVA}",
+            job_id, tentativa, int(time.time() + visibilidade)
+        )
+        return _pg_rowcount(status) > 0
+
+    async def checkpoint_publish_job(self, job_id: int, tentativa: int, target_url: str, visibilidade: float):
+        status = await self.pool.execute(
+            f"UPDATE publish_jobs SET target_url = $3, disponivel_em = $4, updated_at = {_PG_NOW} WHERE {_PG_JOB_DA_TENTATIVA}",
+            job_id, tentativa, target_url, int(time.time() + visibilidade)
+        )
+        return _pg_rowcount(status) > 0
+
+    async def complete_publish_job(self, job_id: int, tentativa: int):
+        status = await self.pool.execute(
+            f"UPDATE publish_jobs SET status = 'concluido', erro = NULL, updated_at = {_PG_NOW} WHERE {_PG_JOB_DA_TENTATIVA}",
+            job_id, tentativa
+        )
+        return _pg_rowcount(status) > 0
+
+    async def fail_publish_job(self, job_id: int, tentativa: int, erro: str, max_tentativas: int, espera: float):
+        morto = tentativa >= max_tentativas
+        status = await self.pool.execute(
+            f"UPDATE publish_jobs SET status = $3, erro = $4, disponivel_em = $5, updated_at = {_PG_NOW} WHERE {_PG_JOB_DA_TENTATIVA}",
+            job_id, tentativa, 'falhou' if morto else 'pendente', erro[:500], int(time.time() + espera)
+        )
+        return morto if _pg_rowcount(status) else None
+
+    async def get_publish_queue_stats(self):
+        rows = await self.pool.fetch("SELECT status, COUNT(*) FROM publish_jobs GROUP BY status")
+        return {r[0]: r[1] for r in rows}
+
+
+    # Ofertas aguardando aprovação
+    async def add_pending_offer(self, payload: str, ttl: float, limite: int):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                offer_id = await conn.fetchval(
+                    "INSERT INTO pending_offers (payload, expira_em) VALUES ($1, $2) RETURNING id",
+                    payload, int(time.time() + ttl)
+                )
+                removidas = await conn.fetch(
+                    "DELETE FROM pending_offers WHERE id NOT IN (SELECT id FROM pending_offers ORDER BY id DESC LIMIT $1) "
+                    "RETURNING payload", max(limite, 1)
+                )
+        return offer_id, [r[0] for r in removidas]
+
+    async def get_pending_offer(self, offer_id: int):
+        return await self.pool.fetchval("SELECT payload FROM pending_offers WHERE id = $1 AND expira_em > $2",
+                                        offer_id, int(time.time()))
+
+    async def update_pending_offer(self, offer_id: int, payload: str):
+        status = await self.pool.execute("UPDATE pending_offers SET payload = $1 WHERE id = $2 AND expira_em > $3",
+                                         payload, offer_id, int(time.time()))
+        return _pg_rowcount(status) > 0
+
+    async def take_pending_offer(self, offer_id: int):
+        return await self.pool.fetchval("DELETE FROM pending_offers WHERE id = $1 AND expira_em > $2 RETURNING payload",
+                                        offer_id, int(time.time()))
+
+    async def purge_expired_pending_offers(self):
+        rows = await self.pool.fetch("DELETE FROM pending_offers WHERE expira_em <= $1 RETURNING payload", int(time.time()))
+        return [r[0] for r in rows]
+
+
+    # Marcas dos canais monitorados
+    async def get_channel_watermarks(self):
+        rows = await self.pool.fetch("SELECT chat_id, ultimo_msg_id FROM channel_watermarks")
+        return {r[0]: r[1] for r in rows}
+
+    async def set_channel_watermark(self, chat_id: int, msg_id: int):
+        await self.pool.execute(f"""
+            INSERT INTO channel_watermarks (chat_id, ultimo_msg_id) VALUES ($1, $2)
+            ON CONFLICT (chat_id) DO UPDATE SET
+                ultimo_msg_id = GREATEST(channel_watermarks.ultimo_msg_id, EXCLUDED.ultimo_msg_id),
+                updated_at = {_PG_NOW}
+        """, chat_id, msg_id)
+
+
+    # Cache de entidades do Telegram
+    async def get_telegram_entities(self):
+        rows = await self.pool.fetch("SELECT * FROM telegram_entities ORDER BY lower(titulo)")
+        return [dict(r) for r in rows]
+
+    async def save_telegram_entities(self, entidades: list, substituir_membros: bool = False):
+        agora = int(time.time())
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if substituir_membros:
+                    await conn.execute("UPDATE telegram_entities SET membro = 0")
+                await conn.executemany("""
+                    INSERT INTO telegram_entities (peer_id, access_hash, nome, titulo, username, tipo, membro, updated_at)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                    ON CONFLICT (peer_id) DO UPDATE SET
+                        access_hash = EXCLUDED.access_hash,
+                        nome = COALESCE(EXCLUDED.nome, telegram_entities.nome),
+                        titulo = EXCLUDED.titulo,
+                        username = EXCLUDED.username,
+                        tipo = EXCLUDED.tipo,
+                        membro = EXCLUDED.membro,
+                        updated_at = EXCLUDED.updated_at
+                """, [(e["peer_id"], e["access_hash"], e["nome"], e["titulo"], e["username"], e["tipo"],
+                       int(bool(e["membro"])), agora) for e in entidades])
+
+
+    # Retenção
+    async def purge_old_posts(self, dias: float, lote: int):
+        rows = await self.pool.fetch(
+            "DELETE FROM posts WHERE id IN (SELECT id FROM posts WHERE created_at < $1 LIMIT $2) RETURNING image_path",
+            database._utc_str(time.time() - dias * 86400), lote
+        )
+        return [r[0] for r in rows]
+
+    async def purge_old_short_links(self, dias: float, lote: int):
+        corte = time.time() - dias * 86400
+        rows = await self.pool.fetch("""
+            DELETE FROM short_links WHERE id IN (
+                SELECT l.id FROM short_links l
+                WHERE l.created_at < $1
+                  AND NOT EXISTS (SELECT 1 FROM posts p WHERE p.short_code = l.short_code)
+                  AND NOT EXISTS (SELECT 1 FROM clicks_daily d WHERE d.short_code = l.short_code AND d.dia >= $2)
+                LIMIT $3
+            ) RETURNING short_code
+        """, database._utc_str(corte), database._utc_day(corte), lote)
+        for r in rows:
+            database.uncache_short_url(r[0])
+        return len(rows)
+
+    async def purge_click_details(self, dias: float, lote: int):
+        corte = int(time.time() - dias * 86400)
+        async with self.pool.acquire() as conn:
+            status_eventos = await conn.execute(
+                "DELETE FROM click_events WHERE id IN (SELECT id FROM click_events "
+                "WHERE agregado AND ts < $1 LIMIT $2)",
+                corte, lote
+            )
+            status_horas = await conn.execute(
+                "DELETE FROM clicks_hourly WHERE ctid IN (SELECT ctid FROM clicks_hourly WHERE hora < $1 LIMIT $2)",
+                corte, lote
+            )
+        return _pg_rowcount(status_eventos) + _pg_rowcount(status_horas)
+
+    async def purge_finished_publish_jobs(self, dias: float, lote: int):
+        status = await self.pool.execute(
+            "DELETE FROM publish_jobs WHERE id IN (SELECT id FROM publish_jobs "
+            "WHERE status IN ('concluido', 'falhou') AND updated_at < $1 LIMIT $2)",
+            database._utc_str(time.time() - dias * 86400), lote
+        )
+        return _pg_rowcount(status)
+
+    async def get_media_references(self):
+        async with self.pool.acquire() as conn:
+            imagens = await conn.fetch("SELECT image_path FROM posts WHERE image_path IS NOT NULL AND image_path != ''")
+            payloads = await conn.fetch(
+                "SELECT payload FROM publish_jobs WHERE status IN ('pendente', 'processando') "
+                "UNION ALL SELECT payload FROM pending_offers"
+            )
+        return {"imagens": [r[0] for r in imagens], "payloads": [r[0] for r in payloads]}
+
+    async def compact_storage(self):
+        # O autovacuum do Postgres já reaproveita o espaço; aqui só adianta nas tabelas podadas
+        await self.pool.execute("VACUUM (ANALYZE) posts, short_links, click_events, clicks_hourly, publish_jobs")
+        return 0
+
+
+# --- SELEÇÃO DO BACKEND ---
+_storage = None
+
+def get_storage() -> Storage:
+    """Backend escolhido por STORAGE_BACKEND (criado uma vez por processo)."""
+    global _storage
+    if _storage is None:
+        from config import STORAGE_BACKEND, DATABASE_URL
+        if STORAGE_BACKEND == "postgres":
+            if not DATABASE_URL:
+                raise RuntimeError("STORAGE_BACKEND=postgres exige DATABASE_URL")
+            _storage = PostgresStorage(DATABASE_URL)
+        else:
+            _storage = SQLiteStorage()
+    return _storage
+
+async def init_storage():
+    """Conecta/migra o backend (no SQLite o init_db do database.py já fez isso)."""
+    await get_storage().init()
+
+async def close_storage():
+    """Grava os cliques pendentes e fecha o pool do backend (chamar antes de reiniciar/encerrar)."""
+    try:
+        await get_storage().close()
+    except Exception as e:
+        print(f"⚠️ Erro ao fechar o armazenamento: {e}")
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from telethon import types, utils
+from telethon.errors import FloodWaitError
+from telethon.sessions import MemorySession
+
+import database
+import entity_cache
+from apoio_testes import banco_temporario
+
+def canal(id_, username, left=False):
+    return types.Channel(id=id_, title=f"Canal {username}", photo=types.ChatPhotoEmpty(), date=None,
+                         access_hash=id_ * 7, username=username, broadcast=True, left=left)
+
+class ClienteFalso:
+    """Só o que o entity_cache usa do TelegramClient, contando as chamadas de rede."""
+
+    def __init__(self, canais):
+        self.session = MemorySession()
+        self.canais = {c.username: c for c in canais}
+        self.resolvidos = []
+        self.entradas = []
+        self.simultaneos = self.max_simultaneos = 0
+        self.flood_pendente = True
+
+    def is_connected(self):
+        return True
+
+    async def get_entity(self, alvo):
+        self.simultaneos += 1
+        self.max_simultaneos = max(self.max_simultaneos, self.simultaneos)
+        try:
+            await asyncio.sleep(0.02)
+            if alvo == "floodado" and self.flood_pendente:
+                self.flood_pendente = False
+                raise FloodWaitError(request=None, capture=0)
+            self.resolvidos.append(alvo)
+            return self.canais[alvo]
+        finally:
+            self.simultaneos -= 1
+
+    async def __call__(self, request):
+        self.entradas.append(request.channel.username)
+        entrou = canal(request.channel.id, request.channel.username)
+        return SimpleNamespace(chats=[entrou])
+
+    async def get_dialogs(self, limit):
+        return [SimpleNamespace(entity=c, is_group=False, is_channel=True) for c in self.canais.values()]
+
+async def _startup_usa_o_cache():
+    nomes = [f"canal{i}" for i in range(10)] + ["floodado"]
+    cliente = ClienteFalso([canal(100 + i, n, left=(i % 2 == 0)) for i, n in enumerate(nomes)])
+
+    ids, sem_id, revalidar = await entity_cache.inicializar(cliente, [f"@{n}" for n in nomes])
+    assert len(ids) == 11 and not sem_id and not revalidar
+    assert cliente.max_simultaneos <= entity_cache.BOOTSTRAP_CONCORRENCIA
+    # Só entra em quem ainda não era membro
+    assert sorted(cliente.entradas) == sorted(n for i, n in enumerate(nomes) if i % 2 == 0)
+    print("✅ Canais novos resolvidos em paralelo limitado, FloodWait respeitado")
+
+    # Reinício: nada é resolvido de novo e os access hashes voltam para a sessão do Telethon
+    novo = ClienteFalso([])
+    ids2, sem_id2, _ = await entity_cache.inicializar(novo, [f"https://t.me/{n}" for n in nomes])
+    assert ids2 == ids and not sem_id2 and novo.resolvidos == [] and novo.entradas == []
+    peer_id = utils.get_peer_id(canal(103, "canal3"))
+    entrada = novo.session.get_input_entity(peer_id)
+    assert isinstance(entrada, types.InputPeerChannel) and entrada.access_hash == 103 * 7
+    print("✅ Reinício sai do cache sem nenhuma chamada ao Telegram")
+
+async def _canal_invalido():
+    cliente = ClienteFalso([])
+    # Erro qualquer ao resolver (aqui KeyError do cliente falso), inclusive com ID numérico
+    assert await entity_cache.registrar_canal(cliente, "-1009999999999") is None
+    assert await entity_cache.registrar_canal(cliente, "@nao_existe") is None
+    assert not [l for l in database.get_telegram_entities() if l["nome"] in ("-1009999999999", "nao_existe")]
+    print("✅ Canal que não resolve não é cacheado nem monitorado")
+
+async def _dialogos():
+    cliente = ClienteFalso([canal(500, "grupo_a"), canal(501, "grupo_b")])
+    grupos = await entity_cache.listar_grupos(cliente, atualizar=True)
+    assert {"id": utils.get_peer_id(canal(500, "grupo_a")), "name": "Canal grupo_a", "username": "@grupo_a"} in grupos
+    # Lista completa de diálogos: canais que não apareceram deixam de ser membros
+    assert len(grupos) == 2
+    cliente.get_dialogs = None  # Dentro da validade não vai ao Telegram
+    assert await entity_cache.listar_grupos(cliente) == grupos
+    print("✅ Lista de grupos servida do cache")
+
+def test_startup_usa_o_cache():
+    with banco_temporario():
+        asyncio.run(_startup_usa_o_cache())
+
+def test_canal_invalido():
+    with banco_temporario():
+        asyncio.run(_canal_invalido())
+
+def test_dialogos():
+    with banco_temporario():
+        asyncio.run(_dialogos())
+
+if __name__ == "__main__":
+    test_startup_usa_o_cache()
+    test_canal_invalido()
+    test_dialogos()
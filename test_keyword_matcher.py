@@ -0,0 +1,60 @@
+import asyncio
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database_async as adb
+import keyword_matcher
+from apoio_testes import banco_temporario
+from keyword_matcher import AhoCorasick, KeywordMatcher, dobrar
+
+def test_dobrar():
+    assert dobrar("Promoção IMPERDÍVEL") == "promocao imperdivel"
+    assert dobrar("Cupom") == "cupom"
+    print("✅ Texto sem acento e sem caixa")
+
+def test_automato_igual_ao_in():
+    # Compara com a busca ingênua em padrões que se sobrepõem (prefixos/sufixos uns dos outros)
+    rnd = random.Random(42)
+    padroes = ["".join(rnd.choice("abc") for _ in range(rnd.randint(1, 4))) for _ in range(40)]
+    automato = AhoCorasick(padroes)
+    for _ in range(300):
+        texto = "".join(rnd.choice("abcd") for _ in range(rnd.randint(0, 30)))
+        esperado = {i for i, p in enumerate(padroes) if p in texto}
+        assert automato.buscar(texto) == esperado, texto
+    print("✅ Autômato encontra exatamente o que o 'in' encontraria")
+
+def test_matcher():
+    matcher = KeywordMatcher(["Fone", "smart tv", "AIR FRYER"], ["usado", "Recondicionado"])
+    positivas, negativas = matcher.verificar("🔥 Air Fryer e Fone Bluetooth em PROMOÇÃO")
+    assert positivas == ["Fone", "AIR FRYER"] and negativas == []
+    positivas, negativas = matcher.verificar("Smart TV recondicionado com desconto")
+    assert positivas == ["smart tv"] and negativas == ["Recondicionado"]
+    assert matcher.verificar("") == ([], [])
+    assert KeywordMatcher(["promoção"], []).verificar("PROMOCAO relâmpago")[0] == ["promoção"]
+    print("✅ Keywords e negativas numa passada só")
+
+async def _recompila_quando_muda():
+    keyword_matcher.invalidar()
+    matcher = await keyword_matcher.obter_matcher()
+    assert await keyword_matcher.obter_matcher() is matcher  # Sem mudança, o autômato é reaproveitado
+    await adb.add_keyword("cafeteira")
+    await adb.add_negative_keyword("quebrada")
+    matcher = await keyword_matcher.obter_matcher()
+    assert matcher.verificar("Cafeteira elétrica") == (["cafeteira"], [])
+    assert matcher.verificar("Cafeteira quebrada")[1] == ["quebrada"]
+    await adb.remove_keyword("cafeteira")
+    assert "cafeteira" not in (await keyword_matcher.obter_matcher()).keywords
+    print("✅ Autômato remontado quando as keywords mudam")
+
+def test_recompila_quando_muda():
+    with banco_temporario():
+        asyncio.run(_recompila_quando_muda())
+
+if __name__ == "__main__":
+    test_dobrar()
+    test_automato_igual_ao_in()
+    test_matcher()
+    test_recompila_quando_muda()
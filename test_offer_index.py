@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import offer_index
+
+def test_duplicada_por_titulo_e_preco():
+    offer_index.registrar(
+        "🔥 <b>Fone de Ouvido Bluetooth JBL Tune</b>\n💰 R$ 199,90\n🛒 https://exemplo.com/abc",
+        "@canal_destino"
+    )
+    achada = offer_index.buscar_duplicada("Fone Bluetooth JBL Tune 520BT", "199.90")
+    assert achada is not None and achada.canal == "@canal_destino"
+    # Preço diferente não é duplicata
+    assert offer_index.buscar_duplicada("Fone Bluetooth JBL Tune 520BT", "149.90") is None
+    # Outro produto pelo mesmo preço também não
+    assert offer_index.buscar_duplicada("Cafeteira Elétrica Mondial", "199.90") is None
+    print("✅ Duplicata por título e preço")
+
+def test_duplicada_por_produto():
+    offer_index.registrar("Oferta\nR$ 1.299,00\nhttps://www.amazon.com.br/dp/B0ABC12345?tag=x", "@canal_destino")
+    assert offer_index.buscar_por_produto("amazon:B0ABC12345", "1299.00") is not None
+    assert offer_index.buscar_duplicada("Título completamente diferente", "1299.00", "amazon:B0ABC12345") is not None
+    assert offer_index.buscar_por_produto("amazon:B0ABC12345", "999.00") is None
+    print("✅ Duplicata pelo ID do produto")
+
+def test_janela():
+    agora = time.time()
+    # Semeadura chega do mais novo para o mais antigo; o que passou da janela nem entra
+    offer_index.registrar("Air Fryer Philco Gourmet R$ 299,90", "@a", ts=agora - 60)
+    offer_index.registrar("Air Fryer Philco Gourmet R$ 299,90", "@b", ts=agora - 1800)
+    offer_index.registrar("Smart TV Samsung Crystal R$ 2.199,00", "@a", ts=agora - 2 * offer_index.JANELA_SEGUNDOS)
+    assert offer_index.buscar_duplicada("Smart TV Samsung Crystal", "2199.00") is None
+    assert [o.ts for o in offer_index._ofertas] == sorted(o.ts for o in offer_index._ofertas)
+    # Expira quando a janela passa
+    offer_index._ofertas[0].ts = agora - offer_index.JANELA_SEGUNDOS - 1
+    offer_index._expirar(agora)
+    assert all(o.ts >= agora - offer_index.JANELA_SEGUNDOS for o in offer_index._ofertas)
+    assert offer_index.buscar_duplicada("Air Fryer Philco Gourmet", "299.90").canal == "@a"
+    print("✅ Janela de uma hora respeitada")
+
+if __name__ == "__main__":
+    test_duplicada_por_titulo_e_preco()
+    test_duplicada_por_produto()
+    test_janela()
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database
+from apoio_testes import banco_temporario
+from pipeline import Pipeline
+
+async def _estagios_em_sequencia():
+    saida = []
+
+    async def dobrar(x):
+        return x * 2
+
+    async def so_pares_de_quatro(x):
+        return x if x % 4 == 0 else None  # None descarta
+
+    async def coletar(x):
+        saida.append(x)
+        return x
+
+    descartados = []
+
+    async def ao_descartar(x):
+        descartados.append(x)
+
+    pipe = Pipeline("teste", ao_descartar=ao_descartar).estagio("a", dobrar).estagio("b", so_pares_de_quatro).estagio("c", coletar)
+    pipe.iniciar()
+    for i in range(10):
+        await pipe.enviar(i)
+    await pipe.esvaziar()
+    assert sorted(saida) == [0, 4, 8, 12, 16]
+    assert pipe.status()[1]["descartados"] == 5
+    assert sorted(descartados) == [2, 6, 10, 14, 18]  # Recebe o item que o estágio descartou
+    print("✅ Itens passam pelos estágios e o None descarta")
+
+async def _io_concorrente():
+    async def lento(x):
+        await asyncio.sleep(0.1)
+        return x
+
+    pipe = Pipeline("io").estagio("rede", lento, workers=10)
+    pipe.iniciar()
+    inicio = time.monotonic()
+    for i in range(10):
+        await pipe.enviar(i)
+    await pipe.esvaziar()
+    # Dez esperas de 0.1s em paralelo, e não uma atrás da outra
+    assert time.monotonic() - inicio < 0.5
+    print("✅ Workers do estágio esperam a rede em paralelo")
+
+async def _contrapressao_e_config():
+    database.set_config("pipeline_fila_max", "2")
+    database.set_config("pipeline_workers_travado", "1")
+    liberar = asyncio.Event()
+
+    async def travado(x):
+        await liberar.wait()
+        return x
+
+    pipe = Pipeline("cheio").estagio("travado", travado, workers=3)
+    pipe.iniciar()
+    assert pipe.status()[0]["workers"] == 1
+    await pipe.enviar(1)  # Worker pega este
+    await asyncio.sleep(0)
+    await pipe.enviar(2)
+    await pipe.enviar(3)  # Fila cheia (2 itens)
+    bloqueado = asyncio.create_task(pipe.enviar(4))
+    await asyncio.sleep(0.05)
+    assert not bloqueado.done()  # O produtor espera em vez de acumular
+    liberar.set()
+    await asyncio.wait_for(bloqueado, 1)
+    await pipe.esvaziar()
+    database.set_config("pipeline_fila_max", "")
+    print("✅ Fila limitada segura o produtor e a config define os workers")
+
+async def _erro_nao_para_o_worker():
+    limpos = []
+
+    async def explode(x):
+        if x == 1:
+            raise RuntimeError("falhou")
+        return x
+
+    pipe = Pipeline("erros", ao_falhar=limpos.append).estagio("x", explode)
+    pipe.iniciar()
+    for i in range(3):
+        await pipe.enviar(i)
+    await pipe.esvaziar()
+    assert limpos == [1]
+    assert pipe.status()[0]["erros"] == 1 and pipe.status()[0]["processados"] == 2
+    print("✅ Erro num item chama a limpeza e o worker segue")
+
+def test_estagios_em_sequencia():
+    with banco_temporario():
+        asyncio.run(_estagios_em_sequencia())
+
+def test_io_concorrente():
+    with banco_temporario():
+        asyncio.run(_io_concorrente())
+
+def test_contrapressao_e_config():
+    with banco_temporario():
+        asyncio.run(_contrapressao_e_config())
+
+def test_erro_nao_para_o_worker():
+    with banco_temporario():
+        asyncio.run(_erro_nao_para_o_worker())
+
+if __name__ == "__main__":
+    test_estagios_em_sequencia()
+    test_io_concorrente()
+    test_contrapressao_e_config()
+    test_erro_nao_para_o_worker()
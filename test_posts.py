@@ -0,0 +1,64 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database
+from apoio_testes import banco_temporario
+
+def _posts_com_datas():
+    # Título mais relevante para "fone" é o mais antigo
+    for titulo, data in (("Fone fone fone Bluetooth JBL", "2024-01-01 10:00:00"),
+                         ("Cafeteira Nespresso", "2024-01-02 10:00:00"),
+                         ("Fone de ouvido com cabo e microfone embutido para celular", "2024-01-03 10:00:00"),
+                         ("Fone Bluetooth Xiaomi", "2024-01-04 10:00:00")):
+        database.add_post(titulo, "", "", None)
+        with database.get_connection() as conn:
+            conn.execute("UPDATE posts SET created_at = ? WHERE title = ?", (data, titulo))
+
+def _todas_as_paginas(**kwargs):
+    titulos, cursor = [], None
+    while True:
+        page = database.get_posts_page(cursor=cursor, limit=1, **kwargs)
+        titulos += [p["title"] for p in page["posts"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return titulos
+
+def test_busca_respeita_a_ordem_pedida():
+    with banco_temporario():
+        _posts_com_datas()
+        # Busca com sort=recent continua do mais novo para o mais antigo, paginada por cursor
+        recentes = _todas_as_paginas(search="fone", sort="recent")
+        assert recentes == ["Fone Bluetooth Xiaomi", "Fone de ouvido com cabo e microfone embutido para celular",
+                            "Fone fone fone Bluetooth JBL"]
+        assert [p["title"] for p in database.get_posts(search="fone")] == recentes
+        # Relevância só quando pedida
+        relevantes = _todas_as_paginas(search="fone", sort="relevance")
+        assert relevantes[0] == "Fone fone fone Bluetooth JBL" and sorted(relevantes) == sorted(recentes)
+        assert [p["title"] for p in database.get_posts(search="fone", sort="relevance")] == relevantes
+        # Sem busca, relevance vira a ordem por data
+        assert _todas_as_paginas(sort="relevance")[0] == "Fone Bluetooth Xiaomi"
+    print("✅ Busca mantém a ordem pedida; relevância só com sort=relevance")
+
+def test_cliques_do_link_reaproveitado():
+    with banco_temporario():
+        code = database.create_short_link("https://www.amazon.com.br/dp/B000000009")
+        database.add_post("Primeira oferta", "", "", code)
+        for _ in range(4):
+            database.record_click(code)
+        database.flush_clicks()
+        # Mesma URL de novo: o código é reaproveitado e o post novo já nasce com os cliques dele
+        assert database.create_short_link("https://www.amazon.com.br/dp/B000000009") == code
+        database.add_post("Mesma oferta repostada", "", "", code)
+        database.record_click(code)
+        database.flush_clicks()
+        with database.get_connection() as conn:
+            total = conn.execute("SELECT clicks FROM short_links WHERE short_code = ?", (code,)).fetchone()[0]
+        posts = database.get_posts_page(sort="clicked")["posts"]
+        assert total == 5 and [p["clicks"] for p in posts] == [total, total]
+    print("✅ Post com link reaproveitado mostra os mesmos cliques do link")
+
+if __name__ == "__main__":
+    test_busca_respeita_a_ordem_pedida()
+    test_cliques_do_link_reaproveitado()
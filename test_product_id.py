@@ -0,0 +1,70 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import links
+import product_id
+
+def test_extrair():
+    casos = {
+        "https://www.amazon.com.br/Fone-Bluetooth/dp/b0abc12345/ref=sr_1_1?tag=x": "amazon:B0ABC12345",
+        "https://amazon.com.br/gp/product/B0ABC12345": "amazon:B0ABC12345",
+        "https://produto.mercadolivre.com.br/MLB-1234567890-fone-_JM": "mercadolivre:MLB1234567890",
+        "https://www.mercadolivre.com.br/fone/p/MLB19876543?pdp_filters=x": "mercadolivre:MLB19876543",
+        "https://shopee.com.br/Fone-Bluetooth-i.123456.987654321?sp_atk=x": "shopee:123456.987654321",
+        "https://shopee.com.br/universal-link/product/123456/987654321?utm_source=x": "shopee:123456.987654321",
+        "https://shopee.com.br/x?itemid=987654321&shopid=123456": "shopee:123456.987654321",
+        "https://pt.aliexpress.com/item/1005001234567890.html?spm=x": "aliexpress:1005001234567890",
+        "https://m.aliexpress.com/p/coin-index/index.html?productIds=1005001234567890": "aliexpress:1005001234567890",
+        "https://www.kabum.com.br/produto/123": None,
+    }
+    for url, esperado in casos.items():
+        assert product_id.extrair(url) == esperado, (url, product_id.extrair(url))
+    # Links de afiliado diferentes do mesmo produto dão o mesmo ID
+    assert product_id.do_texto("Oferta! https://www.amazon.com.br/dp/B0ABC12345?tag=canal1") == \
+        product_id.do_texto("Corre https://amazon.com.br/Qualquer/dp/B0ABC12345?tag=canal2&psc=1")
+    print("✅ IDs canônicos de Amazon, Mercado Livre, Shopee e AliExpress")
+
+def test_reserva():
+    assert product_id.reservar("amazon:B0ABC12345", "199.90")
+    assert not product_id.reservar("amazon:B0ABC12345", "199.90")
+    assert product_id.reservar("amazon:B0ABC12345", "149.90")  # Preço novo é outra oferta
+    # Oferta descartada no caminho: a próxima fonte pode seguir
+    product_id.liberar("amazon:B0ABC12345", "199.90")
+    assert product_id.reservar("amazon:B0ABC12345", "199.90")
+    assert not product_id.reservar("amazon:B0ABC12345", "149.90")
+    # Recusada pelo admin (só o ID do produto): solta todos os preços
+    product_id.liberar("amazon:B0ABC12345")
+    assert product_id.reservar("amazon:B0ABC12345", "149.90")
+    print("✅ Mesma (produto, preço) só é aceita uma vez e volta a valer quando descartada")
+
+async def _expansao_coalescida():
+    chamadas = []
+
+    async def expandir_falso(url):
+        chamadas.append(url)
+        await asyncio.sleep(0.05)
+        return "https://www.amazon.com.br/dp/B0XYZ98765?tag=fonte"
+
+    expandir_original, links._expandir = links._expandir, expandir_falso
+    try:
+        # Cinco canais com o mesmo link curto ao mesmo tempo: uma requisição só
+        resultados = await asyncio.gather(*[product_id.identificar("Promo https://amzn.to/abc123") for _ in range(5)])
+        assert resultados == ["amazon:B0XYZ98765"] * 5
+        assert chamadas == ["https://amzn.to/abc123"]
+        # Depois fica no cache
+        await links.expand_url("https://amzn.to/abc123")
+        assert len(chamadas) == 1
+    finally:
+        links._expandir = expandir_original
+    print("✅ Expansão de link coalescida e em cache")
+
+def test_expansao_coalescida():
+    asyncio.run(_expansao_coalescida())
+
+if __name__ == "__main__":
+    test_extrair()
+    test_reserva()
+    test_expansao_coalescida()
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database
+import publish_queue
+import pending_offers
+from apoio_testes import banco_temporario
+from publish_queue import OfertaPublicacao
+
+async def _fila_persistente():
+    # O texto da fonte só entra no cooldown quando a oferta vai para a fila
+    assert not database.check_duplicate("hash_fonte_1")
+    job_id = await publish_queue.enqueue(OfertaPublicacao("Oferta 1", None, "https://t.me/fonte/1", hash_texto="hash_fonte_1"))
+    assert database.check_duplicate("hash_fonte_1")
+    job = await publish_queue.proximo_job()
+    assert job.id == job_id and job.oferta.texto == "Oferta 1" and job.target_url is None
+
+    # Enquanto reservado, nenhum outro worker pega o mesmo job
+    assert await asyncio.to_thread(database.claim_publish_job, 600, 5) is None
+
+    # "Reinício" depois de publicar: o prazo de visibilidade vence e o job volta com o checkpoint
+    await publish_queue.marcar_publicado(job, "https://t.me/canal/10")
+    with database.get_connection() as conn:
+        conn.execute("UPDATE publish_jobs SET disponivel_em = 0 WHERE id = ?", (job_id,))
+    retomado = await publish_queue.proximo_job()
+    assert retomado.id == job_id and retomado.tentativas == 2
+    assert retomado.target_url == "https://t.me/canal/10"
+    await publish_queue.concluir(retomado)
+    assert database.get_publish_queue_stats() == {"concluido": 1}
+    print("✅ Job retomado após reinício sem publicar de novo")
+
+async def _reserva_vencida(pasta):
+    media = os.path.join(pasta, "lenta.jpg")
+    open(media, "wb").close()
+    job_id = await publish_queue.enqueue(OfertaPublicacao("Oferta lenta", media))
+    lento = await publish_queue.proximo_job()
+    await publish_queue.renovar(lento)
+    # O prazo vence no meio de uma etapa lenta e outro worker retoma o job
+    with database.get_connection() as conn:
+        conn.execute("UPDATE publish_jobs SET disponivel_em = 0 WHERE id = ?", (job_id,))
+    retomado = await publish_queue.proximo_job()
+    assert retomado.id == job_id and retomado.tentativas == 2
+
+    # O primeiro worker para na próxima etapa e não mexe no job nem na mídia de quem retomou
+    for etapa in (publish_queue.renovar(lento), publish_queue.marcar_publicado(lento, "https://t.me/canal/1")):
+        try:
+            await etapa
+            assert False, "Reserva vencida aceita"
+        except publish_queue.ReservaPerdida:
+            pass
+    assert not await publish_queue.concluir(lento) and os.path.exists(media)
+    assert await publish_queue.falhar(lento, "atrasado") is False
+    assert database.get_publish_queue_stats() == {"processando": 1}
+
+    await publish_queue.marcar_publicado(retomado, "https://t.me/canal/2")
+    assert await publish_queue.concluir(retomado) and not os.path.exists(media)
+    assert database.get_publish_queue_stats() == {"concluido": 1}
+    print("✅ Worker com a reserva vencida não publica nem conclui o job de outro")
+
+async def _fila_de_mortos(pasta):
+    media = os.path.join(pasta, "midia.jpg")
+    open(media, "wb").close()
+    await publish_queue.enqueue(OfertaPublicacao("Oferta 2", media))
+    for _ in range(publish_queue.MAX_TENTATIVAS):
+        job = await publish_queue.proximo_job()
+        morto = await publish_queue.falhar(job, "erro de teste")
+        with database.get_connection() as conn:
+            conn.execute("UPDATE publish_jobs SET disponivel_em = 0 WHERE id = ?", (job.id,))
+    assert morto and not os.path.exists(media)
+    assert database.get_publish_queue_stats().get("falhou") == 1
+    print("✅ Tentativas esgotadas vão para a fila de mortos")
+
+async def _agendamento():
+    database.set_config("delay_minutos", "0")
+    assert database.next_publish_job_due() is None
+    atrasada = await publish_queue.enqueue(OfertaPublicacao("Agendada"), atraso=2)
+    imediata = await publish_queue.enqueue(OfertaPublicacao("Imediata"))
+    # A que venceu primeiro sai primeiro, mesmo tendo entrado depois
+    job = await publish_queue.proximo_job()
+    assert job.id == imediata
+    await publish_queue.concluir(job)
+    inicio = time.monotonic()
+    job = await asyncio.wait_for(publish_queue.proximo_job(), 5)
+    assert job.id == atrasada and time.monotonic() - inicio >= 0.5
+    await publish_queue.concluir(job)
+
+    # Intervalo mínimo entre liberações, mesmo com a fila cheia e vários workers
+    database.set_config("intervalo_publicacao_segundos", "0.3")
+    for i in range(3):
+        await publish_queue.enqueue(OfertaPublicacao(f"Rajada {i}"))
+    liberados = []
+
+    async def worker():
+        job = await publish_queue.proximo_job()
+        liberados.append(time.monotonic())
+        await publish_queue.concluir(job)
+
+    await asyncio.gather(*[worker() for _ in range(3)])
+    liberados.sort()
+    assert all(b - a >= 0.29 for a, b in zip(liberados, liberados[1:]))
+    database.set_config("intervalo_publicacao_segundos", "0")
+    print("✅ Ofertas saem no horário agendado e com intervalo mínimo")
+
+async def _ofertas_pendentes(pasta):
+    def midia(nome):
+        caminho = os.path.join(pasta, nome)
+        open(caminho, "wb").close()
+        return caminho
+
+    database.set_config("aprovacao_max_pendentes", "2")
+    m1, m2, m3 = midia("p1.jpg"), midia("p2.jpg"), midia("p3.jpg")
+    id1 = await pending_offers.adicionar(OfertaPublicacao("Pendente 1", m1, hash_texto="hash_pendente"))
+    # Aguardando o admin, o mesmo texto de outra fonte já é duplicado
+    assert database.check_duplicate("hash_pendente")
+    id2 = await pending_offers.adicionar(OfertaPublicacao("Pendente 2", m2))
+    id3 = await pending_offers.adicionar(OfertaPublicacao("Pendente 3", m3))
+    # Limite de 2: a mais antiga sai e leva a mídia junto
+    assert await pending_offers.obter(id1) is None and not os.path.exists(m1)
+
+    assert (await pending_offers.editar_texto(id2, "Editada")).texto == "Editada"
+    assert (await pending_offers.retirar(id2)).texto == "Editada"
+    assert await pending_offers.retirar(id2) is None  # Segundo clique em "Postar"
+
+    # Expiração
+    with database.get_connection() as conn:
+        conn.execute("UPDATE pending_offers SET expira_em = 0 WHERE id = ?", (id3,))
+    assert await pending_offers.obter(id3) is None
+    assert await pending_offers.expirar_vencidas() == 1 and not os.path.exists(m3)
+    print("✅ Ofertas pendentes com id estável, limite e expiração")
+
+def test_fila_persistente():
+    with banco_temporario():
+        asyncio.run(_fila_persistente())
+
+def test_reserva_vencida():
+    with banco_temporario() as pasta:
+        asyncio.run(_reserva_vencida(pasta))
+
+def test_fila_de_mortos():
+    with banco_temporario() as pasta:
+        asyncio.run(_fila_de_mortos(pasta))
+
+def test_agendamento():
+    with banco_temporario():
+        asyncio.run(_agendamento())
+
+def test_ofertas_pendentes():
+    with banco_temporario() as pasta:
+        asyncio.run(_ofertas_pendentes(pasta))
+
+if __name__ == "__main__":
+    test_fila_persistente()
+    test_reserva_vencida()
+    test_fila_de_mortos()
+    test_agendamento()
+    test_ofertas_pendentes()
@@ -0,0 +1,50 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import rate_limiter
+from rate_limiter import TokenBucket
+
+def test_rajada_e_divida():
+    balde = TokenBucket(taxa=10, capacidade=3)
+    # A rajada sai sem espera, depois cada ficha custa 1/taxa
+    assert [round(balde.reservar(), 2) for _ in range(5)] == [0, 0, 0, 0.1, 0.2]
+    # Pedido maior que a capacidade: espera o tempo de repor a dívida
+    balde = TokenBucket(taxa=2, capacidade=1)
+    assert balde.reservar(4) == 0
+    assert round(balde.reservar(), 1) == 2.0
+    print("✅ Rajada imediata e esperas em ordem de chegada")
+
+async def _envios_concorrentes_respeitam_a_taxa():
+    balde = TokenBucket(taxa=20, capacidade=1)
+    inicio = time.monotonic()
+    await asyncio.gather(*[balde.adquirir() for _ in range(5)])
+    # 1 da rajada + 4 fichas a 20/s = 0.2s, não importa quantos esperam juntos
+    assert 0.18 <= time.monotonic() - inicio < 0.4
+    print("✅ Vários workers juntos não passam da taxa do destino")
+
+def test_envios_concorrentes_respeitam_a_taxa():
+    asyncio.run(_envios_concorrentes_respeitam_a_taxa())
+
+async def _chats_independentes():
+    rate_limiter._telegram_chats.clear()
+    inicio = time.monotonic()
+    # Rajada cheia em dois canais diferentes: nenhum espera o outro
+    for _ in range(rate_limiter.TELEGRAM_CHAT_RAJADA):
+        await rate_limiter.telegram("@canal_a")
+        await rate_limiter.telegram(-1001234567890)
+    assert time.monotonic() - inicio < 0.1
+    # O próximo no mesmo canal espera o limite por minuto
+    assert rate_limiter._telegram_chats["@canal_a"].reservar() > 1
+    print("✅ Limite por canal separado do limite global")
+
+def test_chats_independentes():
+    asyncio.run(_chats_independentes())
+
+if __name__ == "__main__":
+    test_rajada_e_divida()
+    test_envios_concorrentes_respeitam_a_taxa()
+    test_chats_independentes()
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database
+import retention
+from apoio_testes import banco_temporario
+from publish_queue import OfertaPublicacao
+
+def _arquivo(caminho: str, idade: float = 0) -> str:
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, "wb") as f:
+        f.write(b"img")
+    antigo = time.time() - idade
+    os.utime(caminho, (antigo, antigo))
+    return caminho
+
+def test_retencao():
+    # Diretório temporário também: static/uploads e downloads são caminhos relativos
+    with banco_temporario(mudar_diretorio=True):
+        _retencao()
+
+def _retencao():
+    dois_dias = 2 * 86400
+
+    # Posts: antigos saem com a imagem, recentes ficam; os cliques continuam no total
+    velho = _arquivo(os.path.join("static", "uploads", "velho.jpg"), dois_dias)
+    novo = _arquivo(os.path.join("static", "uploads", "novo.jpg"), dois_dias)
+    orfao = _arquivo(os.path.join("static", "uploads", "orfao.jpg"), dois_dias)
+    recente = _arquivo(os.path.join("static", "uploads", "recente.jpg"))
+    code = database.create_short_link("https://exemplo.com/velho")
+    sem_clique = database.create_short_link("https://exemplo.com/sem-clique")
+    database.add_post("Post velho", velho, "", code)
+    database.add_post("Post novo", novo, "", None)
+    for _ in range(3):
+        database.record_click(code)
+    database.flush_clicks()
+    database.rollup_clicks()
+    total_cliques = database.get_total_clicks()
+    with database.get_connection() as conn:
+        conn.execute("UPDATE posts SET created_at = ? WHERE title = 'Post velho'", (database._utc_str(time.time() - 10 * 86400),))
+        conn.execute("UPDATE click_events SET ts = ts - ?", (10 * 86400,))
+        conn.execute("UPDATE short_links SET created_at = ?", (database._utc_str(time.time() - 10 * 86400),))
+
+    # Downloads: temporário velho sem dono sai, o de uma oferta pendente fica
+    lixo = _arquivo(os.path.join("downloads", "lixo.jpg"), 3 * 86400)
+    pendente = _arquivo(os.path.join("downloads", "pendente.jpg"), 3 * 86400)
+    database.add_pending_offer(OfertaPublicacao("Oferta", media_path=pendente).to_json(), 3600, 10)
+
+    # Jobs: concluídos antigos saem, pendentes ficam
+    job_antigo = database.enqueue_publish_job('{"texto": "A"}')
+    reservado = database.claim_publish_job(600, 5)
+    database.complete_publish_job(job_antigo, reservado["tentativas"])
+    database.enqueue_publish_job('{"texto": "B"}')
+    with database.get_connection() as conn:
+        conn.execute("UPDATE publish_jobs SET updated_at = ? WHERE id = ?", (database._utc_str(time.time() - 30 * 86400), job_antigo))
+
+    for chave, valor in (("retencao_posts_dias", "5"), ("retencao_cliques_dias", "5"),
+                         ("retencao_jobs_dias", "7"), ("retencao_links_dias", "5")):
+        database.set_config(chave, valor)
+    lote_original, retention.RETENCAO_LOTE = retention.RETENCAO_LOTE, 2  # Força várias rodadas de lote
+    try:
+        asyncio.run(retention.aplicar_retencao())
+    finally:
+        retention.RETENCAO_LOTE = lote_original
+
+    with database.get_connection() as conn:
+        assert [r[0] for r in conn.execute("SELECT title FROM posts")] == ["Post novo"]
+        assert conn.execute("SELECT COUNT(*) FROM click_events").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM publish_jobs").fetchone()[0] == 1
+        # O link velho teve clique dentro do período: continua funcionando; o sem clique sai
+        assert [r[0] for r in conn.execute("SELECT short_code FROM short_links")] == [code]
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert database.get_total_clicks() == total_cliques
+    assert database.get_long_url_by_code(sem_clique) is None
+    assert not os.path.exists(velho) and not os.path.exists(orfao) and not os.path.exists(lixo)
+    assert os.path.exists(novo) and os.path.exists(recente) and os.path.exists(pendente)
+    print("✅ Retenção em lotes preserva estatísticas, mídias em uso e arquivos recentes")
+
+if __name__ == "__main__":
+    test_retencao()
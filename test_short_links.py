@@ -0,0 +1,88 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database
+from apoio_testes import banco_temporario
+
+def test_codigos_unicos_e_estaveis():
+    with banco_temporario():
+        _codigos_unicos_e_estaveis()
+
+def _codigos_unicos_e_estaveis():
+    codigos = set()
+    for i in range(1000):
+        code = database.create_short_link(f"https://exemplo.com/produto/{i}")
+        assert len(code) == database.SHORT_CODE_LENGTH and code.isalnum(), code
+        codigos.add(code)
+    assert len(codigos) == 1000, "Códigos repetidos!"
+
+    # Mesma URL devolve o mesmo código
+    assert database.create_short_link("https://exemplo.com/produto/7") in codigos
+    assert database.create_short_link("https://exemplo.com/produto/7") == database.create_short_link("https://exemplo.com/produto/7")
+    assert database.get_long_url_by_code(database.create_short_link("https://exemplo.com/produto/42")) == "https://exemplo.com/produto/42"
+    print("✅ 1000 códigos únicos e idempotentes")
+
+def test_colisao_com_codigo_legado():
+    with banco_temporario():
+        _colisao_com_codigo_legado()
+
+def _colisao_com_codigo_legado():
+    # Um código aleatório antigo que coincide com o próximo da sequência é pulado
+    database.create_short_link("https://exemplo.com/primeiro")  # Reserva o bloco deste banco
+    proximo = database._encode_short_code(database._short_code_block["proximo"])
+    with database.get_connection() as conn:
+        conn.execute("INSERT INTO short_links (short_code, long_url) VALUES (?, ?)", (proximo, "https://legado.com"))
+    code = database.create_short_link("https://exemplo.com/novo")
+    assert code != proximo
+    assert database.get_long_url_by_code(code) == "https://exemplo.com/novo"
+    print("✅ Colisão com código legado tratada")
+
+def test_bijecao():
+    # Amostra da bijeção: números distintos nunca geram o mesmo código
+    amostra = {database._encode_short_code(n) for n in range(0, 200000, 7)}
+    assert len(amostra) == len(range(0, 200000, 7))
+    print("✅ Bijeção sem colisões na amostra")
+
+def test_cliques_agregados():
+    with banco_temporario():
+        _cliques_agregados()
+
+def _cliques_agregados():
+    code = database.create_short_link("https://exemplo.com/viral")
+    for _ in range(50):
+        assert database.get_long_url_by_code(code) == "https://exemplo.com/viral"
+        database.record_click(code)
+    total_antes = database.get_total_clicks()
+    assert database.flush_clicks() == 50
+    assert database.flush_clicks() == 0
+    assert database.get_total_clicks() == total_antes
+    with database.get_connection() as conn:
+        assert conn.execute("SELECT clicks FROM short_links WHERE short_code = ?", (code,)).fetchone()[0] == 50
+    print("✅ Cada clique contado uma vez e gravado em lote")
+
+def test_rollup_cliques():
+    with banco_temporario():
+        _rollup_cliques()
+
+def _rollup_cliques():
+    code = database.create_short_link("https://www.amazon.com.br/dp/B000000001")
+    for ua in ("mobile", "desktop", "bot"):
+        database.record_click(code, ua)
+    database.flush_clicks()
+    total_antes = database.get_total_clicks()
+    assert database.rollup_clicks() > 0
+    assert database.rollup_clicks() == 0  # Marca d'água: nada é agregado duas vezes
+    assert database.get_total_clicks() == total_antes
+    analytics = database.get_click_analytics()
+    assert {"loja": "amazon", "clicks": 3} in analytics["por_loja"]
+    assert sum(h["clicks"] for h in analytics["por_hora"]) == total_antes
+    print("✅ Rollup por hora/dia/loja consistente com o total")
+
+if __name__ == "__main__":
+    test_codigos_unicos_e_estaveis()
+    test_colisao_com_codigo_legado()
+    test_bijecao()
+    test_cliques_agregados()
+    test_rollup_cliques()
@@ -0,0 +1,50 @@
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database_async as adb
+import status_snapshot
+from apoio_testes import banco_temporario
+
+async def _status():
+    return json.loads(await status_snapshot.obter_json())
+
+async def _snapshot_incremental():
+    await status_snapshot.invalidar_tudo()
+
+    inicial = await _status()
+    corpo = await status_snapshot.obter_json()
+    # Sem mudanças, a mesma resposta sai da memória
+    assert await status_snapshot.obter_json() is corpo
+
+    await adb.add_canal("@canal_snapshot")
+    await adb.add_keyword("snapshot")
+    await adb.set_config("pausado", "1")
+    code = await adb.create_short_link("https://exemplo.com/snapshot")
+    status = await _status()
+    assert status["canais_count"] == inicial["canais_count"] + 1
+    assert status["kw_count"] == inicial["kw_count"] + 1
+    assert status["pausado"] == "1"
+    assert status["recent_links"][0]["short_code"] == code
+
+    # Cliques entram no snapshot sem reler o banco
+    for _ in range(3):
+        await adb.increment_click(code)
+    status = await _status()
+    assert status["total_clicks"] == inicial["total_clicks"] + 3
+    assert status["recent_links"][0]["clicks"] == 3
+    assert status["total_clicks"] == await adb.get_total_clicks()
+
+    await adb.enqueue_publish_job('{"texto": "Oferta"}')
+    assert (await _status())["fila_publicacao"] == {"pendente": 1}
+    print("✅ Snapshot do status atualizado incrementalmente")
+
+def test_snapshot_incremental():
+    with banco_temporario():
+        asyncio.run(_snapshot_incremental())
+
+if __name__ == "__main__":
+    test_snapshot_incremental()
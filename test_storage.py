@@ -0,0 +1,33 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database_async
+from storage import PostgresStorage, SQLiteStorage, Storage
+
+def test_interface_cobre_o_database_async():
+    # Toda função que o database_async repassa ao backend precisa estar na interface
+    faltando = database_async._delegadas - Storage.__abstractmethods__
+    assert not faltando, f"Fora da interface Storage: {sorted(faltando)}"
+    print("✅ Interface Storage cobre todas as funções delegadas")
+
+def test_backends_completos():
+    # Com algum método abstrato sem implementação, a criação já levanta TypeError
+    assert isinstance(SQLiteStorage(), Storage)
+    assert isinstance(PostgresStorage("postgresql://localhost/teste"), Storage)
+
+    class Incompleto(Storage):
+        async def get_canais(self):
+            return []
+
+    try:
+        Incompleto()
+        assert False, "Backend incompleto foi criado"
+    except TypeError:
+        pass
+    print("✅ Backends implementam a interface inteira")
+
+if __name__ == "__main__":
+    test_interface_cobre_o_database_async()
+    test_backends_completos()
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import links
+import title_extractor
+from title_extractor import CONFIANCA_MINIMA, extrair
+
+def test_slugs_das_lojas():
+    casos = {
+        "https://www.amazon.com.br/Echo-Dot-5a-geracao-Alexa/dp/B09B8VGCR8?tag=x": "Echo Dot 5a geracao Alexa",
+        "https://produto.mercadolivre.com.br/MLB-1234567890-fone-bluetooth-jbl-tune-520bt-_JM": "fone bluetooth jbl tune 520bt",
+        "https://www.mercadolivre.com.br/air-fryer-mondial-4l/p/MLB19345678": "air fryer mondial 4l",
+        "https://shopee.com.br/Kit-5-Cuecas-Boxer-Algodao-i.123456.987654321": "Kit 5 Cuecas Boxer Algodao",
+        "https://www.magazineluiza.com.br/smart-tv-50-samsung-crystal/p/abc123/et/tv4k/": "smart tv 50 samsung crystal",
+    }
+    for url, esperado in casos.items():
+        extraido = extrair(f"🔥 Corre!\n{url}")
+        assert extraido.titulo == esperado and extraido.fonte == "slug", (url, extraido)
+        assert extraido.confianca >= CONFIANCA_MINIMA
+    # Links sem nome no caminho não servem de título
+    assert extrair("https://www.amazon.com.br/dp/B09B8VGCR8").fonte != "slug"
+    assert extrair("https://shopee.com.br/product/123/456").fonte != "slug"
+    print("✅ Nome do produto tirado do slug das lojas")
+
+def test_link_curto_expandido():
+    links._expand_cache["https://amzn.to/cafeteira1"] = (time.time(), "https://www.amazon.com.br/Cafeteira-Nespresso-Essenza-Mini/dp/B07XYZ")
+    try:
+        extraido = extrair("Olha isso\nhttps://amzn.to/cafeteira1")
+        assert extraido.titulo == "Cafeteira Nespresso Essenza Mini" and extraido.fonte == "slug"
+    finally:
+        links._expand_cache.pop("https://amzn.to/cafeteira1", None)  # O cache é do processo inteiro
+    print("✅ Link curto usa a expansão já em cache, sem rede")
+
+def test_texto():
+    extraido = extrair("🔥 OFERTA RELÂMPAGO 🔥\nSmartphone Samsung Galaxy S25 128GB\n💰 R$ 3.999,00 no PIX\nhttps://loja.exemplo.com/x")
+    assert extraido.titulo == "Smartphone Samsung Galaxy S25 128GB" and extraido.fonte == "texto"
+    assert extraido.confianca >= CONFIANCA_MINIMA
+    # Linha comum sem modelo, marca ou link que confirme: fica para o Gemini
+    assert extrair("Kit 5 Cuecas Boxer Algodão\nR$ 49,90").confianca < CONFIANCA_MINIMA
+    assert extrair("Bom dia pessoal\nR$ 49,90").confianca < CONFIANCA_MINIMA
+    # A mesma linha confirmada pelo caminho do link passa
+    extraido = extrair("Kit 5 Cuecas Boxer Algodão\nhttps://loja.exemplo.com/kit-cuecas-boxer/123")
+    assert extraido.fonte == "texto" and extraido.confianca >= CONFIANCA_MINIMA
+    # Só chamada de promoção ou frase corrida: confiança baixa
+    assert extrair("CORRE QUE BAIXOU!!! MENOR PREÇO HOJE").confianca < CONFIANCA_MINIMA
+    frase = "gente eu comprei esse aqui semana passada e to usando todo dia no trabalho e recomendo demais pra vocês"
+    assert extrair(frase).confianca < CONFIANCA_MINIMA
+    print("✅ Linha de título reconhecida no texto, chamada de promoção descartada")
+
+async def _gemini_so_com_confianca_baixa():
+    chamadas = []
+
+    async def gemini_falso(texto):
+        chamadas.append(texto)
+        return "Cadeira Gamer ThunderX3"
+
+    sys.modules["rewriter"] = SimpleNamespace(extrair_nome_produto=gemini_falso)
+    try:
+        extraido = await title_extractor.obter_titulo("Smartphone Samsung Galaxy S25 128GB\nR$ 3.999")
+        assert extraido.fonte == "texto" and chamadas == []
+
+        texto_vago = "CORRE QUE BAIXOU!!!\nhttps://loja.exemplo.com/oferta/123?ref=9"
+        extraido = await title_extractor.obter_titulo(texto_vago)
+        assert extraido.titulo == "Cadeira Gamer ThunderX3" and extraido.fonte == "gemini"
+        assert len(chamadas) == 1
+        # Mesmo link repassado por outra fonte: sai do cache, sem outra chamada
+        extraido = await title_extractor.obter_titulo("Vem ver!\nhttps://loja.exemplo.com/oferta/123")
+        assert extraido.fonte == "cache" and len(chamadas) == 1
+    finally:
+        del sys.modules["rewriter"]
+    print("✅ Gemini só é chamado quando as regras não têm confiança, e o resultado fica em cache")
+
+def test_gemini_so_com_confianca_baixa():
+    asyncio.run(_gemini_so_com_confianca_baixa())
+
+if __name__ == "__main__":
+    test_slugs_das_lojas()
+    test_link_curto_expandido()
+    test_texto()
+    test_gemini_so_com_confianca_baixa()
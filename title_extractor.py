@@ -0,0 +1,228 @@
+"""
+Nome do produto sem ida ao Gemini, para a checagem de duplicidade das mensagens sem ID de produto.
+
+Antes, toda mensagem que o product_id.py não identificava fazia uma chamada ao Gemini só para
+extrair o nome do produto; com o semáforo de 1 e a pausa de 1 s do rewriter, isso disputava
+a vez com as reescritas. Agora o nome sai primeiro de regras locais, cada uma com uma confiança:
+  - títulos já aprendidos para o mesmo link (Gemini ou scraper de mensagens anteriores);
+  - o slug das URLs das lojas (Amazon /Nome/dp/ASIN, Mercado Livre MLB-123-nome-_JM e
+    /nome/p/MLB123, Shopee Nome-i.LOJA.ITEM, Magalu /nome/p/ID/), inclusive dos links curtos
+    que o links.py já expandiu (só o cache, sem rede);
+  - a linha do texto que mais parece um título (sem emojis, preços, links e chamadas de promoção).
+    Uma linha qualquer fica abaixo de CONFIANCA_MINIMA; só passa com sinais de produto:
+    modelo/capacidade (S25, 128GB), marca conhecida ou palavras em comum com o caminho do link.
+O Gemini só é chamado quando nenhuma regra passa de CONFIANCA_MINIMA.
+
+Uso:
+    extraido = await title_extractor.obter_titulo(texto)
+    extraido.titulo, extraido.confianca, extraido.fonte
+"""
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from urllib.parse import unquote, urlparse
+
+from keyword_matcher import dobrar
+from links import expansao_em_cache, extract_urls
+
+CONFIANCA_MINIMA = 0.6
+TITULOS_CACHE_MAX = 2000
+LINHAS_ANALISADAS = 5
+MAX_PALAVRAS_TITULO = 12
+
+# Link (sem query string) -> título aprendido. Várias fontes repassam o mesmo link.
+_titulos = OrderedDict()
+
+# Palavras de chamada de promoção (já sem acento), que não fazem parte do nome do produto
+PALAVRAS_PROMO = {
+    "oferta", "ofertas", "promocao", "promocoes", "promo", "imperdivel", "corre", "corra", "corram",
+    "baixou", "baixa", "queda", "menor", "preco", "precos", "historico", "minimo", "desconto",
+    "descontos", "cupom", "cupons", "frete", "gratis", "aproveite", "aproveita", "relampago",
+    "hoje", "agora", "so", "apenas", "link", "compre", "comprar", "aqui", "pix", "vista",
+    "parcelado", "juros", "off", "achado", "achadinho", "achadinhos", "bug", "urgente",
+    "black", "friday", "estoque", "ultimas", "unidades", "vale", "pena", "barato", "barata",
+    "top", "super", "mega", "liberado", "voltou", "r",
+}
+# Marcas frequentes nas ofertas (sem acento): sinal de que a linha é o nome de um produto
+MARCAS = {
+    "samsung", "apple", "iphone", "ipad", "macbook", "airpods", "xiaomi", "redmi", "motorola", "lg",
+    "sony", "playstation", "xbox", "nintendo", "jbl", "philips", "mondial", "electrolux", "brastemp",
+    "consul", "arno", "britania", "oster", "tramontina", "dell", "lenovo", "acer", "asus", "hp",
+    "positivo", "multilaser", "intelbras", "logitech", "redragon", "kindle", "echo", "alexa",
+    "nespresso", "dolce", "wap", "black+decker", "bosch", "makita", "nike", "adidas", "puma",
+    "olympikus", "havaianas", "lego", "hasbro", "mattel", "nivea", "loreal", "gillette", "oral",
+}
+# Conectivos que podem ficar no meio do nome ("Kit de Panelas"), mas não nas pontas
+CONECTIVOS = {"de", "da", "do", "das", "dos", "e", "com", "sem", "para", "pra", "por", "no", "na", "em", "a", "o", "ate"}
+
+_RE_URL = re.compile(r'(?:https?://|www\.)\S+|\b[\w-]+\.(?:com|la|to|gd|ly|run)(?:\.br)?/\S*')
+_RE_PRECO = re.compile(r'R\$\s?[\d.,]+|\b\d+\s?x\b|\b\d+(?:[.,]\d+)?\s?%|\b\d{1,3}(?:\.\d{3})*,\d{2}\b', re.IGNORECASE)
+_RE_HASHTAG = re.compile(r'[#@]\w+')
+_RE_SIMBOLOS = re.compile(r'[^\w\s\-+/.,]')
+_RE_MODELO = re.compile(r'\b(?=\w*\d)(?=\w*[a-zA-Z])\w{2,}\b')  # S25, 520BT, 128GB
+
+@dataclass
+class TituloExtraido:
+    titulo: str
+    confianca: float
+    fonte: str  # "cache", "slug", "texto", "gemini" ou "" (nada encontrado)
+
+def _referencia(url: str) -> str:
+    return url.split('?')[0].split('#')[0]
+
+def lembrar(referencia: str, titulo: str):
+    """Guarda o título obtido (Gemini/scraper) para o mesmo link não precisar de outra chamada."""
+    if not referencia or not titulo or titulo == "Oferta Desconhecida":
+        return
+    chave = _referencia(referencia)
+    _titulos.pop(chave, None)
+    if len(_titulos) >= TITULOS_CACHE_MAX:
+        _titulos.popitem(last=False)
+    _titulos[chave] = titulo.strip()
+
+def _palavras_slug(slug: str) -> str:
+    texto = unquote(slug).replace('+', ' ')
+    texto = re.sub(r'[-_]+', ' ', texto)
+    return re.sub(r'\s+', ' ', texto).strip()
+
+def _do_slug(url: str):
+    """(título, confiança) pelo caminho da URL da loja, ou None."""
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return None
+    host = parsed.netloc.lower()
+    partes = [p for p in parsed.path.split('/') if p]
+    titulo, confianca = "", 0.0
+
+    if "amazon." in host:
+        # /Nome-do-Produto/dp/B0XXXX (o /dp/ASIN sozinho não tem nome)
+        for i, parte in enumerate(partes):
+            if parte in ("dp", "gp") and i > 0:
+                titulo, confianca = _palavras_slug(partes[i - 1]), 0.9
+                break
+    elif "mercadolivre." in host or "mercadolibre." in host:
+        # produto.mercadolivre.com.br/MLB-1234567-nome-do-produto-_JM
+        m = re.match(r'MLB-?\d+-(.+?)(?:-_JM)?$', partes[0], re.IGNORECASE) if partes else None
+        if m:
+            titulo, confianca = _palavras_slug(m.group(1)), 0.85
+        # www.mercadolivre.com.br/nome-do-produto/p/MLB123
+        elif "p" in partes and partes.index("p") > 0:
+            titulo, confianca = _palavras_slug(partes[partes.index("p") - 1]), 0.85
+    elif "shopee." in host and partes:
+        # shopee.com.br/Nome-do-Produto-i.LOJA.ITEM (a forma /produto/LOJA/ITEM não tem nome)
+        m = re.match(r'(.+)-i\.\d+\.\d+$', partes[0])
+        if m:
+            titulo, confianca = _palavras_slug(m.group(1)), 0.9
+    elif "magazineluiza." in host or "magalu." in host:
+        # magazineluiza.com.br/nome-do-produto/p/abc123/xx/yyyy/
+        if "p" in partes and partes.index("p") > 0:
+            titulo, confianca = _palavras_slug(partes[partes.index("p") - 1]), 0.85
+
+    # Mesmo critério do affiliate/scraper: slug curto demais costuma ser código, não nome
+    if not titulo or (titulo.count(' ') < 2 and len(titulo) <= 15):
+        return None
+    return titulo, confianca
+
+def _limpar_linha(linha: str) -> str:
+    linha = _RE_URL.sub(' ', linha)
+    linha = _RE_PRECO.sub(' ', linha)
+    linha = _RE_HASHTAG.sub(' ', linha)
+    linha = _RE_SIMBOLOS.sub(' ', linha)
+    palavras = linha.replace('_', ' ').split()
+    # Tira as chamadas de promoção e conectivos das pontas ("OFERTA RELÂMPAGO: Fone X por")
+    while palavras and (dobrar(palavras[0]).strip('.,-/') in PALAVRAS_PROMO | CONECTIVOS or not any(c.isalnum() for c in palavras[0])):
+        palavras.pop(0)
+    while palavras and (dobrar(palavras[-1]).strip('.,-/') in PALAVRAS_PROMO | CONECTIVOS or not any(c.isalnum() for c in palavras[-1])):
+        palavras.pop()
+    return " ".join(palavras).strip(' .,-/')
+
+def _palavras_dos_links(texto: str) -> set:
+    """Palavras (sem acento) dos caminhos dos links, para conferir a linha candidata com o link."""
+    palavras = set()
+    for url in extract_urls(texto):
+        try:
+            caminho = urlparse(url).path
+        except ValueError:
+            continue
+        palavras.update(dobrar(p) for p in re.findall(r'[^\W\d_]{3,}', unquote(caminho)))
+    return palavras
+
+def _do_texto(texto: str):
+    """(título, confiança) pela linha do texto que mais parece nome de produto, ou None."""
+    melhor = None
+    do_link = _palavras_dos_links(texto)
+    linhas = [l for l in texto.split('\n') if l.strip()][:LINHAS_ANALISADAS]
+    for posicao, original in enumerate(linhas):
+        palavras_originais = [dobrar(p) for p in re.findall(r'[^\W\d_]{2,}', original)]
+        if not palavras_originais:
+            continue
+        promo = sum(p in PALAVRAS_PROMO for p in palavras_originais) / len(palavras_originais)
+        candidato = _limpar_linha(original)
+        palavras = [p for p in candidato.split() if any(c.isalpha() for c in p)]
+        if len(palavras) < 2:
+            continue
+        if len(palavras) > MAX_PALAVRAS_TITULO:
+            # Frase corrida ("Gente, esse fone é muito bom..."), não título
+            confianca = 0.3
+        else:
+            # Abaixo de CONFIANCA_MINIMA: sem sinal de produto, quem decide é o Gemini
+            confianca = 0.4 - 0.4 * promo
+            dobradas = {dobrar(p) for p in palavras}
+            if _RE_MODELO.search(candidato):
+                confianca += 0.15  # Modelo/capacidade (S25, 520BT, 128GB) é forte sinal de produto
+            if dobradas & MARCAS:
+                confianca += 0.1
+            if len(dobradas & do_link) >= 2:
+                confianca += 0.2  # A linha bate com o caminho do link da oferta
+            if sum(p[0].isupper() for p in palavras) >= len(palavras) / 2:
+                confianca += 0.05  # Nome Próprio Capitalizado
+            confianca -= 0.05 * posicao  # Título costuma vir no topo
+        if melhor is None or confianca > melhor[1]:
+            melhor = (candidato, round(confianca, 2))
+    return melhor
+
+def extrair(texto: str) -> TituloExtraido:
+    """Nome do produto só com regras locais (sem rede), com a confiança da regra que acertou."""
+    urls = []
+    for url in extract_urls(texto or ""):
+        urls.append(url)
+        expandida = expansao_em_cache(url)
+        if expandida and expandida != url:
+            urls.append(expandida)
+
+    for url in urls:
+        aprendido = _titulos.get(_referencia(url))
+        if aprendido:
+            _titulos.move_to_end(_referencia(url))
+            return TituloExtraido(aprendido, 0.95, "cache")
+
+    melhor = TituloExtraido("", 0.0, "")
+    for url in urls:
+        do_slug = _do_slug(url)
+        if do_slug and do_slug[1] > melhor.confianca:
+            melhor = TituloExtraido(do_slug[0], do_slug[1], "slug")
+
+    do_texto = _do_texto(texto or "")
+    if do_texto and do_texto[1] > melhor.confianca:
+        melhor = TituloExtraido(do_texto[0], do_texto[1], "texto")
+    return melhor
+
+async def obter_titulo(texto: str) -> TituloExtraido:
+    """
+    Nome do produto pelas regras locais; o Gemini só é chamado se a confiança ficar abaixo
+    de CONFIANCA_MINIMA. Se o Gemini falhar, volta o palpite local (pode ser vazio).
+    """
+    local = extrair(texto)
+    if local.confianca >= CONFIANCA_MINIMA:
+        print(f"🏷️ Título extraído sem IA ({local.fonte}, confiança {local.confianca:.2f}): {local.titulo}")
+        return local
+
+    from rewriter import extrair_nome_produto
+    nome = await extrair_nome_produto(texto)
+    if nome and nome != "Oferta Desconhecida":
+        urls = extract_urls(texto or "")
+        if urls:
+            lembrar(urls[0], nome)
+        return TituloExtraido(nome, 0.9, "gemini")
+    return local
@@ -1,10 +1,7 @@
 from aiohttp import web
-from database import (
-    get_config, set_config, get_canais, add_canal, remove_canal,
-    get_keywords, add_keyword, remove_keyword,
-    get_negative_keywords, add_negative_keyword, remove_negative_keyword,
-    get_admins, add_admin, remove_admin, get_active_sorteios, create_sorteio, finalize_sorteio
-)
+from database import get_config
+import database_async as adb
+import status_snapshot
 import secrets
 import os
 import sys
@@ -297,6 +294,7 @@ async def handle_index(request):
                     <div class="filter-tabs">
                         <button class="filter-btn active" id="filter-recent" onclick="setPostSort('recent')">Mais Recentes</button>
                         <button class="filter-btn" id="filter-clicked" onclick="setPostSort('clicked')">Mais Clicadas</button>
+                        <button class="filter-btn" id="filter-relevance" onclick="setPostSort('relevance')">Mais Relevantes</button>
                     </div>
 
                     <div id="posts-list">
@@ -598,7 +596,7 @@ async def handle_index(request):
                 const r = await fetch(`/api/${{p}}${{s}}token=${{token}}`, {{ method: m, body: b ? JSON.stringify(b) : null, headers: {{'Content-Type':'application/json'}} }});
                 return await r.json();
             }}
-            let postsOffset = 0;
+            let postsCursor = '';
             let postsLoading = false;
             let postsHasMore = true;
             let postsSort = 'recent';
@@ -607,7 +605,7 @@ async def handle_index(request):
 
             async function loadPosts(reset = false) {{
                 if (reset) {{
-                    postsOffset = 0;
+                    postsCursor = '';
                     postsHasMore = true;
                     document.getElementById('posts-list').innerHTML = '';
                     document.getElementById('posts-scroll-indicator').innerText = 'Carregando posts...';
@@ -618,10 +616,11 @@ async def handle_index(request):
                 postsLoading = true;
                 const limit = 20;
                 try {{
-                    const url = `posts?search=${{encodeURIComponent(postsSearch)}}&sort=${{postsSort}}&offset=${{postsOffset}}&limit=${{limit}}`;
-                    const posts = await api(url);
+                    const url = `posts?search=${{encodeURIComponent(postsSearch)}}&sort=${{postsSort}}&cursor=${{encodeURIComponent(postsCursor)}}&limit=${{limit}}`;
+                    const page = await api(url);
+                    const posts = page.posts || [];
                     
-                    if (posts.length < limit) {{
+                    if (!page.next_cursor) {{
                         postsHasMore = false;
                         document.getElementById('posts-scroll-indicator').innerText = posts.length === 0 && reset ? 'Nenhum post encontrado.' : 'Fim dos posts.';
                     }} else {{
@@ -647,7 +646,7 @@ async def handle_index(request):
                         list.appendChild(item);
                     }});
                     
-                    postsOffset += posts.length;
+                    postsCursor = page.next_cursor || '';
                 }} catch (e) {{
                     console.error(e);
                     document.getElementById('posts-scroll-indicator').innerText = 'Erro ao carregar.';
@@ -1087,6 +1086,7 @@ async def handle_index(request):
             async function loadSettings() {{
                 const f = [
                     {{k:'delay_minutos',l:'Delay (Telegram)'}},
+                    {{k:'intervalo_publicacao_segundos',l:'Intervalo mínimo entre publicações (segundos)'}},
                     {{k:'preco_minimo',l:'Preço Mínimo'}},
                     {{k:'assinatura',l:'Assinatura'}},
                     {{k:'webapp_url',l:'WebApp URL'}},
@@ -1342,77 +1342,80 @@ async def check_token(request):
 
 async def handle_status_api(request):
     if not await check_token(request): return web.json_response({"error": "Unauthorized"}, status=403)
-    from database import get_total_clicks, get_short_links_stats
-    return web.json_response({
-        "canais_count": len(get_canais()),
-        "kw_count": len(get_keywords()),
-        "nkw_count": len(get_negative_keywords()),
-        "pausado": get_config("pausado"),
-        "aprovacao": get_config("aprovacao_manual"),
-        "only_admins": get_config("only_admins") or "0",
-        "total_clicks": get_total_clicks(),
-        "recent_links": get_short_links_stats(5)
-    })
+    # Servido do snapshot em memória (status_snapshot.py): o polling do painel não toca o banco
+    return web.Response(body=await status_snapshot.obter_json(), content_type="application/json")
+
+async def handle_clicks_api(request):
+    if not await check_token(request): return web.json_response({"error": "Unauthorized"}, status=403)
+    try:
+        dias = int(request.query.get('dias', 7))
+    except ValueError:
+        dias = 7
+    return web.json_response(await adb.get_click_analytics(dias=dias))
 
 async def handle_restart_api(request):
     if not await check_token(request): return web.json_response({"error": "Unauthorized"}, status=403)
     print("🔄 Reinicialização do Bot solicitada via Dashboard...")
     sys.stdout.flush()
     
-    def restart_process():
+    async def restart_process():
         print("💀 Encerrando processo e iniciando um novo...")
         sys.stdout.flush()
         try:
+            from storage import close_storage
+            from database import close_pool
+            await close_storage()
+            close_pool()
             # Substitui o processo atual por um novo processo python executando o mesmo script
             os.execv(sys.executable, ['python'] + sys.argv)
         except Exception as e:
             print(f"❌ Falha ao tentar reiniciar o processo: {e}")
             os._exit(1)
 
-    asyncio.get_event_loop().call_later(2.0, restart_process)
+    asyncio.get_event_loop().call_later(2.0, lambda: asyncio.ensure_future(restart_process()))
     return web.json_response({"success": True, "message": "Bot reiniciando..."})
 
 async def handle_canais_api(request):
     if not await check_token(request): return web.json_response({"error": "Unauthorized"}, status=403)
-    if request.method == 'GET': return web.json_response({"canais": get_canais()})
+    if request.method == 'GET': return web.json_response({"canais": await adb.get_canais()})
     elif request.method == 'POST':
-        data = await request.json(); add_canal(data.get('canal'))
+        data = await request.json(); await adb.add_canal(data.get('canal'))
         return web.json_response({"success": True})
     elif request.method == 'DELETE':
-        data = await request.json(); remove_canal(data.get('canal'))
+        data = await request.json(); await adb.remove_canal(data.get('canal'))
         return web.json_response({"success": True})
 
 async def handle_keywords_api(request):
     if not await check_token(request): return web.json_response({"error": "Unauthorized"}, status=403)
     is_neg = 'neg' in request.path
-    if request.method == 'GET': return web.json_response({"keywords": get_negative_keywords() if is_neg else get_keywords()})
+    if request.method == 'GET': return web.json_response({"keywords": await adb.get_negative_keywords() if is_neg else await adb.get_keywords()})
     elif request.method == 'POST':
         data = await request.json(); kw = data.get('keyword')
-        if kw: add_negative_keyword(kw) if is_neg else add_keyword(kw)
+        if kw: await adb.add_negative_keyword(kw) if is_neg else await adb.add_keyword(kw)
         return web.json_response({"success": True})
     elif request.method == 'DELETE':
         data = await request.json(); kw = data.get('keyword')
-        if kw: remove_negative_keyword(kw) if is_neg else remove_keyword(kw)
+        if kw: await adb.remove_negative_keyword(kw) if is_neg else await adb.remove_keyword(kw)
         return web.json_response({"success": True})
 
 async def handle_admins_api(request):
     if not await check_token(request): return web.json_response({"error": "Unauthorized"}, status=403)
-    if request.method == 'GET': return web.json_response({"admins": get_admins()})
+    if request.method == 'GET': return web.json_response({"admins": await adb.get_admins()})
     elif request.method == 'POST':
-        data = await request.json(); add_admin(int(data['user_id']), data.get('username', ''))
+        data = await request.json(); await adb.add_admin(int(data['user_id']), data.get('username', ''))
         return web.json_response({"success": True})
     elif request.method == 'DELETE':
-        data = await request.json(); remove_admin(int(data['user_id']))
+        data = await request.json(); await adb.remove_admin(int(data['user_id']))
         return web.json_response({"success": True})
 
 async def handle_sorteios_api(request):
     if not await check_token(request): return web.json_response({"error": "Unauthorized"}, status=403)
-    if request.method == 'GET': return web.json_response({"sorteios": get_active_sorteios()})
+    if request.method == 'GET': return web.json_response({"sorteios": await adb.get_active_sorteios()})
     elif request.method == 'POST':
-        data = await request.json(); create_sorteio(data['premio'])
+        data = await request.json(); await adb.create_sorteio(data['premio'])
         return web.json_response({"success": True})
     elif request.method == 'PATCH':
-        data = await request.json(); finalize_sorteio(int(data['id']), int(data['winner_id']), data['winner_name'])
+        data = await request.json(); await adb.finalize_sorteio(int(data['id']), int(data['winner_id']), data['winner_name'])
         return web.json_response({"success": True})
 
 async def handle_settings_api(request):
@@ -1426,7 +1429,9 @@ async def handle_settings_api(request):
             db_val = str(getattr(_conf, key, '') or '')
         return web.json_response({"valor": db_val or ''})
     elif request.method == 'POST':
-        data = await request.json(); set_config(data['chave'], str(data['valor']))
+        data = await request.json(); await adb.set_config(data['chave'], str(data['valor']))
+        # Relê as configs do backend (pega também edições feitas fora do processo)
+        await adb.reload_config()
         return web.json_response({"success": True})
 
 async def handle_logs_api(request):
@@ -1564,7 +1569,6 @@ async def handle_post_offer(request):
         
         # --- NOVO: Salvar Metadados do Post para o Dashboard ---
         try:
-            from database import add_post
             # Tentar extrair um título simples (primeira linha ou primeiras palavras)
             first_line = re.sub('<[^<]+?>', '', clean_text.split('\n')[0]).strip()
             title = first_line[:100] if first_line else "Oferta sem título"
@@ -1580,15 +1584,16 @@ async def handle_post_offer(request):
                         short_code = final_url.split('/')[-1]
                         break
             
-            add_post(title, img_path, post_url, short_code)
+            await adb.add_post(title, img_path, post_url, short_code)
         except Exception as e:
             print(f"Erro ao salvar metadados do post: {e}")
 
         # --- Envio para WhatsApp (Se habilitado) ---
         try:
-            from whatsapp_publisher import send_whatsapp_msg, format_whatsapp_text
-            wa_text = format_whatsapp_text(text_base)
-            send_whatsapp_msg(wa_text, img_path)
+            from whatsapp_publisher import publicar_whatsapp, format_whatsapp_text, whatsapp_destinos
+            if whatsapp_destinos():
+                # Mesmo ritmo da Green-API dos workers de publicação, sem travar o loop do dashboard
+                await publicar_whatsapp(format_whatsapp_text(text_base), img_path)
         except Exception as e:
             print(f"Erro ao disparar para WhatsApp (Manual): {e}")
             
@@ -1695,25 +1700,17 @@ async def handle_tg_groups(request):
     if not valid_token or token != valid_token:
         return web.json_response({"error": "Unauthorized"}, status=403)
     try:
+        import entity_cache
         from monitor import client
         if not client or not client.is_connected():
             # Tenta conectar se não estiver
             try: await client.connect()
             except: pass
-            
-        if not client.is_connected():
-            return web.json_response({"error": "Userbot não conectado ao Telegram. Verifique os logs."}, status=503)
         
-        dialogs = await client.get_dialogs(limit=100)
-        groups = []
-        for d in dialogs:
-            if d.is_group or d.is_channel:
-                username = getattr(d.entity, 'username', None)
-                groups.append({
-                    "id": d.id,
-                    "name": d.name,
-                    "username": f"@{username}" if username else None
-                })
+        # Servido do cache de entidades (get_dialogs só quando vence ou com ?refresh=1)
+        groups = await entity_cache.listar_grupos(client, atualizar=request.query.get('refresh') == '1')
+        if not groups and not client.is_connected():
+            return web.json_response({"error": "Userbot não conectado ao Telegram. Verifique os logs."}, status=503)
         return web.json_response({"groups": groups})
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
@@ -1771,29 +1768,39 @@ async def send_fb_capi_event(pixel_id, access_token, url, client_ip, user_agent,
 async def handle_posts_api(request):
     if not await check_token(request): return web.json_response({"error": "Unauthorized"}, status=403)
     try:
-        from database import get_posts
         search = request.query.get("search")
         sort = request.query.get("sort", "recent")
-        offset = int(request.query.get("offset", 0))
-        limit = int(request.query.get("limit", 20))
+        cursor = request.query.get("cursor") or None
+        try:
+            limit = max(1, min(int(request.query.get("limit", 20)), 100))
+        except ValueError:
+            return web.json_response({"error": "limit inválido"}, status=400)
         
-        posts = get_posts(search=search, sort=sort, offset=offset, limit=limit)
-        return web.json_response(posts)
+        page = await adb.get_posts_page(search=search, sort=sort, cursor=cursor, limit=limit)
+        return web.json_response(page)
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
+def classify_user_agent(ua: str) -> str:
+    """Classe grosseira do User-Agent para as estatísticas de cliques (bot, mobile ou desktop)."""
+    ua = ua.lower()
+    if not ua or any(b in ua for b in ('bot', 'crawler', 'spider', 'facebookexternalhit', 'whatsapp', 'preview')):
+        return 'bot'
+    if any(m in ua for m in ('mobile', 'android', 'iphone', 'ipad')):
+        return 'mobile'
+    return 'desktop'
+
 async def handle_short_link_redirect(request):
     code = request.match_info.get('code')
     if not code or len(code) != 6:
         raise web.HTTPNotFound()
         
     try:
-        from database import get_long_url_by_code, get_config, increment_click
-        long_url = get_long_url_by_code(code)
+        long_url = await adb.get_long_url_by_code(code)
         
         if long_url:
             # Incrementar contador de cliques
-            increment_click(code)
+            await adb.increment_click(code, classify_user_agent(request.headers.get('User-Agent', '')))
             fb_pixel = get_config("fb_pixel_id")
             fb_token = get_config("fb_access_token")
             ga_id = get_config("google_analytics_id")
@@ -1980,10 +1987,11 @@ async def handle_short_link_redirect(request):
         return web.Response(text="Erro ao processar redirecionamento.", status=500)
 
 async def start_web_server():
-    if not get_config("console_token"): set_config("console_token", secrets.token_urlsafe(16))
+    if not get_config("console_token"): await adb.set_config("console_token", secrets.token_urlsafe(16))
     app = web.Application()
     app.router.add_get('/', handle_index)
     app.router.add_get('/api/status', handle_status_api)
+    app.router.add_get('/api/clicks', handle_clicks_api)
     app.router.add_post('/api/restart', handle_restart_api)
     app.router.add_route('*', '/api/canais', handle_canais_api)
     app.router.add_route('*', '/api/keywords', handle_keywords_api)
@@ -56,10 +56,37 @@ def format_whatsapp_text(html_text: str) -> str:
     
     return text.strip()
 
-def send_whatsapp_msg(text: str, media_path: str | None = None):
+def _separar_destinos(destination: str) -> list:
+    return [d.strip() for d in destination.split(",") if d.strip()]
+
+def whatsapp_destinos() -> list:
+    """Grupos/contatos que vão receber a próxima oferta (vazio se o WhatsApp estiver desligado)."""
+    from database import get_config
+    enabled = get_config("whatsapp_enabled").lower() == "true" or WHATSAPP_ENABLED
+    if not enabled:
+        return []
+    return _separar_destinos((get_config("whatsapp_destination") or WHATSAPP_DESTINATION or "").strip())
+
+async def publicar_whatsapp(text: str, media_path: str | None = None):
+    """
+    Envia a oferta para todos os destinos do WhatsApp no ritmo da Green-API: uma ficha do
+    rate_limiter por envio, e cada chamada (requests) numa thread para não travar o loop.
+    """
+    import asyncio
+    import rate_limiter
+    responses = []
+    for dest in whatsapp_destinos():
+        await rate_limiter.whatsapp()
+        resposta = await asyncio.to_thread(send_whatsapp_msg, text, media_path, [dest])
+        if resposta:
+            responses.extend(resposta)
+    return responses if responses else None
+
+def send_whatsapp_msg(text: str, media_path: str | None = None, destinos: list | None = None):
     """
     Envia uma mensagem para o WhatsApp via Green-API.
-    Suporta texto e imagem (via Upload).
+    Suporta texto e imagem (via Upload). Sem `destinos`, usa os configurados. O intervalo
+    entre os envios fica com quem chama (publicar_whatsapp usa o rate_limiter).
     """
     from database import get_config
     
@@ -87,20 +114,15 @@ def send_whatsapp_msg(text: str, media_path: str | None = None):
     if "greenapi.com" in host_clean and "green-api.com" not in host_clean:
         host_clean = host_clean.replace("greenapi.com", "green-api.com")
     
-    destinations = [d.strip() for d in destination.split(",") if d.strip()]
+    destinations = destinos if destinos is not None else _separar_destinos(destination)
     if not destinations:
         print("⚠️ Nenhuma conta de destino válida encontrada.")
         return None
 
-    import time
     responses = []
     common_headers = {'Accept': 'application/json'}
     
-    for idx, dest in enumerate(destinations):
-        if idx > 0:
-            print(f"⏳ Aguardando 1.5s antes de enviar para o próximo grupo ({idx+1}/{len(destinations)})...")
-            time.sleep(1.5)
-            
+    for dest in destinations:
         print(f"📡 Tentando enviar para WhatsApp ({dest}): Host={host_clean}, Instance={instance_id_clean}")
 
         try: